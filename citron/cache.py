@@ -0,0 +1,281 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides a cache of extraction results keyed by the content of
+the document, the model and the options used.
+
+The cache has an in-memory tier and an optional on-disk tier in a SQLite
+database, which can be shared by several worker processes.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from .logger import logger
+
+
+def get_key(text, model, options=None):
+    """
+    Get the cache key of a document.
+
+    Args:
+        text: The text (string) of the document.
+        model: A string identifying the model e.g. its timestamp.
+        options: A JSON serialisable object containing the options which affect
+            the results, or None.
+
+    Returns:
+        A string.
+    """
+
+    digest = hashlib.sha256()
+    digest.update(text.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(str(model).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache():
+    """
+    Class providing a two tier cache of JSON serialisable results.
+
+    The in-memory tier evicts the least recently used entries when it holds more
+    than max_entries entries or max_bytes bytes. The on-disk tier, when a path is
+    supplied, holds up to max_disk_entries entries. Entries older than ttl seconds
+    are treated as missing in both tiers.
+
+    Results are stored serialised, so callers may modify the results they get.
+
+    The lock guards only the in-memory tier. Each thread reads and writes the
+    on-disk tier with its own SQLite connection, outside the lock, so a slow or
+    busy database does not delay the in-memory hits of other threads.
+    """
+
+    DEFAULT_MAX_ENTRIES = 1000
+    PRUNE_INTERVAL = 100
+
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=None, ttl=None, path=None, max_disk_entries=100000):
+        """
+        Constructor.
+
+        Args:
+            max_entries: The maximum number of entries (int) held in memory.
+            max_bytes: The maximum size (int) in bytes of the entries held in memory, or None.
+            ttl: The time (float) in seconds for which entries are valid, or None.
+            path: The path (string) to a SQLite database file for the on-disk tier, or None.
+            max_disk_entries: The maximum number of entries (int) held on disk.
+        """
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+
+        if path is not None:
+            connection = self._get_connection()
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+            connection.commit()
+
+
+    def get(self, key):
+        """
+        Get a result.
+
+        Args:
+            key: The key (string) from get_key().
+
+        Returns:
+            The result, or None if it is not cached.
+        """
+
+        now = time.time()
+        value = None
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                created, value = entry
+
+                if self._is_valid(created, now):
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                else:
+                    self._remove(key)
+                    value = None
+
+        if value is not None:
+            return json.loads(value)
+
+        row = self._read(key) if self.path is not None else None
+
+        with self._lock:
+            if row is not None and self._is_valid(row[1], now):
+                self._add(key, row[0], row[1])
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                row = None
+
+        if row is not None:
+            return json.loads(row[0])
+
+        return None
+
+
+    def put(self, key, result):
+        """
+        Add a result.
+
+        Args:
+            key: The key (string) from get_key().
+            result: A JSON serialisable result.
+        """
+
+        value = json.dumps(result, separators=(",", ":"))
+        created = time.time()
+
+        with self._lock:
+            self._add(key, value, created)
+
+            if self.path is None:
+                return
+
+            self._writes += 1
+            prune = self._writes % self.PRUNE_INTERVAL == 0
+
+        self._write(key, value, created, prune)
+
+
+    def get_stats(self):
+        """
+        Get the numbers of hits and misses and the size of the in-memory tier.
+
+        Returns:
+            A JSON serialisable object.
+        """
+
+        lookups = self.memory_hits + self.disk_hits + self.misses
+
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups > 0 else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+
+    def clear(self):
+        """
+        Remove all the entries from both tiers.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+        if self.path is not None:
+            connection = self._get_connection()
+            connection.execute("DELETE FROM results")
+            connection.commit()
+
+
+    def _is_valid(self, created, now):
+        return self.ttl is None or now - created < self.ttl
+
+
+    def _add(self, key, value, created):
+        """
+        Add an entry to the in-memory tier, evicting entries as required. Requires the lock.
+        """
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (created, value)
+        self._bytes += len(value)
+
+        while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes and len(self._entries) > 1):
+            self._remove(next(iter(self._entries)))
+
+
+    def _remove(self, key):
+        created, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+
+    def _get_connection(self):
+        """
+        Get the SQLite connection of the current thread, opening it if required.
+        """
+
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            self._local.connection = connection
+
+        return connection
+
+
+    def _read(self, key):
+        try:
+            return self._get_connection().execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            logger.exception("Unable to read from the result cache: %s", self.path)
+            return None
+
+
+    def _write(self, key, value, created, prune=False):
+        try:
+            connection = self._get_connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)", (key, value, created)
+            )
+
+            if prune:
+                self._prune(connection)
+
+            connection.commit()
+
+        except sqlite3.Error:
+            logger.exception("Unable to write to the result cache: %s", self.path)
+
+
+    def _prune(self, connection):
+        """
+        Remove the expired entries and the oldest entries beyond the limit from the on-disk tier.
+        """
+
+        if self.ttl is not None:
+            connection.execute("DELETE FROM results WHERE created < ?", (time.time() - self.ttl,))
+
+        connection.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
@@ -0,0 +1,215 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides the capture of a sample of the documents sent to a
+server, with their options and arrival times, to size-capped rotating NDJSON
+files, so that real traffic can be replayed when measuring the effect of a
+change (see scripts/benchmark/replay.py).
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+from .logger import logger
+
+
+class RequestCapture():
+    """
+    Class which writes sampled documents to a file on a background thread. When
+    the file exceeds its share of max_bytes it is renamed with the suffix ".1",
+    shifting older files to ".2" and so on, and the oldest file is deleted, so
+    the files never hold much more than max_bytes in total. Documents which
+    arrive faster than they can be written are dropped rather than delaying
+    the requests.
+    """
+
+    DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+
+    def __init__(self, path, sample_rate=1.0, max_bytes=DEFAULT_MAX_BYTES, max_files=5, max_pending=1000):
+        """
+        Constructor.
+
+        Args:
+            path: The path (string) of the capture file.
+            sample_rate: The fraction (float) of requests captured.
+            max_bytes: The maximum total size (int) in bytes of the capture files.
+            max_files: The number of files (int) kept, including the current file.
+            max_pending: The maximum number of documents (int) waiting to be written.
+        """
+
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_file_bytes = max(1, max_bytes // max_files)
+        self.max_files = max_files
+        self.captured = 0
+        self.dropped = 0
+        self._queue = queue.Queue(max_pending)
+        self._generator = random.Random()
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="citron-capture", daemon=True)
+        self._thread.start()
+
+
+    def capture(self, documents, **options):
+        """
+        Capture the documents of a request, if the request is sampled.
+
+        Args:
+            documents: A list of dicts with a "text" key and optional "stages",
+                "deadline" and "model" keys. Other keys are not captured.
+            options: Options of the request recorded with each document e.g. its
+                endpoint, priority and model. The document's own options take
+                precedence.
+        """
+
+        with self._lock:
+            if self._generator.random() >= self.sample_rate:
+                return
+
+        now = time.time()
+
+        for document in documents:
+            if not isinstance(document, dict) or not isinstance(document.get("text"), str):
+                continue
+
+            record = {"time": now, "text": document["text"], "stages": None, "deadline": None, "model": None}
+            record.update(options)
+
+            for key in ("stages", "deadline", "model"):
+                if document.get(key) is not None:
+                    record[key] = document[key]
+
+            try:
+                self._queue.put_nowait(record)
+
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+
+
+    def get_stats(self):
+        """
+        Get the numbers of documents captured and dropped.
+
+        Returns:
+            A JSON serialisable object.
+        """
+
+        with self._lock:
+            return {"captured": self.captured, "dropped": self.dropped}
+
+
+    def close(self):
+        """
+        Write the pending documents and close the file.
+        """
+
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+
+    def _run(self):
+        """
+        Write documents to the file until closed.
+        """
+
+        while True:
+            record = self._queue.get()
+
+            if record is None:
+                return
+
+            try:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._file.flush()
+
+                with self._lock:
+                    self.captured += 1
+
+                if self._file.tell() >= self.max_file_bytes:
+                    self._rotate()
+
+            except (OSError, TypeError, ValueError):
+                logger.exception("Unable to capture a document")
+
+
+    def _rotate(self):
+        """
+        Start a new file, shifting the older files.
+        """
+
+        self._file.close()
+
+        for i in range(self.max_files - 1, 0, -1):
+            source = self.path if i == 1 else "{0}.{1}".format(self.path, i - 1)
+            target = "{0}.{1}".format(self.path, i)
+
+            if os.path.exists(source):
+                os.replace(source, target)
+
+        if self.max_files == 1:
+            os.remove(self.path)
+
+        self._file = open(self.path, "a", encoding="utf-8")
+
+
+def get_capture_files(path):
+    """
+    Get the files written by a RequestCapture object, oldest first.
+
+    Args:
+        path: The path (string) of the capture file.
+
+    Returns:
+        A list of file paths (strings).
+    """
+
+    rotated = []
+    i = 1
+
+    while os.path.exists("{0}.{1}".format(path, i)):
+        rotated.append("{0}.{1}".format(path, i))
+        i += 1
+
+    filenames = list(reversed(rotated))
+
+    if os.path.exists(path):
+        filenames.append(path)
+
+    return filenames
+
+
+def read_captures(path):
+    """
+    Read the documents captured by a RequestCapture object, oldest first.
+
+    Args:
+        path: The path (string) of the capture file.
+
+    Yields:
+        A dict with "time", "text", "stages", "deadline" and "model" keys and the
+        options of the request.
+    """
+
+    for filename in get_capture_files(path):
+        with open(filename, encoding="utf-8") as infile:
+            for line in infile:
+                if line.strip() == "":
+                    continue
+
+                try:
+                    yield json.loads(line)
+
+                except ValueError:
+                    # The last line of a file may be incomplete if the server stopped.
+                    logger.warning("Skipping an invalid line in: %s", filename)
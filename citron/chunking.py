@@ -0,0 +1,311 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides functions to limit the length of documents and to split
+long documents into overlapping chunks at paragraph boundaries, so that each
+chunk can be processed independently and the results merged.
+"""
+
+import re
+
+PARAGRAPH_PATTERN = re.compile(r"\S[^\n]*")
+SENTENCE_END_PATTERN = re.compile(r"[.!?][\"'”’)]*\s")
+WHITESPACE_PATTERN = re.compile(r"\s")
+
+
+class DocumentTooLongError(ValueError):
+    """
+    Raised when a document exceeds the configured character or token limit.
+    """
+
+    def __init__(self, message, limit, length):
+        super().__init__(message)
+        self.limit = limit
+        self.length = length
+
+
+def check_length(nlp, text, max_chars=None, max_tokens=None):
+    """
+    Check that a document is within the character and token limits. Tokens are
+    counted with the spaCy tokenizer alone, which is much cheaper than parsing.
+
+    Args:
+        nlp: A spaCy Language object.
+        text: The text (string).
+        max_chars: The maximum number of characters (int), or None for no limit.
+        max_tokens: The maximum number of tokens (int), or None for no limit.
+
+    Raises:
+        DocumentTooLongError: If the document exceeds a limit.
+    """
+
+    if max_chars is not None and len(text) > max_chars:
+        raise DocumentTooLongError(
+            "The text has {0} characters, the limit is {1}.".format(len(text), max_chars),
+            max_chars, len(text)
+        )
+
+    if max_tokens is not None:
+        length = len(nlp.make_doc(text))
+
+        if length > max_tokens:
+            raise DocumentTooLongError(
+                "The text has {0} tokens, the limit is {1}.".format(length, max_tokens),
+                max_tokens, length
+            )
+
+
+def get_paragraphs(text):
+    """
+    Get the character ranges of the paragraphs of a text. Each non-blank line
+    is a paragraph, starting at its first non-whitespace character.
+
+    Args:
+        text: The text (string).
+
+    Returns:
+        A list of (start, end) character offsets.
+    """
+
+    return [(match.start(), match.end()) for match in PARAGRAPH_PATTERN.finditer(text)]
+
+
+def split_paragraph(text, start, end, max_chars):
+    """
+    Split a paragraph which is longer than max_chars, preferably at the end of
+    a sentence, otherwise at whitespace.
+
+    Args:
+        text: The text (string).
+        start: The character offset (int) of the start of the paragraph.
+        end: The character offset (int) of the end of the paragraph.
+        max_chars: The maximum length (int) of each part.
+
+    Returns:
+        A list of (start, end) character offsets.
+    """
+
+    parts = []
+
+    while end - start > max_chars:
+        window = text[start : start + max_chars]
+        split = None
+
+        for match in SENTENCE_END_PATTERN.finditer(window):
+            split = match.end()
+
+        if split is None:
+            for match in WHITESPACE_PATTERN.finditer(window):
+                split = match.end()
+
+        if split is None or split == 0:
+            split = max_chars
+
+        part_end = start + len(window[:split].rstrip())
+        parts.append((start, max(part_end, start + 1)))
+        start += split
+
+        while start < end and text[start].isspace():
+            start += 1
+
+    if start < end:
+        parts.append((start, end))
+
+    return parts
+
+
+def get_chunks(text, max_chars, overlap_chars=0):
+    """
+    Split a text into chunks of whole paragraphs. Consecutive chunks share the
+    trailing paragraphs of the earlier chunk, up to overlap_chars, so that
+    quotes near a chunk boundary are seen with their context. Paragraphs longer
+    than max_chars are split.
+
+    Args:
+        text: The text (string).
+        max_chars: The maximum length (int) of each chunk.
+        overlap_chars: The maximum length (int) of the overlap between chunks.
+
+    Returns:
+        A list of (start, end) character offsets.
+    """
+
+    paragraphs = []
+
+    for start, end in get_paragraphs(text):
+        paragraphs.extend(split_paragraph(text, start, end, max_chars))
+
+    chunks = []
+    first = 0
+
+    while first < len(paragraphs):
+        last = first
+
+        while last + 1 < len(paragraphs) and paragraphs[last + 1][1] - paragraphs[first][0] <= max_chars:
+            last += 1
+
+        chunks.append((paragraphs[first][0], paragraphs[last][1]))
+
+        if last + 1 == len(paragraphs):
+            break
+
+        # Start the next chunk with the trailing paragraphs which fit in the
+        # overlap, leaving room for the next new paragraph.
+        next_first = last + 1
+
+        while (next_first - 1 > first
+                and paragraphs[last][1] - paragraphs[next_first - 1][0] <= overlap_chars
+                and paragraphs[last + 1][1] - paragraphs[next_first - 1][0] <= max_chars):
+            next_first -= 1
+
+        first = next_first
+
+    return chunks
+
+
+def get_boundaries(chunks):
+    """
+    Get the character range owned by each chunk. The overlap between two
+    consecutive chunks is divided at its midpoint, so that each item found in
+    an overlap is attributed to exactly one chunk.
+
+    Args:
+        chunks: A list of (start, end) character offsets from get_chunks().
+
+    Returns:
+        A list of (start, end) character offsets.
+    """
+
+    boundaries = []
+
+    for i, (start, end) in enumerate(chunks):
+        if i > 0 and chunks[i - 1][1] > start:
+            start = (start + chunks[i - 1][1]) // 2
+
+        if i + 1 < len(chunks) and chunks[i + 1][0] < end:
+            end = (chunks[i + 1][0] + end) // 2
+
+        boundaries.append((start, end))
+
+    return boundaries
+
+
+class ChunkAligner():
+    """
+    Class which maps the token indices of a chunk's Doc to the token indices of
+    the complete text, tokenized with the same spaCy tokenizer.
+    """
+
+    def __init__(self, doc):
+        """
+        Constructor.
+
+        Args:
+            doc: A spaCy Doc object for the complete text (from nlp.make_doc()).
+        """
+
+        self.doc = doc
+        self.token_starts = {}
+        self.token_ends = {}
+
+        for token in doc:
+            self.token_starts[token.idx] = token.i
+            self.token_ends[token.idx + len(token)] = token.i + 1
+
+
+    def get_token_range(self, start_char, end_char):
+        """
+        Get the token range of a character range of the complete text.
+
+        Args:
+            start_char: The character offset (int) of the start.
+            end_char: The character offset (int) of the end.
+
+        Returns:
+            A (start, end) tuple of token indices.
+        """
+
+        start = self.token_starts.get(start_char)
+        end = self.token_ends.get(end_char)
+
+        if start is None or end is None:
+            span = self.doc.char_span(start_char, end_char, alignment_mode="expand")
+            return span.start, span.end
+
+        return start, end
+
+
+    def remap_span(self, span_json, chunk_doc, offset):
+        """
+        Remap a span of a chunk to the complete text.
+
+        Args:
+            span_json: A JSON serialisable span with "start", "end" and "text" keys.
+            chunk_doc: The spaCy Doc object of the chunk.
+            offset: The character offset (int) of the chunk in the complete text.
+
+        Returns:
+            A JSON serialisable span.
+        """
+
+        span = chunk_doc[span_json["start"] : span_json["end"]]
+        start, end = self.get_token_range(offset + span.start_char, offset + span.end_char)
+        return {"start": start, "end": end, "text": span_json["text"]}
+
+
+    def remap_quote(self, quote_json, chunk_doc, offset):
+        """
+        Remap the spans of a quote found in a chunk to the complete text.
+
+        Args:
+            quote_json: A JSON serialisable quote from citron.data.Quote.to_json().
+            chunk_doc: The spaCy Doc object of the chunk.
+            offset: The character offset (int) of the chunk in the complete text.
+
+        Returns:
+            A JSON serialisable quote.
+        """
+
+        remapped = dict(quote_json)
+        remapped["cue"] = self.remap_span(quote_json["cue"], chunk_doc, offset)
+
+        for key in ("sources", "coreferences", "contents"):
+            remapped[key] = [self.remap_span(span, chunk_doc, offset) for span in quote_json[key]]
+
+        return remapped
+
+
+def merge_quotes(candidates):
+    """
+    Merge the quotes found in overlapping chunks, removing duplicates. Quotes are
+    duplicates when their cues overlap, in which case the quote from the chunk
+    which owns the cue is kept.
+
+    Args:
+        candidates: A list of (quote_json, is_owned) tuples with spans remapped
+            to the complete text.
+
+    Returns:
+        A list of JSON serialisable quotes in document order.
+    """
+
+    candidates = sorted(candidates, key=lambda candidate: not candidate[1])
+    accepted = []
+
+    for quote_json, _ in candidates:
+        cue = quote_json["cue"]
+        is_duplicate = False
+
+        for other in accepted:
+            if cue["start"] < other["cue"]["end"] and other["cue"]["start"] < cue["end"]:
+                is_duplicate = True
+                break
+
+        if not is_duplicate:
+            accepted.append(quote_json)
+
+    accepted.sort(key=lambda quote_json: quote_json["cue"]["start"])
+    return accepted
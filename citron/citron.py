@@ -8,33 +8,192 @@ This module provides the primary functions of the Citron quote extraction
 and attribution system and a web server supporting a REST API.
 """
 
+import time
+
 from .data import Quote
 from .cue import CueClassifier
 from .content import ContentClassifier
 from .content import ContentResolver
 from .source import SourceResolver
 from .source import SourceClassifier
-from .coreference import CoreferenceResolver, split_on_rightmost_prefix
+from .coreference import CoreferenceResolver, needs_coreference, split_on_rightmost_prefix
 from .gender import ForenameGenderClassifier
+from .instrumentation import DocumentProfile, NULL_PROFILE
+from .deadline import Deadline, StageEstimates
+from . import cache
+from . import chunking
+from . import revision
 from . import utils
 from . import metrics
+from . import profiles
 from .logger import logger
 
 APPLICATION_NAME = "citron-extractor"
 DESIRED_LABELS = {"GPE", "PERSON", "NORP", "ORG"}
 
+# Separates the names seen so far when testing containment. It does not occur in
+# entity text.
+NAME_SEPARATOR = "\x00"
+
+STAGES = ("cues", "contents", "sources", "coreference", "entities")
+
+# The stage each stage relies upon.
+STAGE_DEPENDENCIES = {
+    "contents": "cues",
+    "sources": "contents",
+    "coreference": "sources",
+}
+
+
+def get_stages(stages=None):
+    """
+    Get the complete set of stages to run, including the stages that the
+    requested stages rely upon.
+    
+    Args:
+        stages: An iterable of stage names, a comma separated string of stage
+            names, or None for all stages.
+    
+    Returns:
+        A frozenset of stage names (strings).
+    
+    Raises:
+        ValueError: If a stage name is not recognised.
+    """
+    
+    if stages is None:
+        return frozenset(STAGES)
+    
+    if isinstance(stages, str):
+        stages = [stage.strip() for stage in stages.split(",") if stage.strip() != ""]
+    
+    complete = set()
+    
+    for stage in stages:
+        if stage not in STAGES:
+            raise ValueError("Unknown stage: {0}. Valid stages are: {1}".format(stage, ", ".join(STAGES)))
+        
+        while stage is not None:
+            complete.add(stage)
+            stage = STAGE_DEPENDENCIES.get(stage)
+    
+    return frozenset(complete)
+
+
+def set_results_stages(results, stages):
+    """
+    Record the stages run in a set of results, when not all stages were run.
+    
+    Args:
+        results: The results (dict) of an extraction.
+        stages: A frozenset of stage names (strings).
+    """
+    
+    if stages != frozenset(STAGES):
+        results["stages"] = sorted(stages)
+
+
+def get_results_stages(results):
+    """
+    Get the stages which were run to produce a set of results.
+    
+    Args:
+        results: The results (dict) of an extraction.
+    
+    Returns:
+        A frozenset of stage names (strings).
+    """
+    
+    return frozenset(results.get("stages", STAGES))
+
+
+def select_entities(entities):
+    """
+    Select the people, organisations and places from a sequence of named entities. 
+    Names which are contained in a name found earlier are omitted.
+    
+    Args:
+        entities: An iterable of (label, text, start) tuples in document order, 
+            where start is the index of the first token.
+    
+    Returns:
+        A JSON serialisable list of entities.
+    """
+    
+    seen = set()
+    # The names seen so far, joined so that containment in any of them is a
+    # single substring search rather than a scan of the names.
+    seen_text = ""
+    results = []
+    
+    for label, entityName, start in entities:
+        if label in DESIRED_LABELS and entityName not in seen:
+            # If this is a substring, skip it
+            if NAME_SEPARATOR in entityName:
+                should_add = not any(entityName in text for text in seen)
+            else:
+                should_add = len(seen) == 0 or entityName not in seen_text
+            
+            seen.add(entityName)
+            seen_text += NAME_SEPARATOR + entityName
+
+            if should_add:
+                result_entity = { 
+                        "Label": label,
+                        "Text": entityName,
+                        "Start": start,
+                        }   
+                results.append(result_entity)
+
+    return results
+
+
+def is_containing_name_found(entities, dropped_entities):
+    """
+    Check whether each entity which was not carried over from a previous revision
+    is contained in a name found before the given token (see
+    citron.revision.Revision.reuse_entities), so that the names it omitted stay
+    omitted.
+    
+    Args:
+        entities: A list of (label, text, start) tuples of the new revision.
+        dropped_entities: A list of (text, token) tuples.
+    
+    Returns:
+        A boolean.
+    """
+    
+    for text, token in dropped_entities:
+        if token is None:
+            continue
+        
+        if not any(label in DESIRED_LABELS and text in name and start < token for label, name, start in entities):
+            return False
+    
+    return True
+
+
 class Citron():
     """
     Class providing methods to extract quotes from documents.
+    
+    A Citron object may be shared by several threads, so that documents can be 
+    processed in parallel wherever spaCy, torch and the classifiers release the 
+    GIL. Each thread has its own CRFsuite taggers and the state of each document 
+    is held by the call which processes it, or in the user data of its spaCy Doc. 
+    The registry and cache are thread-safe. Hooks may be called from several 
+    threads at once.
     """
 
-    def __init__(self, model_path, nlp=None):
+    def __init__(self, model_path, nlp=None, registry=None, cache=None):
         """
         Constructor.
 
         Args:
             model_path: The path (string) to the Citron model directory.
             nlp: A spaCy Language object, or None.
+            registry: A citron.registry.SpeakerRegistry object shared across documents, or None.
+            cache: A citron.cache.ResultCache object used by extract(), or None.
         """
         if nlp is None:
             self.nlp = utils.get_parser()
@@ -42,6 +201,7 @@ class Citron():
             self.nlp = nlp
 
         logger.info("Loading Citron model: %s", model_path)
+        profiles.check_parser_info(self.nlp, model_path)
         self.cue_classifier = CueClassifier(model_path)
         self.content_classifier = ContentClassifier(model_path)
         self.source_classifier = SourceClassifier(model_path)
@@ -49,135 +209,580 @@ class Citron():
         self.source_resolver = SourceResolver(model_path)
         self.coreference_resolver = CoreferenceResolver(model_path)
         self.gender_resolver = ForenameGenderClassifier()
+        self.registry = registry
+        self.cache = cache
+        self.hooks = []
+        self.estimates = StageEstimates()
 
         self.source = {
             "application": APPLICATION_NAME,
             "model:": self.cue_classifier.model["timestamp"] 
         }
+    
+    
+    def add_hook(self, hook):
+        """
+        Add a function which is called with the timings and counts of each 
+        document processed by extract(). Instrumentation is only enabled while 
+        hooks are registered or when requested by extract().
+        
+        Args:
+            hook: A function taking one argument, the JSON serialisable object 
+                returned by citron.instrumentation.DocumentProfile.to_json().
+        """
+        
+        self.hooks.append(hook)
+    
+    
+    def remove_hook(self, hook):
+        """
+        Remove a function added with add_hook().
+        
+        Args:
+            hook: The function.
+        """
+        
+        self.hooks.remove(hook)
 
 
-    def extract(self, text, resolve_coreferences=True):
+    def extract(self, text, resolve_coreferences=True, include_entities=True, stages=None, include_stats=False, deadline=None,
+                check_cache=True):
         """
         Extract quotes from the supplied text.
         
+        When the Citron object has a cache, results are cached by the text, model 
+        and options. The cache is not used when stats are requested.
+        
+        When a deadline is supplied, coreference resolution and entity extraction 
+        are skipped if they are not expected to finish in time. The results then 
+        have a "partial" key set to true and a "skipped_stages" key listing the 
+        stages skipped. Partial results are not cached.
+        
         Args:
             text: The text (string)
             resolve_coreferences: A boolean flag indicating whether to resolve coreferences.
+            include_entities: A boolean flag indicating whether to extract named entities.
+            stages: The stages to run (see get_stages), or None to run all stages.
+            include_stats: A boolean flag indicating whether to include the timings
+                and counts of each stage in the results.
+            deadline: A citron.deadline.Deadline object, or None.
+            check_cache: A boolean flag indicating whether to look the results up in
+                the cache, e.g. False when the caller has already done so. The
+                results are added to the cache either way.
             
         Returns:
             A JSON serialisable object containing the extracted quotes.
+        
+        Raises:
+            citron.deadline.ExtractionCancelledError: If the deadline is cancelled.
         """
         
-        doc = self.nlp(text)
+        stages = self._get_extract_stages(stages, resolve_coreferences, include_entities)
         
-        quotes = self.get_quotes(doc, resolve_coreferences)
-        quotes_json = []
+        if deadline is None:
+            deadline = Deadline()
+        cache_key = None
         
-        for quote in quotes:
-            quotes_json.append(quote.to_json())
-
-        entities = self.get_entities(doc)
+        if self.cache is not None and not include_stats:
+            cache_key = self._get_cache_key(text, stages)
+            results = self.cache.get(cache_key) if check_cache else None
+            
+            if results is not None:
+                return results
         
-        return { 
-            "quotes": quotes_json, 
+        profile = self._get_profile(include_stats)
+        results = { 
+            "quotes": [], 
             "source": self.source,
-            "entities": entities,
-         }
+        }
+        
+        if len(stages) > 0:
+            deadline.check()
+            
+            if profile.enabled:
+                doc, timings = utils.parse_with_timings(self.nlp, text)
+                profile.add_components(timings)
+            else:
+                doc = self.nlp(text)
+            
+            profile.lap("spacy")
+            quotes = self.get_quotes(doc, stages=stages, profile=profile, deadline=deadline)
+            quotes_json = []
+            
+            for quote in quotes:
+                quotes_json.append(quote.to_json())
+            
+            results["quotes"] = quotes_json
+            profile.lap("serialisation")
+            
+            if "entities" in stages and deadline.allows("entities"):
+                results["entities"] = self.get_entities(doc)
+                profile.lap("entities")
+        
+        set_results_stages(results, stages)
+        
+        if deadline.is_partial():
+            results["partial"] = True
+            results["skipped_stages"] = list(deadline.skipped)
+        
+        elif cache_key is not None:
+            self.cache.put(cache_key, results)
+        
+        self._finish_profile(profile, results, include_stats)
+        return results
     
-    def get_entities(self, doc):
-        seen = {}
-        results = []
-        for ee in doc.ents:
-            entityName = ee.text.strip()
-            if ee.label_ in DESIRED_LABELS and entityName not in seen:
-                should_add = True
-                for text in seen.keys():
-                    # If this is a substring, skip it
-                    if entityName in text:
-                        should_add = False
-                        break
-                seen[entityName] = True
-
-                if should_add:
-                    result_entity = { 
-                            "Label": ee.label_,
-                            "Text": entityName,
-                            "Start": ee.start,
-                            }   
-                    results.append(result_entity)
-
+    
+    def extract_chunked(self, text, max_chars, overlap_chars=0, resolve_coreferences=True, include_entities=True, stages=None, include_stats=False):
+        """
+        Extract quotes from a long text by splitting it at paragraph boundaries 
+        into overlapping chunks which are processed independently. Spans in the 
+        results refer to the tokens of the complete text. Quotes found in the 
+        overlaps are only included once.
+        
+        Coreferences are only resolved within each chunk, so pronouns may remain 
+        unresolved where the speaker was named in an earlier chunk. A speaker 
+        registry reduces this.
+        
+        Args:
+            text: The text (string)
+            max_chars: The maximum length (int) of each chunk in characters.
+            overlap_chars: The maximum length (int) of the overlap between chunks.
+            resolve_coreferences: A boolean flag indicating whether to resolve coreferences.
+            include_entities: A boolean flag indicating whether to extract named entities.
+            stages: The stages to run (see get_stages), or None to run all stages.
+            include_stats: A boolean flag indicating whether to include the timings
+                and counts of each stage in the results.
+        
+        Returns:
+            A JSON serialisable object containing the extracted quotes.
+        """
+        
+        profile = self._get_profile(include_stats)
+        stages = self._get_extract_stages(stages, resolve_coreferences, include_entities)
+        
+        results = { 
+            "quotes": [], 
+            "source": self.source,
+        }
+        
+        if len(stages) > 0:
+            aligner = chunking.ChunkAligner(self.nlp.make_doc(text))
+            chunks = chunking.get_chunks(text, max_chars, overlap_chars)
+            boundaries = chunking.get_boundaries(chunks)
+            candidates = []
+            entities = []
+            profile.count("chunks", len(chunks))
+            profile.lap("chunking")
+            
+            for (start, end), (owned_start, owned_end) in zip(chunks, boundaries):
+                if profile.enabled:
+                    doc, timings = utils.parse_with_timings(self.nlp, text[start : end])
+                    profile.add_components(timings)
+                else:
+                    doc = self.nlp(text[start : end])
+                
+                profile.lap("spacy")
+                quotes = self.get_quotes(doc, stages=stages, profile=profile)
+                
+                for quote in quotes:
+                    quote_json = aligner.remap_quote(quote.to_json(), doc, start)
+                    is_owned = owned_start <= start + quote.cue.start_char < owned_end
+                    candidates.append((quote_json, is_owned))
+                
+                profile.lap("serialisation")
+                
+                if "entities" in stages:
+                    for ee in doc.ents:
+                        if owned_start <= start + ee.start_char < owned_end:
+                            entity_start = aligner.get_token_range(start + ee.start_char, start + ee.end_char)[0]
+                            entities.append((ee.label_, ee.text.strip(), entity_start))
+                    
+                    profile.lap("entities")
+            
+            results["quotes"] = chunking.merge_quotes(candidates)
+            profile.lap("serialisation")
+            
+            if "entities" in stages:
+                results["entities"] = select_entities(entities)
+                profile.lap("entities")
+        
+        set_results_stages(results, stages)
+        self._finish_profile(profile, results, include_stats)
+        return results
+    
+    
+    def extract_revision(self, text, previous_text, previous_results, context_paragraphs=1, max_changed_fraction=0.5, 
+                         resolve_coreferences=True, include_entities=True, stages=None, include_stats=False, deadline=None,
+                         counts=None):
+        """
+        Extract quotes from a new revision of a document, reusing the results of 
+        the previous revision. The revisions are compared paragraph by paragraph 
+        and only the changed paragraphs and their neighbours are processed. Quotes 
+        and entities within the other paragraphs are carried over with their spans 
+        moved to the tokens of the new revision.
+        
+        The previous results must have been produced with the same model and 
+        stages, and must not be partial. Otherwise, or when most paragraphs have 
+        changed, the new revision is processed in full.
+        
+        The new revision is also processed in full when the results may differ 
+        from those of processing it in full: when a processed quote has a source 
+        which needs coreference, as its antecedent may be outside the processed 
+        paragraphs, or when the names omitted from the previous entities might 
+        no longer be contained in a name found earlier (see select_entities).
+        
+        When the Citron object has a cache, results which are not partial are 
+        cached as for extract().
+        
+        Args:
+            text: The text (string) of the new revision.
+            previous_text: The text (string) of the previous revision, or a
+                citron.revision.PreviousRevision object for the previous results.
+            previous_results: The results of extract() for the previous revision.
+            context_paragraphs: The number (int) of neighbouring paragraphs processed 
+                with each changed paragraph.
+            max_changed_fraction: The fraction (float) of paragraphs which may be 
+                processed before the whole revision is processed instead.
+            resolve_coreferences: A boolean flag indicating whether to resolve coreferences.
+            include_entities: A boolean flag indicating whether to extract named entities.
+            stages: The stages to run (see get_stages), or None to run all stages.
+            include_stats: A boolean flag indicating whether to include the timings
+                and counts of each stage in the results.
+            deadline: A citron.deadline.Deadline object, or None (see extract).
+            counts: A dict to which the numbers of "paragraphs" and 
+                "paragraphs_reprocessed" are added when the previous results are 
+                reused, or None.
+        
+        Returns:
+            A JSON serialisable object containing the extracted quotes.
+        
+        Raises:
+            citron.deadline.ExtractionCancelledError: If the deadline is cancelled.
+        """
+        
+        stages = self._get_extract_stages(stages, resolve_coreferences, include_entities)
+        
+        if (previous_results is None
+                or previous_results.get("source") != self.source
+                or previous_results.get("partial", False)
+                or get_results_stages(previous_results) != stages
+                or ("entities" in stages) != ("entities" in previous_results)):
+            return self.extract(text, stages=stages, include_stats=include_stats, deadline=deadline)
+        
+        if deadline is None:
+            deadline = Deadline()
+        
+        deadline.check()
+        
+        if isinstance(previous_text, str):
+            previous = revision.PreviousRevision(self.nlp, previous_text, previous_results)
+        else:
+            previous = previous_text
+        
+        changes = revision.Revision(self.nlp, previous, text, context_paragraphs)
+        quotes_json = changes.reuse_quotes(previous_results["quotes"], coreference="coreference" in stages)
+        
+        if len(changes.affected) > max_changed_fraction * len(changes.paragraphs):
+            return self.extract(text, stages=stages, include_stats=include_stats, deadline=deadline)
+        
+        profile = self._get_profile(include_stats)
+        results = { 
+            "quotes": [], 
+            "source": self.source,
+        }
+        
+        entities, dropped_entities = changes.reuse_entities(previous_results.get("entities", []))
+        aligner = changes.aligner
+        profile.count("paragraphs", len(changes.paragraphs))
+        profile.count("paragraphs_reprocessed", len(changes.affected))
+        profile.count("quotes_reused", len(quotes_json))
+        profile.lap("revision")
+        
+        for start, end in changes.get_regions():
+            deadline.check()
+            
+            if profile.enabled:
+                doc, timings = utils.parse_with_timings(self.nlp, text[start : end])
+                profile.add_components(timings)
+            else:
+                doc = self.nlp(text[start : end])
+            
+            profile.lap("spacy")
+            quotes = self.get_quotes(doc, stages=stages, profile=profile, deadline=deadline)
+            
+            # The antecedents before the region were not seen.
+            if "coreference" in stages and start > changes.paragraphs[0][0]:
+                if any(needs_coreference(source) for quote in quotes for source in quote.sources):
+                    return self.extract(text, stages=stages, include_stats=include_stats, deadline=deadline)
+            
+            for quote in quotes:
+                quotes_json.append(aligner.remap_quote(quote.to_json(), doc, start))
+            
+            profile.lap("serialisation")
+            
+            if "entities" in stages:
+                for ee in doc.ents:
+                    entity_start = aligner.get_token_range(start + ee.start_char, start + ee.end_char)[0]
+                    entities.append((ee.label_, ee.text.strip(), entity_start))
+                
+                profile.lap("entities")
+        
+        if "entities" in stages and not is_containing_name_found(entities, dropped_entities):
+            return self.extract(text, stages=stages, include_stats=include_stats, deadline=deadline)
+        
+        if counts is not None:
+            counts["paragraphs"] = len(changes.paragraphs)
+            counts["paragraphs_reprocessed"] = len(changes.affected)
+        
+        results["quotes"] = sorted(quotes_json, key=lambda quote_json: quote_json["cue"]["start"])
+        
+        if "entities" in stages and deadline.allows("entities"):
+            entities.sort(key=lambda entity: entity[2])
+            results["entities"] = select_entities(entities)
+            profile.lap("entities")
+        
+        set_results_stages(results, stages)
+        
+        if deadline.is_partial():
+            results["partial"] = True
+            results["skipped_stages"] = list(deadline.skipped)
+        
+        elif self.cache is not None and not include_stats:
+            self.cache.put(self._get_cache_key(text, stages), results)
+        
+        self._finish_profile(profile, results, include_stats)
         return results
     
-    def get_quotes(self, doc, resolve_coreferences=True):
+    
+    def _get_profile(self, include_stats):
+        """
+        Get a profile for a document, which records nothing unless stats or hooks require it.
+        """
+        
+        if include_stats or len(self.hooks) > 0:
+            return DocumentProfile()
+        else:
+            return NULL_PROFILE
+    
+    
+    def get_cached_results(self, text, stages=None):
+        """
+        Get the results of a text from the cache, without processing it.
+        
+        Args:
+            text: The text (string)
+            stages: The stages to run (see get_stages), or None to run all stages.
+        
+        Returns:
+            The results, or None if there is no cache or the results are not cached.
+        """
+        
+        if self.cache is None:
+            return None
+        
+        return self.cache.get(self._get_cache_key(text, get_stages(stages)))
+    
+    
+    def _get_cache_key(self, text, stages):
+        return cache.get_key(text, self.cue_classifier.model["timestamp"], {"stages": sorted(stages)})
+    
+    
+    def _get_extract_stages(self, stages, resolve_coreferences, include_entities):
+        """
+        Get the stages to run for the arguments of extract().
+        """
+        
+        stages = get_stages(stages)
+        
+        if not resolve_coreferences:
+            stages = stages - {"coreference"}
+        
+        if not include_entities:
+            stages = stages - {"entities"}
+        
+        return stages
+    
+    
+    def _finish_profile(self, profile, results, include_stats):
+        """
+        Pass the stats of a document to the hooks and add them to the results if requested.
+        """
+        
+        if profile.enabled:
+            stats = profile.to_json()
+            
+            for hook in self.hooks:
+                try:
+                    hook(stats)
+                except Exception:
+                    logger.exception("Instrumentation hook failed")
+            
+            if include_stats:
+                results["stats"] = stats
+    
+    def get_entities(self, doc):
+        """
+        Get the people, organisations and places named in a document. Names which
+        are contained in a name found earlier in the document are omitted.
+        
+        Args:
+            doc: A spaCy Doc object.
+        
+        Returns:
+            A JSON serialisable list of entities.
+        """
+        
+        entities = ((ee.label_, ee.text.strip(), ee.start) for ee in doc.ents)
+        return select_entities(entities)
+    
+    def get_quotes(self, doc, resolve_coreferences=True, stages=None, profile=NULL_PROFILE, registry=None, deadline=None):
         """
         Extract quotes from a spaCy Doc.
         
+        Quotes only have contents when the "contents" stage is run and only have 
+        sources when the "sources" stage is run.
+        
         Args:
             doc: A spaCy Doc object.
             resolve_coreferences: A boolean flag indicating whether to resolve coreferences.
+            stages: The stages to run (see get_stages), or None to run all stages.
+            profile: A citron.instrumentation.DocumentProfile object which records 
+                the timings and counts of each stage.
+            registry: A citron.registry.SpeakerRegistry object which overrides the 
+                Citron object's registry, or None.
+            deadline: A citron.deadline.Deadline object, checked between stages. 
+                Coreference resolution is skipped, and recorded by the deadline, 
+                when it is not expected to finish in time.
         
         Returns:
             A list of citron.data.Quote objects.
+        
+        Raises:
+            citron.deadline.ExtractionCancelledError: If the deadline is cancelled.
         """
+        stages = get_stages(stages)
+        
+        if deadline is None:
+            deadline = Deadline()
+        
+        if not resolve_coreferences:
+            stages = stages - {"coreference"}
+        
+        if registry is None:
+            registry = self.registry
+        
+        if profile.enabled:
+            profile.count("tokens", len(doc))
+            profile.count("sentences", sum(1 for _ in doc.sents))
+            profile.skip()
+        
+        if "cues" not in stages:
+            return []
+        
         # First find quote-cues.
         cue_spans, cue_labels = self.cue_classifier.predict_cues_and_labels(doc)
+        profile.lap("cue_classifier")
+        profile.count("cues", len(cue_spans))
         
         if len(cue_spans) == 0:
             return []
         
+        if "contents" not in stages:
+            return [Quote(cue, [], []) for cue in cue_spans]
+        
         # Identify source and content spans.
+        deadline.check()
         content_spans, content_labels = self.content_classifier.predict_contents_and_labels(doc, cue_labels)
-        source_spans = self.source_classifier.predict_sources_and_labels(doc, cue_labels, content_labels)[0]
+        profile.lap("content_classifier")
+        profile.count("contents", len(content_spans))
         
         if len(content_spans) == 0:
             return []
         
-        if len(source_spans) == 0:
-            return []
-        
-        cleaned_sources = [split_on_rightmost_prefix(source)[1] for source in source_spans]
+        if "sources" in stages:
+            deadline.check()
+            source_spans = self.source_classifier.predict_sources_and_labels(doc, cue_labels, content_labels)[0]
+            profile.lap("source_classifier")
+            profile.count("sources", len(source_spans))
+            
+            if len(source_spans) == 0:
+                return []
+            
+            cleaned_sources = [split_on_rightmost_prefix(source)[1] for source in source_spans]
         
         # Identify the quote-cue associated with each source and content span.
         cue_to_contents_map = self.content_resolver.resolve_contents(content_spans, cue_spans)
-        sentence_section_labels =  utils.get_sentence_section_labels(doc)
-        cue_to_sources_map  = self.source_resolver.resolve_sources(cleaned_sources, cue_spans, sentence_section_labels)
+        profile.lap("content_resolver")
+        profile.count("candidate_pairs", len(content_spans) * len(cue_spans))
+        
+        if "sources" in stages:
+            sentence_section_labels =  utils.get_sentence_section_labels(doc)
+            cue_to_sources_map  = self.source_resolver.resolve_sources(cleaned_sources, cue_spans, sentence_section_labels)
+            profile.lap("source_resolver")
+            
+            if profile.enabled:
+                for cue in cue_spans:
+                    profile.count("candidate_pairs", len(utils.get_spans_within_span(cleaned_sources, cue.sent)))
+                profile.skip()
         
         # Join source and content spans which share the same quote-cue.
         quotes = []
         for cue in cue_spans:
             key = (cue.start, cue.end)
             
-            if key in cue_to_contents_map and key in cue_to_sources_map:
-                contents = cue_to_contents_map[key]
-                source = cue_to_sources_map[key]
-                _, suffix = split_on_rightmost_prefix(source)
-                
-                confidence = source._.probability
-                
-                has_direct_quote = False
-                for content in contents:
-                    has_direct_quote = has_direct_quote or utils.has_quoted_text(content)
-                    confidence = confidence * content._.probability
-                if not has_direct_quote:
-                    logger.debug("Skipping quote without direct speech: %s", contents)
+            if key not in cue_to_contents_map:
+                continue
+            
+            contents = [content for content, _ in cue_to_contents_map[key]]
+            
+            if "sources" in stages:
+                if key not in cue_to_sources_map:
                     continue
                 
-                quote = Quote(cue, [suffix], contents, confidence=confidence)
-                quotes.append(quote)
+                source, confidence = cue_to_sources_map[key]
+                _, suffix = split_on_rightmost_prefix(source)
+                sources = [suffix]
+            
+            else:
+                sources = []
+                confidence = 1.0
+            
+            has_direct_quote = False
+            for content, probability in cue_to_contents_map[key]:
+                has_direct_quote = has_direct_quote or utils.has_quoted_text(content)
+                confidence = confidence * probability
+            if not has_direct_quote:
+                logger.debug("Skipping quote without direct speech: %s", contents)
+                continue
+            
+            quote = Quote(cue, sources, contents, confidence=confidence)
+            quotes.append(quote)
         
-        if resolve_coreferences and len(quotes) > 0:
-            self.coreference_resolver.resolve_document(doc, self.gender_resolver, quotes, cleaned_sources, content_spans, content_labels)
+        profile.lap("quote_assembly")
+        profile.count("quotes", len(quotes))
+        
+        if "coreference" in stages and len(quotes) > 0 and deadline.allows("coreference", self.estimates.get("coreference", len(doc))):
+            start = time.perf_counter()
+            coreference_table = self.coreference_resolver.resolve_document(doc, self.gender_resolver, quotes, cleaned_sources, content_spans, content_labels, registry)
+            self.estimates.update("coreference", len(doc), time.perf_counter() - start)
+            profile.lap("coreference_resolver")
+            profile.count("candidate_pairs", coreference_table.candidates_scored)
+            profile.count("pronouns_resolved", coreference_table.pronouns_resolved)
         
         return quotes
     
     
-    def evaluate(self, test_path):
+    def evaluate(self, test_path, verbose=True):
         """
         Evaluate Citron using the supplied test data.
         
         Args:
             test_path: The path (string) to a file or directory of Citron format JSON data files.
                 Directories will be explored recursively.
+            verbose: A boolean flag indicating whether to print the scores.
+        
+        Returns:
+            A dict of scores (see citron.metrics.evaluate).
         """
         
-        metrics.evaluate(self, test_path)
\ No newline at end of file
+        return metrics.evaluate(self, test_path, verbose)
\ No newline at end of file
@@ -19,6 +19,7 @@ import pycrfsuite
 from .data import DataSource 
 from . import utils
 from . import metrics
+from . import profiles
 from .logger import logger
 
 
@@ -48,8 +49,7 @@ class ContentClassifier():
         
         filename = os.path.join(model_path, self.MODEL_FILENAME)
         logger.debug("Loading Content Classifier model: %s", filename)
-        self._tagger = pycrfsuite.Tagger()
-        self._tagger.open(filename)
+        self._tagger = utils.TaggerPool(filename)
     
     
     def predict_contents_and_labels(self, doc, cue_labels):
@@ -164,6 +164,8 @@ class ContentClassifier():
         if not os.path.exists(model_path):
             os.makedirs(model_path)
         
+        profiles.save_parser_info(nlp, model_path)
+        
         trainer = pycrfsuite.Trainer(verbose=False)
         
         for doc, quotes, _ in DataSource(nlp, train_path):
@@ -331,8 +333,8 @@ class ContentResolver():
             cues: A list of cue spans.
         
         Returns:
-            A dict mapping each cue to a list of content spans. The cue is represented by a 
-            tuple containing the start and end index.
+            A dict mapping each cue to a list of (content span, probability) tuples. The 
+            cue is represented by a tuple containing the start and end index.
         """
         
         quote_cue_to_contents_map = defaultdict(list)
@@ -342,8 +344,7 @@ class ContentResolver():
             
             if predicted_cue is not None:
                 key = (predicted_cue.start, predicted_cue.end)
-                content._.probability = probability
-                quote_cue_to_contents_map[key].append(content)
+                quote_cue_to_contents_map[key].append((content, probability))
         
         return quote_cue_to_contents_map
     
@@ -436,6 +437,8 @@ class ContentResolver():
         if not os.path.exists(model_path):
             os.makedirs(model_path)
         
+        profiles.save_parser_info(nlp, model_path)
+        
         features, labels = ContentResolver._get_features_and_labels(nlp, train_path)
         
         logger.info("Vectorising training data")
@@ -22,6 +22,7 @@ from nltk import corpus
 from .data import DataSource
 from . import utils
 from . import metrics
+from . import profiles
 from .logger import logger
 from . import gender
 
@@ -383,6 +384,102 @@ def is_pronoun(span):
     return len(span) == 1 and span[0].pos_ == "PRON"
 
 
+def is_short_name(span):
+    """
+    Check whether the span could be a shortened reference to a longer name 
+    e.g. "Smith" or "Mr Smith".
+    
+    Args:
+        span: A spaCy Span object.
+    
+    Returns:
+        A boolean value.
+    """
+    
+    if len(span) == 1:
+        return True
+    
+    prefix, _ = split_on_longest_prefix(span)
+    return prefix is not None
+
+
+def is_full_person_name(span):
+    """
+    Check whether the span is exactly a PERSON entity of two or more tokens
+    without a prefix e.g. "John Smith".
+    
+    Args:
+        span: A spaCy Span object.
+    
+    Returns:
+        A boolean value.
+    """
+    
+    if len(span) < 2 or is_short_name(span):
+        return False
+    
+    if span[0].ent_iob_ != "B" or any(token.ent_type_ != "PERSON" for token in span):
+        return False
+    
+    if any(token.ent_iob_ != "I" for token in span[1:]):
+        return False
+    
+    return span.end == len(span.doc) or span.doc[span.end].ent_iob_ != "I"
+
+
+def needs_coreference(span):
+    """
+    Check whether a source span may have a coreference elsewhere in the document.
+    Full person names are assumed to be their own primary coreference. Other
+    sources, such as pronouns, short names and descriptions like "a BBC 
+    spokesman", are resolved.
+    
+    Args:
+        span: A spaCy Span object.
+    
+    Returns:
+        A boolean value.
+    """
+    
+    return len(span) > 0 and not is_full_person_name(span)
+
+
+def get_registry_full_name(span, registry):
+    """
+    Get the full form of a short name seen in earlier documents e.g. "John Smith"
+    for "Mr Smith", when the name has no longer form in the current document.
+    
+    Args:
+        span: A spaCy Span object.
+        registry: A citron.registry.SpeakerRegistry object, or None.
+    
+    Returns:
+        A string, or None if the full form is unknown.
+    """
+    
+    if registry is None or len(span) == 0 or is_pronoun(span) or not is_short_name(span):
+        return None
+    
+    full_name = registry.get_full_name(span)
+    prefix, rest_of_name = split_on_longest_prefix(span)
+    
+    if full_name is None and prefix is not None and len(rest_of_name) > 0:
+        full_name = registry.get_full_name(rest_of_name)
+    
+    if full_name is None:
+        return None
+    
+    # Do not resolve "Mrs Smith" to a registered "John Smith".
+    if prefix is not None:
+        prefix_gender = get_prefix_gender(prefix)
+        registry_gender = registry.get_gender(full_name)
+        
+        if prefix_gender in ("male", "female") and registry_gender in ("male", "female") and prefix_gender != registry_gender:
+            return None
+    
+    return full_name
+
+
 def is_plural_pronoun(span):
     """
     Check whether the span is a plural pronoun.
@@ -482,7 +579,7 @@ class CoreferenceResolver():
         with open(filename, "rb") as infile:
             self._model = pickle.load(infile)
     
-    def resolve_document(self, doc, gender_resolver, quotes, sources, contents, content_labels):
+    def resolve_document(self, doc, gender_resolver, quotes, sources, contents, content_labels, registry=None):
         """
         Find the primary coreferences of the quote sources in a document.
         
@@ -493,13 +590,22 @@ class CoreferenceResolver():
             sources: A list of spaCy Span objects.
             contents: A list of spaCy Span objects.
             content_labels: A list containing an IOB label for each token in the document.
+            registry: A citron.registry.SpeakerRegistry object, or None.
+        
+        Returns:
+            The citron.coreference.CoreferenceTable object used to resolve the document.
         """
-        coreference_table = CoreferenceTable(doc, gender_resolver, quotes, content_labels)
+        # The table is built lazily, so documents whose sources are all full person names
+        # never extract names, classify genders or search for pronouns.
+        coreference_table = CoreferenceTable(doc, gender_resolver, quotes, content_labels, registry)
 
         logger.debug("Resolve document: %s", contents)
         
         for quote in quotes:
             self._resolve_quote(doc, gender_resolver, coreference_table, quote, sources, contents)
+        
+        coreference_table.update_registry()
+        return coreference_table
     
     
     def _resolve_quote(self, doc, gender_resolver, coreference_table, quote, sources, contents):
@@ -517,11 +623,20 @@ class CoreferenceResolver():
         coreferences = []
         logger.debug("Resolve quote: %s: %s", quote.contents, quote.sources)
         for source in quote.sources:
+            if not needs_coreference(source):
+                continue
+            
             coreference = self._resolve_coreference_chain(doc, gender_resolver, coreference_table, quote, source, sources, contents)
             
             if coreference is not None and coreference.text != source.text:
                 coreferences.append(coreference)
             
+            # Short names with no longer form in the document fall back to the
+            # full names seen in earlier documents.
+            if quote.full_name is None:
+                target = coreference if coreference is not None else source
+                quote.full_name = get_registry_full_name(target, coreference_table.registry)
+            
         quote.coreferences = coreferences
     
     
@@ -604,6 +719,7 @@ class CoreferenceResolver():
         
         candidate_mentions = coreference_table.get_closest_preceding_mentions(pronoun, self.PREVIOUS_N, sources, contents, quote=quote)
         logger.debug("Candidate mentions: %s, %s", candidate_mentions, pronoun)
+        coreference_table.candidates_scored += len(candidate_mentions)
         
         if len(candidate_mentions) == 0:
             return None
@@ -624,7 +740,8 @@ class CoreferenceResolver():
             return None
         
         predicted_coreference = candidate_mentions[predicted_index]
-        predicted_coreference._.probability = probability
+        coreference_table.probabilities[(predicted_coreference.start, predicted_coreference.end)] = probability
+        coreference_table.pronouns_resolved += 1
         logger.debug("Predicted coreference: %s, %s", predicted_coreference, probability)
         return predicted_coreference
     
@@ -712,6 +829,8 @@ class CoreferenceResolver():
         if not os.path.exists(model_path):
             os.makedirs(model_path)
         
+        profiles.save_parser_info(nlp, model_path)
+        
         features, labels = CoreferenceResolver._get_features_and_labels(nlp, gender_resolver, train_path)
         
         logger.info("Vectorising training data")
@@ -896,9 +1015,13 @@ class CoreferenceTable():
     a document and a table which maps each mention with the earliest, longest 
     matching name found earlier in the text. The table is initially built 
     with names and then entries are added for pronouns as these are resolved.
+    
+    The table is built lazily. Names are only extracted when a mention is first
+    resolved and genders are only classified when the mentions preceding a 
+    pronoun are first requested.
     """
     
-    def __init__(self, doc, gender_resolver, quotes=None, content_labels=None):
+    def __init__(self, doc, gender_resolver, quotes=None, content_labels=None, registry=None):
         """
         Constructor.
         
@@ -907,30 +1030,82 @@ class CoreferenceTable():
             gender_resolver: A citron.gender.ForenameGenderClassifier object.
             quotes: A list of citron.data.Quote objects.
             content_labels: A list containing an IOB label for each token in the document.
+            registry: A citron.registry.SpeakerRegistry object, or None.
         """     
         self.doc = doc
+        self.registry = registry
+        self._gender_resolver = gender_resolver
+        self._content_labels = content_labels
+        self._names = None
+        self._coreference_map = None
+        self._mentions = None
+        self._has_genders = False
         
-        # Get all names in the document
-        names = self.get_names(doc, gender_resolver, quotes, content_labels)
-        logger.debug("Names: %s", names)
-        
-        # Dict which maps mentions to their primary (longest, earliest) coreference
-        self.coreference_map = self._build_name_table(names)
-        
-        # Combine names and pronouns to create a list of mentions
-        for token in doc:
-            if content_labels is None or content_labels[token.i] == "O":
-                if token.pos_ == "PRON":
-                    pronoun_span = doc[token.i : token.i + 1]
-                    pronoun_span._.gender = get_pronoun_gender(pronoun_span)
-                    pronoun_span._.is_plural = is_plural_pronoun(pronoun_span)
-                    names.append(pronoun_span)
-
-        filtered = [split_on_rightmost_prefix(name)[1] for name in names if not is_pronoun(name)]
-        logger.debug("Filtered: %s", filtered)
+        # Counts of the work done to resolve the document's pronouns.
+        self.candidates_scored = 0
+        self.pronouns_resolved = 0
         
-        # A sorted list of all names and pronouns in the document
-        self.mentions = sorted(filtered, key=lambda x: x.start)
+        # The probability of each predicted coreference, keyed by its start and end index.
+        self.probabilities = {}
+    
+    
+    @property
+    def names(self):
+        """
+        A sorted list of all the person and organisation names in the document.
+        """
+        
+        if self._names is None:
+            self._names = self._find_names(self.doc, self._content_labels)
+            logger.debug("Names: %s", self._names)
+        
+        return self._names
+    
+    
+    @property
+    def coreference_map(self):
+        """
+        A dict which maps mentions to their primary (longest, earliest) coreference.
+        """
+        
+        if self._coreference_map is None:
+            self._coreference_map = self._build_name_table(self.names)
+        
+        return self._coreference_map
+    
+    
+    @property
+    def mentions(self):
+        """
+        A sorted list of all the names in the document, with prefixes removed. 
+        """
+        
+        if self._mentions is None:
+            self._assign_genders()
+            filtered = [split_on_rightmost_prefix(name)[1] for name in self.names if not is_pronoun(name)]
+            logger.debug("Filtered: %s", filtered)
+            self._mentions = sorted(filtered, key=lambda x: x.start)
+        
+        return self._mentions
+    
+    
+    def update_registry(self):
+        """
+        Add the names found in the document to the speaker registry, if one is
+        available and the names have been extracted.
+        """
+        
+        if self.registry is None or self._names is None:
+            return
+        
+        for name in self._names:
+            full_name = self.coreference_map.get((name.start, name.end), name)
+            
+            if is_short_name(full_name):
+                # A short name does not tell us which full name it belongs to.
+                self.registry.add(name, None, name._.gender, full_name.label_ or None)
+            else:
+                self.registry.add_name(name, full_name, name._.gender, full_name.label_ or None)
     
     
     def add_entry(self, mention, root_mention):
@@ -1017,6 +1192,10 @@ class CoreferenceTable():
             
         """
         preceding_mentions = []
+        
+        if pronoun._.gender is None:
+            pronoun._.gender = get_pronoun_gender(pronoun)
+        
         pronoun_is_gendered = pronoun._.gender not in {"unknown", "neutral"}
         for i in range(len(self.mentions) - 1, -1, -1):
             candidate_mention = self.mentions[i]
@@ -1106,7 +1285,7 @@ class CoreferenceTable():
             key = (name.start, name.end)
             
             if longest_match != name:  
-                if name._.gender == "unknown":
+                if self._has_genders and name._.gender == "unknown":
                     name._.gender = longest_match._.gender
                    
                 if name._.is_plural is None:
@@ -1117,6 +1296,38 @@ class CoreferenceTable():
         return name_table
     
     
+    def _assign_genders(self):
+        """
+        Classify the gender of each name, if not already done, and copy genders
+        to names which match a longer name. The speaker registry, if any, gives
+        the genders which are still unknown.
+        """
+        
+        if self._has_genders:
+            return
+        
+        names = self.names
+        self._assign_name_genders(names, self._gender_resolver)
+        self._has_genders = True
+        
+        if self._coreference_map is not None:
+            for name in names:
+                longest_match = self._coreference_map.get((name.start, name.end))
+                
+                if longest_match is not None and name._.gender == "unknown":
+                    name._.gender = longest_match._.gender
+        
+        # Speakers seen in earlier documents are only consulted when the
+        # document itself does not give the gender.
+        if self.registry is not None:
+            for name in names:
+                if utils.is_person(name) and name._.gender in (None, "unknown"):
+                    registry_gender = self.registry.get_gender(name)
+                    
+                    if registry_gender is not None:
+                        name._.gender = registry_gender
+    
+    
     def get_names(self, doc, gender_resolver, quotes=None, content_labels=None):
         """
         Get a list of all the name spans within the document.
@@ -1131,6 +1342,24 @@ class CoreferenceTable():
             names: A list of spaCy Span objects.
         """
         
+        names = self._find_names(doc, content_labels)
+        self._assign_name_genders(names, gender_resolver)
+        return names
+    
+    
+    def _find_names(self, doc, content_labels=None):
+        """
+        Get a sorted list of the person and organisation name spans within the 
+        document and determine their plurality.
+        
+        Args:
+            doc: a spaCy Doc object.
+            content_labels: A list containing an IOB label for each token in the document.
+        
+        Returns:
+            names: A list of spaCy Span objects.
+        """
+        
         # Build list of names for all sources and entities
         names = []
         name_labels = [0] * len(doc)
@@ -1167,14 +1396,29 @@ class CoreferenceTable():
         # A sorted list of all names and pronouns in the document
         names = sorted(names, key=lambda x: x.start)
 
-        # Determine plurality and gender
-        for idx, name in enumerate(names):
+        # Determine plurality
+        for name in names:
             if utils.is_person(name):
-                name._.gender = get_gender(name, gender_resolver)
                 name._.is_plural = False           
             elif name.label_ == "ORG":
                 name._.gender = "neutral"
                 name._.is_plural = True
+                
+        return names
+    
+    
+    def _assign_name_genders(self, names, gender_resolver):
+        """
+        Determine the gender of each name in a sorted list of names.
+        
+        Args:
+            names: A list of spaCy Span objects.
+            gender_resolver: A citron.gender.ForenameGenderClassifier object.
+        """
+        
+        for idx, name in enumerate(names):
+            if utils.is_person(name):
+                name._.gender = get_gender(name, gender_resolver)
 
             lower_name = utils.strip_possessive(name.text.lower())
             for name_idx in range(idx - 1, 0, -1):
@@ -1182,8 +1426,6 @@ class CoreferenceTable():
                 if lower_name in lower_match:
                     name._.gender = names[name_idx]._.gender
                     break
-                
-        return names
     
     
     # def is_longer_with_matching_surname(self, candidate_name, name):
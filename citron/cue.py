@@ -19,6 +19,7 @@ from .data import DataSource
 from .logger import logger
 from . import utils
 from . import metrics
+from . import profiles
 
 
 class CueClassifier():
@@ -50,7 +51,7 @@ class CueClassifier():
         with open(filename, "rb") as infile:
             self.model = pickle.load(infile)
         
-        CueClassifier.verbnet = self.model["verbnet"]
+        self.verbnet = self.model["verbnet"]
     
     
     def predict_cues_and_labels(self, doc):
@@ -76,7 +77,7 @@ class CueClassifier():
                 if inside_quotation_marks_labels[token.i] == 1:
                     continue
                 
-                features = self._get_features(token)
+                features = self._get_features(token, self.verbnet)
                 test_vectors = self.model["vectorizer"].transform([features])
                 predictions = self.model["classifier"].predict(test_vectors)
                 
@@ -106,7 +107,7 @@ class CueClassifier():
         """
         
         logger.info("Evaluating Cue Classifier model using: %s", test_path)
-        features, labels = self._get_features_and_labels(nlp, test_path)
+        features, labels = self._get_features_and_labels(nlp, test_path, self.verbnet)
         logger.debug("Test labels: %s", len(labels))
         
         test_vectors = self.model["vectorizer"].transform(features)
@@ -152,8 +153,10 @@ class CueClassifier():
         if not os.path.exists(model_path):
             os.makedirs(model_path)
         
-        CueClassifier.verbnet = VerbNet(verbnet_path)         
-        features, labels = CueClassifier._get_features_and_labels(nlp, train_path)
+        profiles.save_parser_info(nlp, model_path)
+        
+        verbnet = VerbNet(verbnet_path)
+        features, labels = CueClassifier._get_features_and_labels(nlp, train_path, verbnet)
         
         logger.info("Vectorising training data")
         vectorizer = DictVectorizer()
@@ -167,7 +170,7 @@ class CueClassifier():
         model = {}
         model["classifier"] = classifier
         model["vectorizer"] = vectorizer
-        model["verbnet"] = CueClassifier.verbnet 
+        model["verbnet"] = verbnet
         model["timestamp"] = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
         
         filename = os.path.join(model_path, CueClassifier.MODEL_FILENAME)
@@ -182,13 +185,14 @@ class CueClassifier():
     
     
     @staticmethod
-    def _get_features_and_labels(nlp, input_path):
+    def _get_features_and_labels(nlp, input_path, verbnet):
         """
         Get features and labels for each token in a corpus of documents.
         
         Args:
             input_path: The path (string) to a file or directory of Citron format JSON data files.
                 Directories will be explored recursively.
+            verbnet: A citron.cue.VerbNet object.
         
         Returns:
             A tuple containing:
@@ -209,7 +213,7 @@ class CueClassifier():
                     if inside_quotation_marks_labels[token.i] == 1:
                         continue
                     
-                    token_features = CueClassifier._get_features(token)
+                    token_features = CueClassifier._get_features(token, verbnet)
                     token_label = actual_cue_labels[token.i]
                     features.append(token_features)
                     
@@ -222,12 +226,13 @@ class CueClassifier():
     
     
     @staticmethod
-    def _get_features(token):
+    def _get_features(token, verbnet):
         """
         Get the features for a token.
         
         Args:
             token: A spaCy Token object. 
+            verbnet: A citron.cue.VerbNet object.
         
         Returns:
             A features dict.
@@ -243,7 +248,7 @@ class CueClassifier():
         features["dep"] = token.dep_
         features["head_tag"] = token.head.tag_
         
-        verbnet_class = CueClassifier.verbnet.get_class(token)
+        verbnet_class = verbnet.get_class(token)
         
         if verbnet_class is not None:
             features["vnclass"] = verbnet_class
@@ -236,6 +236,9 @@ class Quote(object):
         self.contents = contents
         self.coreferences = coreferences
         self.confidence = confidence
+        
+        # The full form of a short source name seen in an earlier document.
+        self.full_name = None
     
     
     def get_cue_length(self):
@@ -358,4 +361,7 @@ class Quote(object):
         if self.confidence is not None:
             quote_json["confidence"] = '{0:.4f}'.format(self.confidence)
         
+        if self.full_name is not None:
+            quote_json["full_name"] = self.full_name
+        
         return quote_json
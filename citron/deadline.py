@@ -0,0 +1,164 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides per-request deadlines, which let Citron skip optional
+stages when a document's latency budget runs low, and the estimates of stage
+durations used to decide whether a stage still fits in the budget.
+"""
+
+import threading
+import time
+
+from .logger import logger
+
+
+class ExtractionCancelledError(Exception):
+    """
+    Raised between stages when the extraction of a document has been cancelled.
+    """
+
+
+class Deadline():
+    """
+    Class representing the time by which the processing of a document should
+    finish. Optional stages which are not expected to finish in time are
+    skipped and recorded, so that the results can be marked as partial.
+
+    A deadline can also be cancelled, e.g. when the client has gone away, which
+    stops the processing at the next stage.
+    """
+
+    def __init__(self, seconds=None):
+        """
+        Constructor.
+
+        Args:
+            seconds: The time budget (float) in seconds from now, or None for no limit.
+        """
+
+        self.expires = None if seconds is None else time.monotonic() + seconds
+        self.skipped = []
+        self.cancelled = False
+
+
+    def remaining(self):
+        """
+        Get the time remaining.
+
+        Returns:
+            The number of seconds (float), which is negative once the deadline has
+            passed, or None if there is no limit.
+        """
+
+        if self.expires is None:
+            return None
+
+        return self.expires - time.monotonic()
+
+
+    def allows(self, stage, estimate=0.0):
+        """
+        Check whether an optional stage should run, recording it as skipped if not.
+
+        Args:
+            stage: The name (string) of the stage.
+            estimate: The expected duration (float) of the stage in seconds.
+
+        Returns:
+            True if the stage is expected to finish before the deadline, otherwise False.
+
+        Raises:
+            ExtractionCancelledError: If the deadline has been cancelled.
+        """
+
+        self.check()
+        remaining = self.remaining()
+
+        if remaining is None or remaining > estimate:
+            return True
+
+        logger.debug("Skipping %s with %.3f seconds remaining (estimate: %.3f)", stage, remaining, estimate)
+        self.skipped.append(stage)
+        return False
+
+
+    def check(self):
+        """
+        Raises:
+            ExtractionCancelledError: If the deadline has been cancelled.
+        """
+
+        if self.cancelled:
+            raise ExtractionCancelledError("The extraction was cancelled.")
+
+
+    def cancel(self):
+        """
+        Cancel the processing, which stops at the next stage.
+        """
+
+        self.cancelled = True
+
+
+    def is_partial(self):
+        return len(self.skipped) > 0
+
+
+class StageEstimates():
+    """
+    Class which estimates the duration of stages from an exponentially weighted
+    moving average of their recent durations per token.
+    """
+
+    def __init__(self, weight=0.2):
+        """
+        Constructor.
+
+        Args:
+            weight: The weight (float) of each new measurement.
+        """
+
+        self.weight = weight
+        self._seconds_per_token = {}
+        self._lock = threading.Lock()
+
+
+    def get(self, stage, tokens):
+        """
+        Estimate the duration of a stage.
+
+        Args:
+            stage: The name (string) of the stage.
+            tokens: The number of tokens (int) in the document.
+
+        Returns:
+            The number of seconds (float), or 0.0 if the stage has not been measured.
+        """
+
+        return self._seconds_per_token.get(stage, 0.0) * tokens
+
+
+    def update(self, stage, tokens, seconds):
+        """
+        Record the duration of a stage.
+
+        Args:
+            stage: The name (string) of the stage.
+            tokens: The number of tokens (int) in the document.
+            seconds: The duration (float) in seconds.
+        """
+
+        if tokens == 0:
+            return
+
+        with self._lock:
+            previous = self._seconds_per_token.get(stage)
+            current = seconds / tokens
+
+            if previous is None:
+                self._seconds_per_token[stage] = current
+            else:
+                self._seconds_per_token[stage] = previous + self.weight * (current - previous)
@@ -0,0 +1,138 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides classes which record the time spent in each stage of the
+Citron pipeline and the number of items processed, for a single document.
+"""
+
+import time
+
+
+class DocumentProfile():
+    """
+    Class which records the wall-clock and CPU time of each stage and counts of
+    the items processed for one document.
+
+    Stages are timed as laps: each call to lap() records the time since the
+    previous lap (or since the profile was created) against the named stage.
+    CPU time is measured for the current thread.
+    """
+
+    enabled = True
+
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+
+        self.stages = {}
+        self.components = {}
+        self.counts = {}
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.thread_time()
+        self._last_wall = self._start_wall
+        self._last_cpu = self._start_cpu
+
+
+    def lap(self, stage):
+        """
+        Record the time since the previous lap against a stage.
+
+        Args:
+            stage: The name (string) of the stage.
+        """
+
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        timing = self.stages.setdefault(stage, {"wall": 0.0, "cpu": 0.0})
+        timing["wall"] += wall - self._last_wall
+        timing["cpu"] += cpu - self._last_cpu
+        self._last_wall = wall
+        self._last_cpu = cpu
+
+
+    def skip(self):
+        """
+        Start the next lap without recording the time since the previous lap.
+        """
+
+        self._last_wall = time.perf_counter()
+        self._last_cpu = time.thread_time()
+
+
+    def count(self, name, value):
+        """
+        Add to a count.
+
+        Args:
+            name: The name (string) of the count.
+            value: The amount (int) to add.
+        """
+
+        self.counts[name] = self.counts.get(name, 0) + value
+
+
+    def add_components(self, timings):
+        """
+        Add the wall-clock times of the spaCy pipeline components.
+
+        Args:
+            timings: A dict mapping component names to times in seconds (float).
+        """
+
+        for name, duration in timings.items():
+            self.components[name] = self.components.get(name, 0.0) + duration
+
+
+    def to_json(self):
+        """
+        Get a JSON serialisable representation. Times are in seconds.
+
+        Returns: A JSON serialisable object.
+        """
+
+        return {
+            "total": {
+                "wall": self._last_wall - self._start_wall,
+                "cpu": self._last_cpu - self._start_cpu,
+            },
+            "stages": self.stages,
+            "components": self.components,
+            "counts": self.counts,
+        }
+
+
+class NullProfile():
+    """
+    Class with the interface of DocumentProfile which records nothing. Used
+    when instrumentation is disabled.
+    """
+
+    enabled = False
+
+
+    def lap(self, stage):
+        pass
+
+
+    def skip(self):
+        pass
+
+
+    def count(self, name, value):
+        pass
+
+
+    def add_components(self, timings):
+        pass
+
+
+    def to_json(self):
+        return None
+
+
+NULL_PROFILE = NullProfile()
@@ -0,0 +1,340 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides an in-process queue of extraction jobs. Each job holds one
+or more documents which are processed in the background by worker threads,
+so that clients can submit long documents or batches and poll for the results.
+"""
+
+import collections
+import queue
+import threading
+import time
+import uuid
+
+from .logger import logger
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+
+FINISHED = (COMPLETED, CANCELLED)
+
+
+class JobQueueFullError(Exception):
+    """
+    Raised when a job is submitted while the maximum number of jobs are pending.
+    """
+
+
+class Job():
+    """
+    Class representing a job: a list of documents and their results.
+    """
+
+    def __init__(self, documents):
+        """
+        Constructor.
+
+        Args:
+            documents: A list of documents. Their type depends on the queue's process function.
+        """
+
+        self.id = uuid.uuid4().hex
+        self.documents = documents
+        self.size = len(documents)
+        self.results = []
+        self.status = QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = False
+        self._event = threading.Event()
+        self._callbacks = []
+        self._callback_lock = threading.Lock()
+
+
+    def is_finished(self):
+        return self.status in FINISHED
+
+
+    def wait(self, timeout=None):
+        """
+        Wait for the job to finish.
+
+        Args:
+            timeout: The maximum time to wait in seconds (float), or None to wait indefinitely.
+
+        Returns:
+            True if the job has finished, otherwise False.
+        """
+
+        return self._event.wait(timeout)
+
+
+    def add_done_callback(self, callback):
+        """
+        Call a function with the job once it has finished, or immediately if it
+        has already finished. The function is called by the thread which finishes
+        the job, so it should only hand the job over e.g. to an event loop with
+        call_soon_threadsafe().
+
+        Args:
+            callback: A function taking one argument.
+        """
+
+        with self._callback_lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+
+        callback(self)
+
+
+    def remove_done_callback(self, callback):
+        """
+        Remove a function added by add_done_callback(), if it has not been called.
+
+        Args:
+            callback: A function.
+        """
+
+        with self._callback_lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+    def _finish(self, status):
+        self.status = status
+        self.finished = time.time()
+        self.documents = None
+
+        with self._callback_lock:
+            self._event.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logger.exception("Job %s callback failed", self.id)
+
+
+    def to_json(self, include_results=True):
+        """
+        Get a JSON serialisable representation. Results are only included once
+        the job has finished.
+
+        Args:
+            include_results: A boolean flag indicating whether to include the results.
+
+        Returns: A JSON serialisable object.
+        """
+
+        job_json = {
+            "id": self.id,
+            "status": self.status,
+            "documents": self.size,
+            "processed": len(self.results),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+        if include_results and self.is_finished():
+            job_json["results"] = self.results
+
+        return job_json
+
+
+class JobQueue():
+    """
+    Class which processes jobs in the background with a pool of worker threads.
+
+    Documents are processed one at a time by the process function, so a
+    cancelled job stops after its current document. Finished jobs are retained
+    for a configurable time and then discarded.
+    """
+
+    def __init__(self, process, workers=1, retention=3600, max_pending=100):
+        """
+        Constructor.
+
+        Args:
+            process: A function taking one document and returning a JSON serialisable
+                result. It may raise ValueError for an invalid document.
+            workers: The number of jobs (int) processed concurrently.
+            retention: The time (int) in seconds for which finished jobs are retained.
+            max_pending: The maximum number (int) of queued and running jobs.
+        """
+
+        self.process = process
+        self.retention = retention
+        self.max_pending = max_pending
+        self.jobs = collections.OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._workers = []
+
+        for i in range(workers):
+            worker = threading.Thread(target=self._run, name="citron-job-worker-{0}".format(i), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+
+    def submit(self, documents):
+        """
+        Submit a job.
+
+        Args:
+            documents: A list of documents.
+
+        Returns:
+            A citron.jobs.Job object.
+
+        Raises:
+            JobQueueFullError: If the maximum number of jobs are pending.
+        """
+
+        job = Job(documents)
+
+        with self._lock:
+            self._purge()
+
+            if self._pending >= self.max_pending:
+                raise JobQueueFullError("Too many jobs are pending, the limit is {0}.".format(self.max_pending))
+
+            self.jobs[job.id] = job
+            self._pending += 1
+
+        self._queue.put(job)
+        logger.debug("Submitted job %s with %d documents", job.id, len(documents))
+        return job
+
+
+    def get(self, job_id):
+        """
+        Get a job.
+
+        Args:
+            job_id: The job id (string).
+
+        Returns:
+            A citron.jobs.Job object, or None if the job is unknown or has expired.
+        """
+
+        with self._lock:
+            self._purge()
+            return self.jobs.get(job_id)
+
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. A queued job is cancelled immediately and a running job is
+        cancelled after its current document. Results of the processed documents
+        are retained.
+
+        Args:
+            job_id: The job id (string).
+
+        Returns:
+            The citron.jobs.Job object, or None if the job is unknown or has expired.
+        """
+
+        with self._lock:
+            job = self.jobs.get(job_id)
+
+            if job is None:
+                return None
+
+            if job.status == QUEUED:
+                job._finish(CANCELLED)
+                self._pending -= 1
+
+            elif job.status == RUNNING:
+                job.cancel_requested = True
+
+        return job
+
+
+    def get_pending(self):
+        """
+        Get the number of queued and running jobs.
+
+        Returns: An int.
+        """
+
+        return self._pending
+
+
+    def shutdown(self):
+        """
+        Stop the workers after their current document. Pending jobs are cancelled.
+        """
+
+        with self._lock:
+            for job in self.jobs.values():
+                if job.status == QUEUED:
+                    job._finish(CANCELLED)
+                elif job.status == RUNNING:
+                    job.cancel_requested = True
+
+            self._pending = 0
+
+        for _ in self._workers:
+            self._queue.put(None)
+
+
+    def _purge(self):
+        """
+        Discard finished jobs which are older than the retention time. Requires the lock.
+        """
+
+        expiry = time.time() - self.retention
+        expired = [job_id for job_id, job in self.jobs.items() if job.is_finished() and job.finished < expiry]
+
+        for job_id in expired:
+            del self.jobs[job_id]
+
+
+    def _run(self):
+        """
+        Process jobs until shutdown.
+        """
+
+        while True:
+            job = self._queue.get()
+
+            if job is None:
+                return
+
+            with self._lock:
+                if job.status != QUEUED:
+                    continue
+
+                job.status = RUNNING
+                job.started = time.time()
+
+            for document in job.documents:
+                if job.cancel_requested:
+                    break
+
+                try:
+                    job.results.append(self.process(document))
+                except ValueError as err:
+                    job.results.append({"error": str(err)})
+                except Exception as err:
+                    logger.exception("Job %s failed to process a document", job.id)
+                    job.results.append({"error": "Unable to process the document: {0}".format(err)})
+
+            with self._lock:
+                job._finish(CANCELLED if job.cancel_requested else COMPLETED)
+                self._pending = max(0, self._pending - 1)
+
+            logger.debug("Finished job %s: %s", job.id, job.status)
@@ -0,0 +1,272 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides the replacement of loaded models in a long-running
+process. Models are reloaded in the background, after a number of documents or
+on request, and swapped in once warmed up. Documents in progress finish with
+the models they started with.
+
+Reloading discards the spaCy vocabulary and StringStore, which grow with every
+new token string seen, along with any other state accumulated by the models.
+It does not bound the memory of the process, as the memory freed is not always
+returned to the operating system; see citron.supervisor for the recycling of
+worker processes.
+"""
+
+from concurrent.futures import Future
+from contextlib import contextmanager
+import os
+import resource
+import sys
+import threading
+
+from . import supervisor
+from .logger import logger
+
+
+def get_rss():
+    """
+    Get the resident set size of the current process. On platforms without
+    /proc the peak resident set size is returned instead.
+
+    Returns:
+        The size (int) in bytes.
+    """
+
+    try:
+        with open("/proc/self/statm") as infile:
+            return int(infile.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Reported in bytes on macOS and kilobytes elsewhere.
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Generation():
+    """
+    Class holding one loaded set of models and the number of documents using it.
+    """
+
+    def __init__(self, number, models):
+        self.number = number
+        self.models = models
+        self.documents = 0
+        self.in_use = 0
+        self.retired = False
+        self.closed = False
+
+
+class ModelSlot():
+    """
+    Class which holds the current models and replaces them with newly loaded
+    models. The models may be any object; when replaced, their close() method,
+    if any, is called once no document is using them.
+
+    A replacement is started after max_documents documents, and can be started
+    explicitly with replace().
+    """
+
+    def __init__(self, load, max_documents=None):
+        """
+        Constructor. The models are loaded before the constructor returns.
+
+        Args:
+            load: A function with no arguments which returns warmed up models.
+            max_documents: The number of documents (int) after which the models are
+                replaced, or None.
+        """
+
+        self.load = load
+        self.max_documents = max_documents
+        self.replacements = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._replacing = None
+        models = load()
+        self._generation = Generation(0, models)
+
+
+    @property
+    def current(self):
+        """
+        The current models, for uses which do not need to hold them, such as checks.
+        """
+
+        return self._generation.models
+
+
+    def add_listener(self, listener):
+        """
+        Add a function which is called with the new models after each replacement.
+
+        Args:
+            listener: A function taking one argument.
+        """
+
+        self._listeners.append(listener)
+
+
+    @contextmanager
+    def use(self):
+        """
+        Use the current models, which are not closed before the context exits.
+        Each use counts as one document towards max_documents and, in a worker
+        process, towards the limit of its supervisor.
+
+        Yields:
+            The models.
+        """
+
+        with self._lock:
+            generation = self._generation
+            generation.in_use += 1
+
+        try:
+            yield generation.models
+
+        finally:
+            with self._lock:
+                generation.in_use -= 1
+                generation.documents += 1
+                close = generation.retired and generation.in_use == 0
+
+            supervisor.count_document()
+
+            if close:
+                self._close(generation)
+            elif not generation.retired and self._is_exhausted(generation):
+                self.replace()
+
+
+    def replace(self, load=None):
+        """
+        Load new models in a background thread and swap them in once loaded. Only
+        one replacement runs at a time.
+
+        Args:
+            load: A function which replaces the slot's load function once it has
+                loaded the new models, or None to use the slot's load function.
+
+        Returns:
+            A concurrent.futures.Future object which completes with the generation
+            number (int) of the new models. A replacement already in progress is
+            returned instead of starting another.
+        """
+
+        with self._lock:
+            if self._replacing is not None:
+                return self._replacing
+
+            future = Future()
+            future.set_running_or_notify_cancel()
+            self._replacing = future
+
+        thread = threading.Thread(target=self._replace, args=(future, load), name="citron-model-loader", daemon=True)
+        thread.start()
+        return future
+
+
+    def get_stats(self):
+        """
+        Get the generation of the current models and the documents they have processed.
+
+        Returns:
+            A JSON serialisable object.
+        """
+
+        with self._lock:
+            return {
+                "generation": self._generation.number,
+                "documents": self._generation.documents,
+                "in_use": self._generation.in_use,
+                "replacing": self._replacing is not None,
+                "replacements": self.replacements,
+            }
+
+
+    def close(self):
+        """
+        Close the current models.
+        """
+
+        with self._lock:
+            generation = self._generation
+            generation.retired = True
+            close = generation.in_use == 0
+
+        if close:
+            self._close(generation)
+
+
+    def _is_exhausted(self, generation):
+        """
+        Check whether a generation has reached the limits which trigger a replacement.
+        """
+
+        return self.max_documents is not None and generation.documents >= self.max_documents
+
+
+    def _replace(self, future, load):
+        """
+        Load and swap in new models, then retire the old models.
+        """
+
+        try:
+            logger.info("Loading replacement models")
+            models = (load or self.load)()
+
+            with self._lock:
+                if load is not None:
+                    self.load = load
+
+                old = self._generation
+                self._generation = Generation(old.number + 1, models)
+                old.retired = True
+                close = old.in_use == 0
+                self.replacements += 1
+                self._replacing = None
+
+            logger.info("Replaced models of generation %d after %d documents", old.number, old.documents)
+
+            for listener in self._listeners:
+                try:
+                    listener(models)
+                except Exception:
+                    logger.exception("Model replacement listener failed")
+
+            if close:
+                self._close(old)
+
+            future.set_result(old.number + 1)
+
+        except Exception as err:
+            logger.exception("Unable to load replacement models")
+
+            with self._lock:
+                self._replacing = None
+                # Delay the next attempt triggered by the limits.
+                self._generation.documents = 0
+
+            future.set_exception(err)
+
+
+    def _close(self, generation):
+        with self._lock:
+            if generation.closed:
+                return
+
+            generation.closed = True
+
+        close = getattr(generation.models, "close", None)
+
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                logger.exception("Unable to close the models of generation %d", generation.number)
+
+        logger.debug("Retired models of generation %d", generation.number)
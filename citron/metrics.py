@@ -11,24 +11,34 @@ Note that when components are used collectively, rather than individually, the
 performance is affected by the behaviour of components earlier in the pipeline. 
 """
 
+import time
+
 from .data import DataSource    
 from . import utils
 
 
-def evaluate(citron, test_path):
+def evaluate(citron, test_path, verbose=True):
     """
     Evaluate Citron and print exact and overlap metric scores.
     
     Args:
+        citron: A citron.citron.Citron object.
         test_path: The path (string) to a file or directory of Citron format JSON data files.
             Directories will be explored recursively.
+        verbose: A boolean flag indicating whether to print the scores.
     
     The exact match metrics require the predicted and correct spans to be an exact match.
     
     The overlap metrics are based on the number of predicted tokens that overlap with correct
     tokens compared to the total number of predicted and correct tokens.
+    
+    Returns:
+        A dict containing the number of documents, the time taken in seconds (including 
+        parsing) and a (precision, recall, f1) tuple for each metric.
     """
     
+    document_count = 0
+    start_time = time.perf_counter()
     total_predicted_quotes = 0
     total_actual_quotes = 0
     
@@ -61,6 +71,7 @@ def evaluate(citron, test_path):
     sum_of_actual_content_lengths = 0
     
     for doc, actual_quotes, _ in DataSource(citron.nlp, test_path):
+        document_count += 1
         predicted_quotes = citron.get_quotes(doc, resolve_coreferences=False)
         total_predicted_quotes += len(predicted_quotes)
         total_actual_quotes += len(actual_quotes)
@@ -96,6 +107,7 @@ def evaluate(citron, test_path):
         sum_of_actual_source_lengths         += scores[7]
         sum_of_actual_content_lengths        += scores[8]
     
+    elapsed_time = time.perf_counter() - start_time
     sum_of_quote_overlaps          = sum_of_cue_overlaps + sum_of_content_overlaps + sum_of_source_overlaps
     sum_of_quote_actual_lengths    = sum_of_actual_cue_lengths + sum_of_actual_content_lengths + sum_of_actual_source_lengths
     sum_of_quote_predicted_lengths = sum_of_predicted_cue_lengths + sum_of_predicted_content_lengths + sum_of_predicted_source_lengths
@@ -112,10 +124,30 @@ def evaluate(citron, test_path):
     quote_exact_scores   = get_exact_scores(quote_exact_match_tp, quote_exact_match_fp, quote_exact_match_fn)
     quote_overlap_scores = get_overlap_scores(sum_of_quote_overlaps, sum_of_quote_actual_lengths, sum_of_quote_predicted_lengths)
     
+    results = {
+        "documents": document_count,
+        "seconds": elapsed_time,
+        "cue_exact": cue_exact_scores,
+        "cue_overlap": cue_overlap_scores,
+        "source_exact": source_exact_scores,
+        "source_overlap": source_overlap_scores,
+        "content_exact": content_exact_scores,
+        "content_overlap": content_overlap_scores,
+        "quote_exact": quote_exact_scores,
+        "quote_overlap": quote_overlap_scores,
+    }
+    
+    if not verbose:
+        return results
+    
     print("================================================================================")
     print()
     print("Total predicted quotes:", total_predicted_quotes)
     print("Total actual quotes:   ", total_actual_quotes)
+    
+    if elapsed_time > 0:
+        print("Documents/sec:         ", "{0:.2f}".format(document_count / elapsed_time))
+    
     print()
     print("---- Cue Span exact match metrics ----")
     print_metrics(*cue_exact_scores)
@@ -140,6 +172,7 @@ def evaluate(citron, test_path):
     print()
     print("---- All Quote Spans overlap metrics ----")
     print_metrics(*quote_overlap_scores)
+    return results
 
 
 def get_cue_exact_match_metrics(predicted_quotes, actual_quotes):
@@ -0,0 +1,310 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides the extraction of quotes from very long documents, such as
+books and transcripts, using a pool of processes. The document is split into
+overlapping groups of paragraphs which are processed in parallel, and the
+results are stitched together with a final document-wide coreference pass.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from .citron import get_stages, select_entities, set_results_stages
+from . import chunking
+from . import coreference
+from . import profiles
+from . import utils
+from .logger import logger
+
+# The Citron object of a worker process, loaded by _load_worker().
+_worker_citron = None
+
+# The number of preceding quotes searched for the speaker of an unresolved pronoun.
+PRONOUN_WINDOW = 3
+
+
+def _load_worker(profile, model_path, parser_settings):
+    """
+    Load the models in a worker process.
+    """
+
+    global _worker_citron
+    _worker_citron = profiles.load_citron(profile, model_path, parser_settings)
+
+
+def _get_worker_info():
+    """
+    Get the tokenizer and source description of a worker's Citron object, and the
+    worker's effective thread settings.
+    """
+
+    return _worker_citron.nlp.tokenizer, _worker_citron.source, utils.get_thread_settings()
+
+
+def _process_chunk(text, offset, owned_start, owned_end, stages):
+    """
+    Extract the quotes and entities from a chunk in a worker process.
+
+    Spans are returned as character offsets in the complete text, so that they
+    can be mapped to its tokens. Each quote also has a "_speaker" entry
+    describing its speaker for the document-wide coreference pass.
+    """
+
+    citron = _worker_citron
+    doc = citron.nlp(text)
+    quotes = []
+    entities = []
+
+    for quote in citron.get_quotes(doc, stages=stages):
+        quote_json = quote.to_json()
+
+        for key in ("sources", "coreferences", "contents"):
+            quote_json[key] = [get_char_span(doc, span_json, offset) for span_json in quote_json[key]]
+
+        quote_json["cue"] = get_char_span(doc, quote_json["cue"], offset)
+        quote_json["_speaker"] = get_speaker(quote)
+        is_owned = owned_start <= offset + quote.cue.start_char < owned_end
+        quotes.append((quote_json, is_owned))
+
+    if "entities" in stages:
+        for ee in doc.ents:
+            if owned_start <= offset + ee.start_char < owned_end:
+                entities.append((ee.label_, ee.text.strip(), offset + ee.start_char, offset + ee.end_char))
+
+    return quotes, entities
+
+
+def get_char_span(doc, span_json, offset):
+    """
+    Get a span with character offsets in place of token indices.
+    """
+
+    span = doc[span_json["start"] : span_json["end"]]
+    return {"start_char": offset + span.start_char, "end_char": offset + span.end_char, "text": span_json["text"]}
+
+
+def get_speaker(quote):
+    """
+    Describe the speaker of a quote: whether the source is an unresolved pronoun
+    or short name, and the speaker's gender.
+
+    Returns:
+        A dict with "type" ("pronoun", "short_name", "name" or None) and "gender" keys.
+    """
+
+    if len(quote.sources) == 0 or len(quote.sources[0]) == 0:
+        return {"type": None, "gender": "unknown"}
+
+    if quote.coreferences is not None and len(quote.coreferences) > 0:
+        speaker = quote.coreferences[0]
+        return {"type": "name", "gender": speaker._.gender or "unknown"}
+
+    source = quote.sources[0]
+
+    if coreference.is_pronoun(source):
+        return {"type": "pronoun", "gender": coreference.get_pronoun_gender(source)}
+
+    if coreference.is_short_name(source):
+        return {"type": "short_name", "gender": source._.gender or "unknown"}
+
+    return {"type": "name", "gender": source._.gender or "unknown"}
+
+
+def resolve_document(quotes_json):
+    """
+    Resolve the speakers of quotes which could not be resolved within their
+    chunk, against the speakers of the quotes of the whole document. Short names
+    are resolved to the first longer name with the same surname, and pronouns to
+    the nearest preceding speaker of the same gender.
+
+    Args:
+        quotes_json: A list of JSON serialisable quotes in document order, each
+            with a "_speaker" entry.
+
+    Returns:
+        The number (int) of quotes resolved.
+    """
+
+    names = {}
+    speakers = []
+    resolved = 0
+
+    for quote_json in quotes_json:
+        speaker = quote_json["_speaker"]
+
+        if speaker["type"] == "name":
+            name = quote_json["sources"][0]
+            surname = name["text"].split()[-1].lower()
+
+            if len(name["text"].split()) > 1:
+                names.setdefault(surname, (name, speaker["gender"]))
+
+            speakers.append((name, speaker["gender"]))
+            continue
+
+        match = None
+
+        if speaker["type"] == "short_name":
+            surname = quote_json["sources"][0]["text"].split()[-1].lower()
+            match = names.get(surname)
+
+        elif speaker["type"] == "pronoun" and speaker["gender"] in ("male", "female"):
+            for name, gender in reversed(speakers[-PRONOUN_WINDOW:]):
+                if gender == speaker["gender"]:
+                    match = (name, gender)
+                    break
+
+        if match is not None:
+            quote_json["coreferences"] = quote_json["sources"]
+            quote_json["sources"] = [match[0]]
+            speakers.append(match)
+            resolved += 1
+
+        elif speaker["type"] == "short_name":
+            speakers.append((quote_json["sources"][0], speaker["gender"]))
+
+    return resolved
+
+
+class ParallelExtractor():
+    """
+    Class which extracts quotes from long documents using a pool of processes,
+    each with its own preloaded Citron models.
+    """
+
+    def __init__(self, profile=profiles.DEFAULT_PROFILE, model_path=None, parser_settings=None, processes=None,
+                 max_chars=10000, overlap_chars=500):
+        """
+        Constructor. The worker processes are started and their models loaded
+        before the constructor returns.
+
+        Args:
+            profile: The name (string) of the profile (see citron.profiles).
+            model_path: The path (string) to a Citron model directory which overrides
+                the profile's model path, or None.
+            parser_settings: A dict of settings which override the profile's parser
+                settings, or None. The "threads" setting is the thread budget of each
+                worker (see citron.utils.set_thread_budget), which is one unless specified.
+            processes: The number of worker processes (int), or None for the number of CPUs.
+            max_chars: The maximum length (int) of each paragraph group in characters.
+            overlap_chars: The maximum length (int) of the overlap between groups.
+        """
+
+        parser_settings = dict(parser_settings or {})
+
+        if parser_settings.get("threads") is None:
+            parser_settings["threads"] = 1
+
+        self.processes = processes or multiprocessing.cpu_count()
+        self.max_chars = max_chars
+        self.overlap_chars = overlap_chars
+        self.tokenizer = None
+        self.source = None
+        self.thread_settings = None
+
+        # Spawned rather than forked, as torch and CUDA do not survive a fork. The
+        # workers inherit the thread limits of libraries loaded before the budget is set.
+        with utils.thread_environment(parser_settings["threads"]):
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_load_worker,
+                initargs=(profile, model_path, parser_settings)
+            )
+
+            logger.info("Starting %d Citron worker processes with %d threads each", self.processes, parser_settings["threads"])
+            futures = [self.executor.submit(_get_worker_info) for _ in range(self.processes)]
+
+            # The workers' tokenizer is used to map character offsets to the tokens of
+            # the complete text, without loading the models in this process.
+            for future in futures:
+                self.tokenizer, self.source, self.thread_settings = future.result()
+
+        logger.info("Worker thread settings: %s", self.thread_settings)
+
+
+    def extract(self, text, stages=None):
+        """
+        Extract quotes from a long text. Spans in the results refer to the tokens
+        of the complete text.
+
+        Args:
+            text: The text (string).
+            stages: The stages to run (see citron.citron.get_stages), or None to run all stages.
+
+        Returns:
+            A JSON serialisable object containing the extracted quotes.
+        """
+
+        stages = get_stages(stages)
+        results = {
+            "quotes": [],
+            "source": self.source,
+        }
+
+        chunks = chunking.get_chunks(text, self.max_chars, self.overlap_chars)
+        boundaries = chunking.get_boundaries(chunks)
+        futures = []
+
+        for (start, end), (owned_start, owned_end) in zip(chunks, boundaries):
+            futures.append(self.executor.submit(_process_chunk, text[start : end], start, owned_start, owned_end, stages))
+
+        aligner = chunking.ChunkAligner(self.tokenizer(text))
+        candidates = []
+        entities = []
+
+        for future in futures:
+            quotes, chunk_entities = future.result()
+
+            for quote_json, is_owned in quotes:
+                candidates.append((remap_quote(aligner, quote_json), is_owned))
+
+            for label, name, start_char, end_char in chunk_entities:
+                entities.append((label, name, aligner.get_token_range(start_char, end_char)[0]))
+
+        quotes_json = chunking.merge_quotes(candidates)
+
+        if "coreference" in stages:
+            resolved = resolve_document(quotes_json)
+            logger.debug("Resolved %d speakers across paragraph groups", resolved)
+
+        for quote_json in quotes_json:
+            del quote_json["_speaker"]
+
+        results["quotes"] = quotes_json
+
+        if "entities" in stages:
+            results["entities"] = select_entities(entities)
+
+        set_results_stages(results, stages)
+        return results
+
+
+    def shutdown(self):
+        """
+        Stop the worker processes.
+        """
+
+        self.executor.shutdown()
+
+
+def remap_quote(aligner, quote_json):
+    """
+    Map the character offsets of the spans of a quote to the tokens of the complete text.
+    """
+
+    def remap_span(span_json):
+        start, end = aligner.get_token_range(span_json["start_char"], span_json["end_char"])
+        return {"start": start, "end": end, "text": span_json["text"]}
+
+    remapped = dict(quote_json)
+    remapped["cue"] = remap_span(quote_json["cue"])
+
+    for key in ("sources", "coreferences", "contents"):
+        remapped[key] = [remap_span(span_json) for span_json in quote_json[key]]
+
+    return remapped
@@ -0,0 +1,177 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides named profiles which pair a spaCy model with Citron models
+trained on that spaCy model's parses.
+
+Citron's models learn from the tags, dependencies and entities produced by the
+parser, so a Citron model should be used with the spaCy model it was trained with.
+"""
+
+import json
+import os
+
+import spacy
+
+from .logger import logger
+
+MODELS_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "models"
+)
+
+PROFILES = {
+    "accurate": {
+        "description": "Transformer parses, for editorial tools",
+        "parser": {"model": "en_core_web_trf"},
+        "model_path": os.path.join(MODELS_DIRECTORY, "en_2021-11-15"),
+    },
+    "fast": {
+        "description": "Small CNN parses, for bulk archive processing",
+        # The parser sets the sentence boundaries, so the senter is not needed.
+        "parser": {"model": "en_core_web_sm", "exclude": ["senter"]},
+        "model_path": os.path.join(MODELS_DIRECTORY, "en_2021-11-15_sm"),
+    },
+}
+
+DEFAULT_PROFILE = "accurate"
+PARSER_INFO_FILENAME = "parser.json"
+
+
+def get_profile(name):
+    """
+    Get a named profile.
+
+    Args:
+        name: The name (string) of the profile.
+
+    Returns:
+        A profile dict.
+
+    Raises:
+        ValueError: If the profile is not recognised.
+    """
+
+    if name not in PROFILES:
+        raise ValueError("Unknown profile: {0}. Valid profiles are: {1}".format(name, ", ".join(PROFILES)))
+
+    return PROFILES[name]
+
+
+def load_citron(name=DEFAULT_PROFILE, model_path=None, parser_settings=None, **kwargs):
+    """
+    Load a Citron object using the spaCy model and Citron model of a profile.
+
+    Args:
+        name: The name (string) of the profile.
+        model_path: The path (string) to a Citron model directory which overrides
+            the profile's model path, or None.
+        parser_settings: A dict of settings which override the profile's parser
+            settings (see citron.utils.get_parser), or None.
+        kwargs: Additional arguments for the Citron constructor.
+
+    Returns:
+        A citron.citron.Citron object.
+
+    Raises:
+        ValueError: If the profile is not recognised.
+        FileNotFoundError: If the Citron model directory does not exist.
+    """
+
+    # Imported here as citron.citron depends on this module.
+    from .citron import Citron
+    from . import utils
+
+    profile = get_profile(name)
+    parser_profile = dict(profile["parser"])
+
+    if parser_settings is not None:
+        parser_profile.update(parser_settings)
+
+    if model_path is None:
+        model_path = profile["model_path"]
+
+    if not os.path.isdir(model_path):
+        raise FileNotFoundError(
+            "Citron model directory not found for profile {0}: {1}. Build the models first with "
+            "scripts/train/profile_models_builder.py --profiles {0}".format(name, model_path)
+        )
+
+    logger.info("Loading Citron profile: %s", name)
+    nlp = utils.get_parser(profile=parser_profile)
+    return Citron(model_path, nlp, **kwargs)
+
+
+def get_parser_name(nlp):
+    """
+    Get the package name of a spaCy model e.g. "en_core_web_trf".
+
+    Args:
+        nlp: A spaCy Language object.
+
+    Returns:
+        A string.
+    """
+
+    return nlp.meta["lang"] + "_" + nlp.meta["name"]
+
+
+def save_parser_info(nlp, model_path):
+    """
+    Record the spaCy model used to build the models in a Citron model directory.
+
+    Args:
+        nlp: A spaCy Language object.
+        model_path: The path (string) to the Citron model directory.
+    """
+
+    info = {
+        "model": get_parser_name(nlp),
+        "version": nlp.meta["version"],
+        "spacy_version": spacy.__version__,
+    }
+
+    filename = os.path.join(model_path, PARSER_INFO_FILENAME)
+
+    try:
+        with open(filename, "w", encoding="utf-8") as outfile:
+            json.dump(info, outfile, indent=2)
+
+    except IOError:
+        logger.error("Unable to save parser info: %s", filename)
+
+
+def check_parser_info(nlp, model_path):
+    """
+    Log a warning if a Citron model directory was built with a different spaCy
+    model to the one supplied.
+
+    Args:
+        nlp: A spaCy Language object.
+        model_path: The path (string) to the Citron model directory.
+
+    Returns:
+        False if the spaCy models are known to differ, otherwise True.
+    """
+
+    filename = os.path.join(model_path, PARSER_INFO_FILENAME)
+
+    if not os.path.exists(filename):
+        return True
+
+    with open(filename, encoding="utf-8") as infile:
+        info = json.load(infile)
+
+    parser_name = get_parser_name(nlp)
+
+    if info["model"] != parser_name:
+        logger.warning(
+            "Citron model %s was trained with %s but is being used with %s, accuracy will be reduced",
+            model_path, info["model"], parser_name
+        )
+        return False
+
+    return True
@@ -0,0 +1,346 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides a cross-document registry of resolved speakers.
+
+Follow-up articles and live-blog updates tend to quote the same people. The
+registry remembers the full form, gender and entity type of each speaker so
+that later documents can resolve short forms such as "Mr Smith" without
+repeating the work.
+"""
+
+from collections import OrderedDict
+import json
+import os
+import tempfile
+import threading
+
+from . import utils
+from .logger import logger
+
+
+class SpeakerRegistry():
+    """
+    Class providing a bounded, optionally file-backed, store of speakers keyed
+    by normalised name. The least recently used entries are evicted when the
+    registry is full.
+
+    Each entry is a dict containing:
+        full_name: The normalised longest form of the name (string).
+        full_text: The longest form of the name as it appeared in a document (string).
+        gender: "male", "female", "neutral" or "unknown".
+        entity_type: The spaCy entity label (string) e.g. "PERSON" or "ORG", or None.
+        ambiguous: True if the name has been seen as a short form of different
+            full names e.g. "Smith" for "John Smith" and "Jane Smith".
+    """
+
+    DEFAULT_MAX_ENTRIES = 10000
+    DEFAULT_SAVE_INTERVAL = 100
+
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, save_interval=DEFAULT_SAVE_INTERVAL):
+        """
+        Constructor.
+
+        Args:
+            path: The path (string) to a JSON file used to persist the registry, or None.
+            max_entries: The maximum number of entries (int) held before eviction.
+            save_interval: The number of updates (int) between automatic saves, or None
+                to save only when save() is called.
+        """
+
+        self.path = path
+        self.max_entries = max_entries
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._unsaved = 0
+        self._lock = threading.RLock()
+
+        if path is not None and os.path.exists(path):
+            self.load()
+
+
+    @staticmethod
+    def normalise(name):
+        """
+        Get the registry key for a name.
+
+        Args:
+            name: A string or spaCy Span object.
+
+        Returns:
+            A string.
+        """
+
+        if not isinstance(name, str):
+            name = name.text
+
+        text = " ".join(name.lower().replace(".", " ").split())
+        return utils.strip_possessive(text)
+
+
+    def get(self, name):
+        """
+        Get the entry for a name, if one exists.
+
+        Args:
+            name: A string or spaCy Span object.
+
+        Returns:
+            A dict, or None.
+        """
+
+        key = self.normalise(name)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return dict(entry)
+
+
+    def get_full_name(self, name):
+        """
+        Get the full form of a short name seen in earlier documents e.g. "John Smith"
+        for "Smith".
+
+        Args:
+            name: A string or spaCy Span object.
+
+        Returns:
+            A string, or None if no longer form is known or the name is ambiguous.
+        """
+
+        entry = self.get(name)
+
+        if entry is None or entry.get("ambiguous", False) or entry["full_name"] == self.normalise(name):
+            return None
+
+        return entry.get("full_text") or entry["full_name"]
+
+
+    def get_gender(self, name):
+        """
+        Get the gender of a name, following the entry for its full form when
+        the name itself has no known gender.
+
+        Args:
+            name: A string or spaCy Span object.
+
+        Returns:
+            "male", "female", "neutral" or None when unknown or ambiguous.
+        """
+
+        entry = self.get(name)
+
+        if entry is None or entry.get("ambiguous", False):
+            return None
+
+        if entry["gender"] not in (None, "unknown"):
+            return entry["gender"]
+
+        if entry["full_name"] != self.normalise(name):
+            # Looked up directly, so that the lookup counts once towards the hit rate.
+            with self._lock:
+                full_entry = self._entries.get(entry["full_name"])
+
+                if full_entry is not None and full_entry["gender"] not in (None, "unknown"):
+                    return full_entry["gender"]
+
+        return None
+
+
+    def add(self, name, full_name=None, gender=None, entity_type=None):
+        """
+        Add or update the entry for a name. Known values are not replaced by
+        unknown values. A name seen with a full form which does not match its
+        previous full form is marked as ambiguous.
+
+        Args:
+            name: A string or spaCy Span object.
+            full_name: A string or spaCy Span object (the longest form of the name), or None.
+            gender: "male", "female", "neutral", "unknown" or None.
+            entity_type: A spaCy entity label (string), or None.
+        """
+
+        with self._lock:
+            save = self._add(name, full_name, gender, entity_type)
+
+        if save:
+            self.save()
+
+
+    def add_name(self, name, full_name, gender, entity_type):
+        """
+        Add a resolved name, its full form and, for people, an entry mapping the
+        surname to the full name. Surnames shared by different full names are
+        marked as ambiguous, so that they are not resolved or given a gender.
+
+        Args:
+            name: A spaCy Span object.
+            full_name: A spaCy Span object (the longest form of the name).
+            gender: "male", "female", "neutral" or "unknown".
+            entity_type: A spaCy entity label (string), or None.
+        """
+
+        with self._lock:
+            save = self._add(name, full_name, gender, entity_type)
+            save = self._add(full_name, full_name, gender, entity_type) or save
+
+            if entity_type == "PERSON" and len(full_name) > 1:
+                save = self._add(full_name[-1].text, full_name, gender, entity_type) or save
+
+        if save:
+            self.save()
+
+
+    def _add(self, name, full_name, gender, entity_type):
+        """
+        Add or update the entry for a name. Requires the lock.
+
+        Returns:
+            True if the registry should be saved.
+        """
+
+        key = self.normalise(name)
+
+        if len(key) == 0:
+            return False
+
+        if full_name is None:
+            full_text = name if isinstance(name, str) else name.text
+        else:
+            full_text = full_name if isinstance(full_name, str) else full_name.text
+
+        full_text = full_text.strip()
+        full_name = self.normalise(full_text)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            entry = {"full_name": full_name, "full_text": full_text, "gender": "unknown", "entity_type": None}
+            self._entries[key] = entry
+
+        elif entry.get("ambiguous", False):
+            pass
+
+        elif not is_same_name(full_name, entry["full_name"]):
+            logger.debug("Ambiguous name: %s (%s, %s)", key, entry["full_name"], full_name)
+            entry.update({"full_name": key, "full_text": key, "gender": "unknown", "ambiguous": True})
+
+        elif len(full_name) > len(entry["full_name"]):
+            entry["full_name"] = full_name
+            entry["full_text"] = full_text
+
+        if not entry.get("ambiguous", False) and gender is not None and gender != "unknown":
+            entry["gender"] = gender
+
+        if entity_type is not None:
+            entry["entity_type"] = entity_type
+
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        self._unsaved += 1
+        return self.path is not None and self.save_interval is not None and self._unsaved >= self.save_interval
+
+
+    def load(self):
+        """
+        Load the registry from its file.
+        """
+
+        logger.debug("Loading speaker registry: %s", self.path)
+
+        try:
+            with open(self.path, encoding="utf-8") as infile:
+                data = json.load(infile)
+
+        except (IOError, ValueError):
+            logger.error("Unable to load speaker registry: %s", self.path)
+            return
+
+        with self._lock:
+            self._entries = OrderedDict(data.get("entries", []))
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+            self._unsaved = 0
+
+
+    def save(self):
+        """
+        Save the registry to its file. The file is replaced atomically, using a
+        uniquely named temporary file so that processes sharing the file do not
+        overwrite each other's temporary files.
+        """
+
+        if self.path is None:
+            return
+
+        with self._lock:
+            data = {"entries": [(key, dict(entry)) for key, entry in self._entries.items()]}
+            self._unsaved = 0
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+
+        try:
+            handle, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+
+        except OSError:
+            logger.error("Unable to save speaker registry: %s", self.path)
+            return
+
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as outfile:
+                json.dump(data, outfile, ensure_ascii=False)
+
+            os.replace(temp_path, self.path)
+
+        except (OSError, TypeError, ValueError):
+            logger.error("Unable to save speaker registry: %s", self.path)
+
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+    def __contains__(self, name):
+        key = self.normalise(name)
+
+        with self._lock:
+            return key in self._entries
+
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def is_same_name(name, other):
+    """
+    Check whether two normalised full names could refer to the same person,
+    i.e. the words of one are all words of the other.
+
+    Args:
+        name: A string.
+        other: A string.
+
+    Returns:
+        A boolean value.
+    """
+
+    words = set(name.split())
+    other_words = set(other.split())
+    return words <= other_words or other_words <= words
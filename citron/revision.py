@@ -0,0 +1,385 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides a comparison of two revisions of a document at the
+paragraph level, so that only the changed paragraphs need to be processed and
+the results for the unchanged paragraphs can be carried over.
+"""
+
+import bisect
+import difflib
+import hashlib
+
+from .chunking import ChunkAligner, get_paragraphs
+
+
+def get_paragraph_key(paragraph):
+    """
+    Get a digest of a paragraph, so that paragraphs can be compared without
+    keeping their text.
+
+    Args:
+        paragraph: The text (string) of the paragraph.
+
+    Returns:
+        A bytes object.
+    """
+
+    return hashlib.blake2b(paragraph.encode("utf-8"), digest_size=16).digest()
+
+
+def get_token_indices(results):
+    """
+    Get the indices of the tokens which begin or end the spans of a set of results.
+
+    Args:
+        results: The results of citron.citron.Citron.extract().
+
+    Returns:
+        A set of ints.
+    """
+
+    indices = set()
+
+    for quote_json in results["quotes"]:
+        for span_json in quote_json["sources"] + quote_json["coreferences"] + quote_json["contents"] + [quote_json["cue"]]:
+            indices.add(span_json["start"])
+            indices.add(span_json["end"] - 1)
+
+    for entity in results.get("entities", []):
+        indices.add(entity["Start"])
+
+    return indices
+
+
+def diff_paragraphs(previous_paragraphs, paragraphs):
+    """
+    Compare the paragraphs of two revisions.
+
+    Args:
+        previous_paragraphs: A list of the paragraphs (strings or keys from
+            get_paragraph_key()) of the previous revision.
+        paragraphs: A list of the paragraphs of the new revision, in the same form.
+
+    Returns:
+        A dict mapping the index of each unchanged paragraph of the previous revision
+        to its index in the new revision, and a set of the indices of the changed
+        paragraphs of the new revision. The paragraphs either side of a deletion
+        are treated as changed.
+    """
+
+    matcher = difflib.SequenceMatcher(None, previous_paragraphs, paragraphs, autojunk=False)
+    unchanged = {}
+    changed = set()
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(i2 - i1):
+                unchanged[i1 + offset] = j1 + offset
+
+        elif j2 > j1:
+            changed.update(range(j1, j2))
+
+        else:
+            changed.update(j for j in (j1 - 1, j1) if 0 <= j < len(paragraphs))
+
+    return unchanged, changed
+
+
+class PreviousRevision():
+    """
+    Class holding what is needed to reuse the results of a revision of a
+    document: the character ranges and digests of its paragraphs, and the
+    character ranges of the tokens its results refer to. The text itself is
+    not kept.
+    """
+
+    def __init__(self, nlp, text, results):
+        """
+        Constructor.
+
+        Args:
+            nlp: A spaCy Language object, used only for tokenization.
+            text: The text (string) of the revision.
+            results: The results of citron.citron.Citron.extract() for the revision.
+        """
+
+        doc = nlp.make_doc(text)
+        self.paragraphs = get_paragraphs(text)
+        self.keys = [get_paragraph_key(text[start : end]) for start, end in self.paragraphs]
+        self.length = len(doc)
+        self.tokens = {}
+
+        for i in get_token_indices(results):
+            if 0 <= i < len(doc):
+                self.tokens[i] = (doc[i].idx, doc[i].idx + len(doc[i]))
+
+
+class Revision():
+    """
+    Class which compares a new revision of a document with the previous
+    revision and maps the spans of the previous results to the tokens of the
+    new revision.
+
+    Paragraphs which have changed, and their neighbours, are affected and must
+    be processed again. Results are only carried over when all their spans are
+    within unaffected paragraphs. A quote whose cue is unaffected but which has
+    a span in an affected paragraph makes the cue's paragraph affected too.
+    """
+
+    def __init__(self, nlp, previous, text, context=1):
+        """
+        Constructor.
+
+        Args:
+            nlp: A spaCy Language object, used only for tokenization.
+            previous: A citron.revision.PreviousRevision object.
+            text: The text (string) of the new revision.
+            context: The number (int) of neighbouring paragraphs affected by each
+                changed paragraph.
+        """
+
+        self.context = context
+        self.previous = previous
+        self.previous_paragraphs = previous.paragraphs
+        self.paragraphs = get_paragraphs(text)
+        self.previous_starts = [start for start, _ in self.previous_paragraphs]
+        self.starts = [start for start, _ in self.paragraphs]
+        self.aligner = ChunkAligner(nlp.make_doc(text))
+
+        self.unchanged, changed = diff_paragraphs(
+            previous.keys,
+            [get_paragraph_key(text[start : end]) for start, end in self.paragraphs]
+        )
+        self.affected = set()
+        self._affect(changed)
+
+
+    def _affect(self, indices):
+        """
+        Mark paragraphs of the new revision, and their neighbours, as affected.
+        """
+
+        for j in indices:
+            for k in range(j - self.context, j + self.context + 1):
+                if 0 <= k < len(self.paragraphs):
+                    self.affected.add(k)
+
+        self.paragraph_map = {i: j for i, j in self.unchanged.items() if j not in self.affected}
+
+
+    def get_regions(self):
+        """
+        Get the regions of the new revision which must be processed.
+
+        Returns:
+            A list of (start, end) character offsets, each spanning consecutive
+            affected paragraphs.
+        """
+
+        regions = []
+
+        for j in sorted(self.affected):
+            if len(regions) > 0 and regions[-1][1] == j - 1:
+                regions[-1] = (regions[-1][0], j)
+            else:
+                regions.append((j, j))
+
+        return [(self.paragraphs[first][0], self.paragraphs[last][1]) for first, last in regions]
+
+
+    def remap_char(self, char, is_end=False):
+        """
+        Map a character offset of the previous revision to the new revision.
+
+        Args:
+            char: The offset (int).
+            is_end: A boolean flag indicating whether the offset is the end of a span,
+                which belongs to the paragraph before it.
+
+        Returns:
+            The offset (int), or None if it is not within an unaffected paragraph.
+        """
+
+        if is_end:
+            i = bisect.bisect_left(self.previous_starts, char) - 1
+        else:
+            i = bisect.bisect_right(self.previous_starts, char) - 1
+
+        if i < 0 or i not in self.paragraph_map or char > self.previous_paragraphs[i][1]:
+            return None
+
+        return char - self.previous_paragraphs[i][0] + self.paragraphs[self.paragraph_map[i]][0]
+
+
+    def remap_span(self, span_json):
+        """
+        Map a span of the previous revision to the new revision.
+
+        Returns:
+            A JSON serialisable span, or None if it is not within unaffected paragraphs.
+        """
+
+        if span_json["end"] > self.previous.length or span_json["start"] >= span_json["end"]:
+            return None
+
+        first = self.previous.tokens.get(span_json["start"])
+        last = self.previous.tokens.get(span_json["end"] - 1)
+
+        if first is None or last is None:
+            return None
+
+        start = self.remap_char(first[0])
+        end = self.remap_char(last[1], is_end=True)
+
+        if start is None or end is None:
+            return None
+
+        start, end = self.aligner.get_token_range(start, end)
+        return {"start": start, "end": end, "text": span_json["text"]}
+
+
+    def remap_quote(self, quote_json):
+        """
+        Map the spans of a quote of the previous revision to the new revision.
+
+        Returns:
+            A JSON serialisable quote, or None if any span is not within unaffected paragraphs.
+        """
+
+        remapped = dict(quote_json)
+
+        for key in ("sources", "coreferences", "contents"):
+            spans = [self.remap_span(span) for span in quote_json[key]]
+
+            if None in spans:
+                return None
+
+            remapped[key] = spans
+
+        remapped["cue"] = self.remap_span(quote_json["cue"])
+
+        if remapped["cue"] is None:
+            return None
+
+        return remapped
+
+
+    def reuse_quotes(self, previous_quotes, coreference=False):
+        """
+        Get the quotes of the previous revision which can be carried over,
+        marking the paragraphs of any quotes which cannot as affected.
+
+        Args:
+            previous_quotes: A list of JSON serialisable quotes from the previous results.
+            coreference: A boolean flag indicating whether coreferences were resolved,
+                in which case a quote resolved to an antecedent is not carried over
+                when an affected paragraph lies between them, as it may now hold a
+                closer antecedent.
+
+        Returns:
+            A list of JSON serialisable quotes with spans in the new revision.
+        """
+
+        while True:
+            quotes_json = []
+            newly_affected = set()
+
+            for quote_json in previous_quotes:
+                remapped = self.remap_quote(quote_json)
+
+                if remapped is not None and not (coreference and self._is_separated(remapped)):
+                    quotes_json.append(remapped)
+                    continue
+
+                cue = self.remap_span(quote_json["cue"])
+
+                if cue is not None:
+                    newly_affected.add(self._get_paragraph(cue["start"]))
+
+            if len(newly_affected) == 0:
+                return quotes_json
+
+            self._affect(newly_affected)
+
+
+    def reuse_entities(self, previous_entities):
+        """
+        Get the entities of the previous revision which are within unaffected
+        paragraphs, and those which are not.
+
+        The previous entities omit the names contained in a name found earlier (see
+        citron.citron.select_entities). A name omitted from an unaffected paragraph
+        stays omitted while a name containing it is found before that paragraph. So
+        each entity which is not carried over is returned with the first token of
+        the next unaffected paragraph, before which such a name must be found.
+
+        Args:
+            previous_entities: A list of JSON serialisable entities from the previous results.
+
+        Returns:
+            A list of (label, text, start) tuples, where start is the index of the
+            first token in the new revision, and a list of (text, token) tuples for
+            the entities which are not carried over, where token is None when no
+            unaffected paragraph follows the entity.
+        """
+
+        entities = []
+        dropped = []
+
+        for entity in previous_entities:
+            if entity["Start"] not in self.previous.tokens:
+                # Its position is unknown, so no paragraph is known to be safe.
+                dropped.append((entity["Text"], 0))
+                continue
+
+            char = self.previous.tokens[entity["Start"]][0]
+            start = self.remap_char(char)
+
+            if start is not None and start in self.aligner.token_starts:
+                entities.append((entity["Label"], entity["Text"], self.aligner.token_starts[start]))
+            else:
+                dropped.append((entity["Text"], self._get_next_unaffected_token(char)))
+
+        return entities, dropped
+
+
+    def _get_paragraph(self, token):
+        """
+        Get the index of the paragraph of the new revision containing a token.
+        """
+
+        return bisect.bisect_right(self.starts, self.aligner.doc[token].idx) - 1
+
+
+    def _is_separated(self, quote_json):
+        """
+        Check whether an affected paragraph lies between the cue of a quote of the
+        new revision and the antecedents its sources were resolved to.
+        """
+
+        if len(quote_json["coreferences"]) == 0:
+            return False
+
+        first = self._get_paragraph(min(span["start"] for span in quote_json["sources"]))
+        last = self._get_paragraph(quote_json["cue"]["start"])
+        return any(first < j < last for j in self.affected)
+
+
+    def _get_next_unaffected_token(self, char):
+        """
+        Get the first token of the new revision in the first unaffected paragraph
+        after a character offset of the previous revision, or None if there is none.
+        """
+
+        i = bisect.bisect_right(self.previous_starts, char) - 1
+
+        for k in range(i + 1, len(self.previous_paragraphs)):
+            if k in self.paragraph_map:
+                start, end = self.paragraphs[self.paragraph_map[k]]
+                return self.aligner.get_token_range(start, end)[0]
+
+        return None
@@ -0,0 +1,202 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides a scheduler which runs extraction tasks on worker threads
+in two lanes, so that short documents are not delayed by long ones. Tasks are
+assigned to a lane by their estimated cost and ordered within each lane by
+priority, then by arrival.
+"""
+
+from concurrent.futures import Future
+import heapq
+import itertools
+import threading
+
+SHORT = "short"
+LONG = "long"
+
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+PRIORITIES = {
+    "high": HIGH,
+    "normal": NORMAL,
+    "low": LOW,
+}
+
+
+def get_priority(name, default=NORMAL):
+    """
+    Get a priority from its name.
+
+    Args:
+        name: "high", "normal" or "low" (string), or None.
+        default: The priority (int) to return when the name is None.
+
+    Returns:
+        An int. Lower values are scheduled first.
+
+    Raises:
+        ValueError: If the name is not recognised.
+    """
+
+    if name is None:
+        return default
+
+    priority = PRIORITIES.get(name.strip().lower())
+
+    if priority is None:
+        raise ValueError("Unknown priority: {0}. Valid priorities are: {1}".format(name, ", ".join(PRIORITIES)))
+
+    return priority
+
+
+class Scheduler():
+    """
+    Class which runs functions on two lanes of worker threads. Tasks whose cost
+    is at most short_cost go to the short lane and the rest to the long lane.
+    Short lane workers only run short tasks, so a burst of long documents cannot
+    occupy them. Long lane workers run short tasks when no long tasks are waiting.
+    """
+
+    DEFAULT_SHORT_COST = 2000
+
+
+    def __init__(self, short_workers=1, long_workers=1, short_cost=DEFAULT_SHORT_COST):
+        """
+        Constructor.
+
+        Args:
+            short_workers: The number of threads (int) which only run short tasks.
+            long_workers: The number of threads (int) which run long tasks, and short
+                tasks when no long tasks are waiting.
+            short_cost: The maximum cost (number) of a short task, e.g. in characters.
+        """
+
+        self.short_cost = short_cost
+        self._queues = {SHORT: [], LONG: []}
+        self._running = {SHORT: 0, LONG: 0}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._threads = []
+
+        for lane, workers in ((SHORT, short_workers), (LONG, long_workers)):
+            for i in range(workers):
+                thread = threading.Thread(target=self._run, args=(lane,), name="citron-{0}-{1}".format(lane, i), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+
+    def submit(self, function, *args, cost=0, priority=NORMAL, **kwargs):
+        """
+        Schedule a function to be called with the supplied arguments.
+
+        Args:
+            function: The function.
+            cost: The estimated cost (number) of the call, e.g. the number of characters.
+            priority: The priority (int) of the call, e.g. HIGH, NORMAL or LOW.
+
+        Returns:
+            A concurrent.futures.Future object.
+
+        Raises:
+            RuntimeError: If the scheduler has been shut down.
+        """
+
+        future = Future()
+        lane = SHORT if cost <= self.short_cost else LONG
+
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("The scheduler has been shut down.")
+
+            heapq.heappush(self._queues[lane], (priority, next(self._counter), future, function, args, kwargs))
+            self._condition.notify_all()
+
+        return future
+
+
+    def get_stats(self):
+        """
+        Get the numbers of queued and running tasks in each lane.
+
+        Returns:
+            A JSON serialisable object.
+        """
+
+        with self._condition:
+            return {
+                lane: {"queued": len(self._queues[lane]), "running": self._running[lane]}
+                for lane in (SHORT, LONG)
+            }
+
+
+    def shutdown(self, wait=False):
+        """
+        Stop the workers. Queued tasks are cancelled and running tasks are completed.
+
+        Args:
+            wait: A boolean flag indicating whether to wait for running tasks.
+        """
+
+        with self._condition:
+            self._shutdown = True
+
+            for lane_queue in self._queues.values():
+                for task in lane_queue:
+                    task[2].cancel()
+
+                lane_queue.clear()
+
+            self._condition.notify_all()
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+    def _next_task(self, lane):
+        """
+        Get the next task for a worker of a lane. Requires the lock.
+        """
+
+        for source in ((SHORT,) if lane == SHORT else (LONG, SHORT)):
+            if len(self._queues[source]) > 0:
+                return heapq.heappop(self._queues[source])
+
+        return None
+
+
+    def _run(self, lane):
+        """
+        Run tasks in a worker thread.
+        """
+
+        while True:
+            with self._condition:
+                task = self._next_task(lane)
+
+                while task is None and not self._shutdown:
+                    self._condition.wait()
+                    task = self._next_task(lane)
+
+                if task is None:
+                    return
+
+                self._running[lane] += 1
+
+            _, _, future, function, args, kwargs = task
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args, **kwargs))
+                except BaseException as err:
+                    future.set_exception(err)
+
+            with self._condition:
+                self._running[lane] -= 1
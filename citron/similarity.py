@@ -0,0 +1,340 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides an index of recent documents which finds near-duplicates
+of a new document using MinHash signatures of word shingles, so that the
+results of a near-duplicate can be reused for the unchanged paragraphs.
+"""
+
+from collections import OrderedDict
+import hashlib
+import random
+import re
+import threading
+import zlib
+
+import numpy
+
+from .citron import get_stages
+from .logger import logger
+from .revision import PreviousRevision
+
+# The largest prime below 2^32. The shingle hashes and the coefficients of the
+# hash functions are below 2^32, so a * x + b cannot overflow 64 bits.
+PRIME = (1 << 32) - 5
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def get_shingles(text, size=5):
+    """
+    Get the hashes of the word shingles of a text.
+
+    Args:
+        text: The text (string).
+        size: The number of words (int) in each shingle.
+
+    Returns:
+        A set of ints.
+    """
+
+    words = WORD_PATTERN.findall(text.lower())
+
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+
+    return {zlib.crc32(" ".join(words[i : i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+
+def sample_shingles(shingles, max_shingles):
+    """
+    Sample the shingles of a long document. The shingles kept are those whose
+    hashes fall in the lowest 1/2^n of the hash range, for the smallest n which
+    keeps no more than about max_shingles. Documents of similar length use the
+    same range and so keep the same shared shingles, which preserves their
+    similarity.
+
+    Args:
+        shingles: A set of shingle hashes (ints) from get_shingles().
+        max_shingles: The number of shingles (int) above which they are sampled.
+
+    Returns:
+        A collection of ints.
+    """
+
+    if len(shingles) <= max_shingles:
+        return shingles
+
+    ratio = -(-len(shingles) // max_shingles)
+    limit = 1 << (32 - (ratio - 1).bit_length())
+    sample = [x for x in shingles if x < limit]
+    return sample if len(sample) > 0 else [min(shingles)]
+
+
+class MinHashIndex():
+    """
+    Class providing a bounded index of documents' MinHash signatures, with
+    locality sensitive hashing to find candidate near-duplicates quickly. The
+    least recently added documents are evicted when the index is full.
+    """
+
+    def __init__(self, num_perm=128, bands=32, shingle_size=5, max_documents=1000, max_shingles=2000, seed=1):
+        """
+        Constructor.
+
+        Args:
+            num_perm: The number of hash functions (int) in each signature.
+            bands: The number of bands (int) used for locality sensitive hashing.
+                It must divide num_perm. More bands find less similar candidates.
+            shingle_size: The number of words (int) in each shingle.
+            max_documents: The maximum number of documents (int) in the index.
+            max_shingles: The number of shingles (int) of a document above which
+                only a sample of its shingles is hashed (see sample_shingles).
+            seed: The seed (int) of the hash functions.
+        """
+
+        if num_perm % bands != 0:
+            raise ValueError("The number of bands must divide the number of hash functions.")
+
+        generator = random.Random(seed)
+        self.permutations = [
+            (generator.randint(1, PRIME - 1), generator.randint(0, PRIME - 1))
+            for _ in range(num_perm)
+        ]
+        self._a = numpy.array([a for a, _ in self.permutations], dtype=numpy.uint64)
+        self._b = numpy.array([b for _, b in self.permutations], dtype=numpy.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_documents = max_documents
+        self.max_shingles = max_shingles
+        self._documents = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+
+    def get_signature(self, text):
+        """
+        Get the MinHash signature of a text.
+
+        Args:
+            text: The text (string).
+
+        Returns:
+            A tuple of ints.
+        """
+
+        shingles = get_shingles(text, self.shingle_size)
+
+        shingles = sample_shingles(shingles, self.max_shingles)
+        x = numpy.fromiter(shingles, dtype=numpy.uint64, count=len(shingles))
+        hashes = (numpy.outer(x, self._a) + self._b) % numpy.uint64(PRIME)
+        return tuple(hashes.min(axis=0).tolist())
+
+
+    def add(self, key, signature, value):
+        """
+        Add a document.
+
+        Args:
+            key: A unique key (hashable) for the document.
+            signature: The document's signature from get_signature().
+            value: Any object to be returned by query().
+        """
+
+        with self._lock:
+            if key in self._documents:
+                self._remove(key)
+
+            self._documents[key] = (signature, value)
+
+            for band in self._get_bands(signature):
+                self._buckets.setdefault(band, set()).add(key)
+
+            while len(self._documents) > self.max_documents:
+                self._remove(next(iter(self._documents)))
+
+
+    def query(self, signature, threshold, predicate=None):
+        """
+        Find the most similar document.
+
+        Args:
+            signature: The signature from get_signature() of the new document.
+            threshold: The minimum estimated Jaccard similarity (float) of the shingles.
+            predicate: A function taking a document's value and returning whether the
+                document may be returned, or None.
+
+        Returns:
+            A (value, similarity) tuple, or None if no document is similar enough.
+        """
+
+        with self._lock:
+            candidates = set()
+
+            for band in self._get_bands(signature):
+                candidates.update(self._buckets.get(band, ()))
+
+            best = None
+
+            for key in candidates:
+                other, value = self._documents[key]
+                similarity = sum(1 for x, y in zip(signature, other) if x == y) / len(signature)
+
+                if similarity >= threshold and (best is None or similarity > best[1]):
+                    if predicate is None or predicate(value):
+                        best = (value, similarity)
+
+            return best
+
+
+    def clear(self):
+        """
+        Remove all the documents.
+        """
+
+        with self._lock:
+            self._documents.clear()
+            self._buckets.clear()
+
+
+    def __len__(self):
+        return len(self._documents)
+
+
+    def _get_bands(self, signature):
+        return [(i, signature[i * self.rows : (i + 1) * self.rows]) for i in range(self.bands)]
+
+
+    def _remove(self, key):
+        """
+        Remove a document. Requires the lock.
+        """
+
+        signature, _ = self._documents.pop(key)
+
+        for band in self._get_bands(signature):
+            keys = self._buckets.get(band)
+
+            if keys is not None:
+                keys.discard(key)
+
+                if len(keys) == 0:
+                    del self._buckets[band]
+
+
+class NearDuplicateExtractor():
+    """
+    Class which extracts quotes with a citron.citron.Citron object, reusing the
+    results of a recently processed near-duplicate for its unchanged paragraphs
+    (see citron.citron.Citron.extract_revision). Exact repeats are served by the
+    Citron object's cache, when it has one, before any near-duplicate is sought.
+
+    The Citron object is passed to each call rather than held, so that the models
+    can be replaced while documents are in progress. Only the results of the same
+    model are reused.
+
+    The index holds the results of each document with the digests and ranges of
+    its paragraphs (see citron.revision.PreviousRevision), not its text.
+    """
+
+    DEFAULT_THRESHOLD = 0.8
+
+
+    def __init__(self, index=None, threshold=DEFAULT_THRESHOLD):
+        """
+        Constructor.
+
+        Args:
+            index: A citron.similarity.MinHashIndex object, or None for a new index.
+            threshold: The minimum estimated Jaccard similarity (float) of a near-duplicate.
+        """
+
+        self.index = index if index is not None else MinHashIndex()
+        self.threshold = threshold
+        self.documents = 0
+        self.near_duplicates = 0
+        self.paragraphs = 0
+        self.paragraphs_reused = 0
+        self._lock = threading.Lock()
+
+
+    def extract(self, citron, text, stages=None, deadline=None):
+        """
+        Extract quotes from the supplied text. Partial results are not indexed.
+        No near-duplicate is sought once the deadline has passed.
+
+        Args:
+            citron: A citron.citron.Citron object.
+            text: The text (string)
+            stages: The stages to run (see citron.citron.get_stages), or None to run all stages.
+            deadline: A citron.deadline.Deadline object, or None.
+
+        Returns:
+            A JSON serialisable object containing the extracted quotes.
+
+        Raises:
+            citron.deadline.ExtractionCancelledError: If the deadline is cancelled.
+        """
+
+        stages = sorted(get_stages(stages))
+        results = citron.get_cached_results(text, stages)
+
+        if results is not None:
+            return results
+
+        if deadline is not None:
+            deadline.check()
+
+            if deadline.remaining() is not None and deadline.remaining() <= 0:
+                return citron.extract(text, stages=stages, deadline=deadline, check_cache=False)
+
+        signature = self.index.get_signature(text)
+        match = self.index.query(
+            signature, self.threshold, lambda value: value[2] == stages and value[1]["source"] == citron.source
+        )
+        counts = {}
+
+        if match is None:
+            results = citron.extract(text, stages=stages, deadline=deadline, check_cache=False)
+
+        else:
+            (previous, previous_results, _), similarity = match
+            logger.debug("Reusing a near-duplicate with similarity %.2f", similarity)
+            results = citron.extract_revision(text, previous, previous_results, stages=stages, deadline=deadline, counts=counts)
+
+        if not results.get("partial", False):
+            key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+            previous = PreviousRevision(citron.nlp, text, results)
+            self.index.add(key, signature, (previous, results, stages))
+
+        with self._lock:
+            self.documents += 1
+
+            if "paragraphs" in counts:
+                self.near_duplicates += 1
+                self.paragraphs += counts["paragraphs"]
+                self.paragraphs_reused += counts["paragraphs"] - counts["paragraphs_reprocessed"]
+
+        return results
+
+
+    def get_stats(self):
+        """
+        Get the number of documents processed, the number which reused the results
+        of a near-duplicate and the fraction of their paragraphs which were reused.
+
+        Returns:
+            A JSON serialisable object.
+        """
+
+        return {
+            "documents": self.documents,
+            "near_duplicates": self.near_duplicates,
+            "paragraphs": self.paragraphs,
+            "paragraphs_reused": self.paragraphs_reused,
+            "reuse_rate": self.near_duplicates / self.documents if self.documents > 0 else 0.0,
+            "paragraph_reuse_rate": self.paragraphs_reused / self.paragraphs if self.paragraphs > 0 else 0.0,
+        }
@@ -19,6 +19,7 @@ from .data import DataSource
 from .logger import logger
 from . import metrics
 from . import utils
+from . import profiles
 
 
 class SourceClassifier():
@@ -47,8 +48,7 @@ class SourceClassifier():
         
         filename = os.path.join(model_path, self.MODEL_FILENAME)
         logger.debug("Loading Source Classifier model: %s", filename)
-        self._tagger = pycrfsuite.Tagger()
-        self._tagger.open(filename)
+        self._tagger = utils.TaggerPool(filename)
     
     
     def predict_sources_and_labels(self, doc, cue_labels, content_labels):
@@ -164,6 +164,8 @@ class SourceClassifier():
         if not os.path.exists(model_path):
             os.makedirs(model_path)
         
+        profiles.save_parser_info(nlp, model_path)
+        
         trainer = pycrfsuite.Trainer(verbose=False)
         
         for doc, quotes, _ in DataSource(nlp, train_path):
@@ -378,8 +380,8 @@ class SourceResolver():
             sentence_section_labels: A list containing an integer label each token in the document.
         
         Returns:
-            A dict mapping each cue to a source span. The cue is represented by a 
-            tuple containing the start and end index.
+            A dict mapping each cue to a (source span, probability) tuple. The cue is 
+            represented by a tuple containing the start and end index.
         """
         
         quote_cue_to_sources_map = {}
@@ -389,8 +391,7 @@ class SourceResolver():
             
             if predicted_source is not None:
                 key = (cue.start, cue.end)  
-                predicted_source._.probability = probability
-                quote_cue_to_sources_map[key] = predicted_source
+                quote_cue_to_sources_map[key] = (predicted_source, probability)
         
         return quote_cue_to_sources_map
     
@@ -489,6 +490,8 @@ class SourceResolver():
         logger.info("Building Source Resolver model using: %s", input_path)
         if not os.path.exists(model_path):
             os.makedirs(model_path)
+        
+        profiles.save_parser_info(nlp, model_path)
          
         features, labels = SourceResolver._get_features_and_labels(nlp, input_path)
         
@@ -0,0 +1,167 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides sessions which extract quotes from a stream of appended
+text, such as a live blog or a transcript, returning only the new quotes.
+"""
+
+from .chunking import get_paragraphs
+from .registry import SpeakerRegistry
+
+
+class StreamSession():
+    """
+    Class which extracts quotes from text which arrives in parts.
+
+    Each time text is appended, the new paragraphs are processed together with
+    the preceding paragraphs (up to context_chars) so that pronouns can be
+    resolved against speakers named shortly before. Names and genders of
+    speakers from earlier in the stream are remembered by a speaker registry
+    belonging to the session.
+
+    Spans in the results refer to the tokens of the complete stream. Only the
+    text needed for the context is kept.
+    """
+
+    DEFAULT_CONTEXT_CHARS = 5000
+
+
+    def __init__(self, citron, context_chars=DEFAULT_CONTEXT_CHARS, stages=None, registry=None):
+        """
+        Constructor.
+
+        Args:
+            citron: A citron.citron.Citron object.
+            context_chars: The maximum length (int) in characters of the preceding
+                paragraphs processed with new text.
+            stages: The stages to run (see citron.citron.get_stages), or None to run
+                all stages. The "entities" stage is not supported.
+            registry: A citron.registry.SpeakerRegistry object, or None to use a
+                new registry for the session.
+        """
+
+        if registry is None:
+            registry = SpeakerRegistry(max_entries=1000, save_interval=None)
+
+        self.citron = citron
+        self.context_chars = context_chars
+        self.stages = stages
+        self.registry = registry
+        # The retained text, starting at character offset self.base of the stream.
+        self.text = ""
+        self.base = 0
+        # The (character offset, token index) in the stream of each retained paragraph.
+        self.paragraphs = []
+        # The token ranges in the stream of the cues of the quotes returned.
+        self.cues = []
+
+
+    def append(self, text):
+        """
+        Append text to the stream and extract the quotes which have not been
+        returned before.
+
+        Args:
+            text: The text (string). New paragraphs should begin with a new line.
+
+        Returns:
+            A JSON serialisable object containing the new quotes.
+        """
+
+        previous_end = self.base + len(self.text)
+        self.text += text
+        self._update_paragraphs()
+
+        if len(self.paragraphs) == 0:
+            return {"quotes": [], "source": self.citron.source}
+
+        # Find the first paragraph containing new text, then include the
+        # preceding paragraphs which fit in the context.
+        first = len(self.paragraphs) - 1
+
+        while first > 0 and self.paragraphs[first][0] > previous_end:
+            first -= 1
+
+        context_start = self.paragraphs[first][0] - self.context_chars
+
+        while first > 0 and self.paragraphs[first - 1][0] >= context_start:
+            first -= 1
+
+        window_start, token_offset = self.paragraphs[first]
+        doc = self.citron.nlp(self.text[window_start - self.base:])
+        quotes = self.citron.get_quotes(doc, stages=self.stages, registry=self.registry)
+        new_quotes = []
+
+        for quote in quotes:
+            quote_json = offset_quote(quote.to_json(), token_offset)
+            cue = quote_json["cue"]
+
+            if not any(cue["start"] < end and start < cue["end"] for start, end in self.cues):
+                self.cues.append((cue["start"], cue["end"]))
+                new_quotes.append(quote_json)
+
+        self._trim(self.paragraphs[-1][0] - self.context_chars)
+        return {"quotes": new_quotes, "source": self.citron.source}
+
+
+    def _update_paragraphs(self):
+        """
+        Tokenize the text from the start of the last paragraph, which may have
+        been extended, and record the start of each paragraph. Paragraphs start
+        after a new line, so the text before them is tokenized identically.
+        """
+
+        if len(self.paragraphs) > 0:
+            start, token_start = self.paragraphs.pop()
+        else:
+            start, token_start = self.base, 0
+
+        tail = self.text[start - self.base:]
+        doc = self.citron.nlp.make_doc(tail)
+        token_indices = {token.idx: token.i for token in doc}
+
+        for paragraph_start, _ in get_paragraphs(tail):
+            self.paragraphs.append((start + paragraph_start, token_start + token_indices[paragraph_start]))
+
+
+    def _trim(self, keep_from):
+        """
+        Discard the paragraphs and cues which precede keep_from, the earliest
+        start of the context of any future text.
+        """
+
+        while len(self.paragraphs) > 1 and self.paragraphs[1][0] <= keep_from:
+            self.paragraphs.pop(0)
+
+        if len(self.paragraphs) > 0:
+            start, token_start = self.paragraphs[0]
+            self.text = self.text[start - self.base:]
+            self.base = start
+            self.cues = [cue for cue in self.cues if cue[1] > token_start]
+
+
+def offset_quote(quote_json, token_offset):
+    """
+    Add a token offset to the spans of a quote.
+
+    Args:
+        quote_json: A JSON serialisable quote from citron.data.Quote.to_json().
+        token_offset: The offset (int).
+
+    Returns:
+        A JSON serialisable quote.
+    """
+
+    def offset_span(span_json):
+        return {"start": span_json["start"] + token_offset, "end": span_json["end"] + token_offset, "text": span_json["text"]}
+
+    offset = dict(quote_json)
+    offset["cue"] = offset_span(quote_json["cue"])
+
+    for key in ("sources", "coreferences", "contents"):
+        offset[key] = [offset_span(span) for span in quote_json[key]]
+
+    return offset
@@ -0,0 +1,441 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides the recycling of worker processes. Replacing the models
+within a process (see citron.lifecycle) resets spaCy's vocabulary, but the
+memory freed is not always returned to the operating system, as the heap may
+be fragmented. A Supervisor therefore runs the work in child processes and
+replaces each one after a number of documents or when its resident memory
+exceeds a limit. The replacement is started and warmed up before the old
+worker is asked to stop, so that the capacity does not drop meanwhile.
+
+The server can be run in supervised worker processes sharing one socket:
+
+    $ python -m citron.supervisor server:app --port 8080 --workers 2
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from .logger import logger
+
+# The state of the current process, when it is a worker started by a Supervisor.
+_worker = None
+
+
+class WorkerState():
+    """
+    Class holding the state shared by a worker process and its supervisor.
+    """
+
+    def __init__(self, context):
+        self.documents = context.Value("q", 0)
+        self.ready = context.Event()
+
+
+def is_worker():
+    """
+    Check whether the current process is a worker started by a Supervisor.
+    """
+
+    return _worker is not None
+
+
+def set_ready():
+    """
+    Tell the supervisor that the current process has loaded and warmed up its
+    models, so that the worker it replaces can be stopped. Does nothing unless
+    the current process is a supervised worker.
+    """
+
+    if _worker is not None:
+        _worker.ready.set()
+
+
+def count_document():
+    """
+    Count a document processed by the current process towards its limit. Does
+    nothing unless the current process is a supervised worker.
+    """
+
+    if _worker is not None:
+        with _worker.documents.get_lock():
+            _worker.documents.value += 1
+
+
+def get_process_rss(pid):
+    """
+    Get the resident set size of a process.
+
+    Returns:
+        The size (int) in bytes, or None if it cannot be read on this platform.
+    """
+
+    try:
+        with open("/proc/{0}/statm".format(pid)) as infile:
+            return int(infile.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _run_worker(state, target, args):
+    global _worker
+    _worker = state
+    target(*args)
+
+
+class Worker():
+    """
+    Class holding a worker process and the times of the changes to its state.
+    """
+
+    def __init__(self, process, state):
+        self.process = process
+        self.state = state
+        self.started = time.monotonic()
+        # Set once the worker is asked to stop.
+        self.stopping = None
+        # The worker started to replace this worker, if any.
+        self.replacement = None
+        # The time before which no replacement is started after a failure.
+        self.retry_after = 0
+
+
+class Supervisor():
+    """
+    Class which runs a target function in worker processes and replaces each
+    worker after max_documents documents, or when its resident memory exceeds
+    max_rss bytes after at least MIN_RSS_DOCUMENTS documents. A worker which
+    exits unexpectedly is restarted.
+
+    The target counts its documents with count_document() and calls set_ready()
+    once warmed up. A worker is stopped with SIGTERM, on which the target should
+    finish the documents in progress and return, and is killed if it has not
+    exited after stop_timeout seconds.
+    """
+
+    MIN_RSS_DOCUMENTS = 100
+    # Seconds before a replacement is attempted again after a failure.
+    RETRY_INTERVAL = 60
+
+
+    def __init__(self, target, args=(), workers=1, max_documents=None, max_rss=None,
+                 ready_timeout=600, stop_timeout=60, poll_interval=1.0):
+        """
+        Constructor.
+
+        Args:
+            target: A picklable function run in each worker process.
+            args: A tuple of picklable arguments of the target.
+            workers: The number (int) of worker processes.
+            max_documents: The number of documents (int) after which a worker is
+                replaced, or None.
+            max_rss: The resident set size (int) in bytes above which a worker is
+                replaced, or None.
+            ready_timeout: Seconds (float) for a replacement to become ready before
+                it is abandoned.
+            stop_timeout: Seconds (float) for a worker to exit before it is killed.
+            poll_interval: Seconds (float) between checks of the workers.
+        """
+
+        self.target = target
+        self.args = args
+        self.workers = workers
+        self.max_documents = max_documents
+        self.max_rss = max_rss
+        self.ready_timeout = ready_timeout
+        self.stop_timeout = stop_timeout
+        self.poll_interval = poll_interval
+        self.recycled = 0
+        self.restarted = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = []
+        self._stopping = False
+
+
+    def start(self):
+        """
+        Start the worker processes.
+        """
+
+        for _ in range(self.workers):
+            self._workers.append(self._start_worker())
+
+
+    def run(self):
+        """
+        Start the worker processes and supervise them until SIGTERM or SIGINT is
+        received, then stop them.
+        """
+
+        def stop(signum, frame):
+            self._stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.start()
+
+        try:
+            while not self._stopping:
+                self.check()
+                time.sleep(self.poll_interval)
+
+        finally:
+            self.stop()
+
+
+    def check(self):
+        """
+        Check each worker, starting a replacement for those which have reached
+        their limits or exited, and stopping those whose replacement is ready.
+        """
+
+        now = time.monotonic()
+
+        for worker in list(self._workers):
+            if worker.stopping is not None:
+                self._check_stopping(worker, now)
+                continue
+
+            if not worker.process.is_alive():
+                logger.error("Worker %d exited unexpectedly with code %s", worker.process.pid, worker.process.exitcode)
+                self._discard(worker.replacement)
+                self._workers.remove(worker)
+                self._workers.append(self._start_worker())
+                self.restarted += 1
+                continue
+
+            if worker.replacement is not None:
+                self._check_replacement(worker, now)
+            elif now >= worker.retry_after and worker.state.ready.is_set() and self._is_exhausted(worker):
+                logger.info("Replacing worker %d after %d documents", worker.process.pid, worker.state.documents.value)
+                worker.replacement = self._start_worker()
+
+
+    def stop(self):
+        """
+        Stop every worker, killing those which have not exited after stop_timeout seconds.
+        """
+
+        workers = []
+
+        for worker in self._workers:
+            workers.append(worker)
+
+            if worker.replacement is not None:
+                workers.append(worker.replacement)
+
+        for worker in workers:
+            self._terminate(worker)
+
+        deadline = time.monotonic() + self.stop_timeout
+
+        for worker in workers:
+            worker.process.join(max(0, deadline - time.monotonic()))
+
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+
+        self._workers = []
+
+
+    def get_stats(self):
+        """
+        Get the state of each worker and the number of workers replaced.
+
+        Returns:
+            A JSON serialisable object.
+        """
+
+        return {
+            "workers": [{
+                "pid": worker.process.pid,
+                "documents": worker.state.documents.value,
+                "rss": get_process_rss(worker.process.pid),
+                "ready": worker.state.ready.is_set(),
+                "stopping": worker.stopping is not None,
+            } for worker in self._workers],
+            "recycled": self.recycled,
+            "restarted": self.restarted,
+        }
+
+
+    def _start_worker(self):
+        state = WorkerState(self._context)
+        process = self._context.Process(target=_run_worker, args=(state, self.target, self.args), name="citron-worker")
+        process.start()
+        logger.info("Started worker %d", process.pid)
+        return Worker(process, state)
+
+
+    def _is_exhausted(self, worker):
+        """
+        Check whether a worker has reached the limits which trigger a replacement.
+        """
+
+        documents = worker.state.documents.value
+
+        if self.max_documents is not None and documents >= self.max_documents:
+            return True
+
+        if self.max_rss is not None and documents >= self.MIN_RSS_DOCUMENTS:
+            rss = get_process_rss(worker.process.pid)
+            return rss is not None and rss > self.max_rss
+
+        return False
+
+
+    def _check_replacement(self, worker, now):
+        """
+        Stop a worker once its replacement is ready, or abandon the replacement
+        if it has failed or not become ready in time.
+        """
+
+        replacement = worker.replacement
+
+        if replacement.state.ready.is_set():
+            index = self._workers.index(worker)
+            self._workers[index] = replacement
+            worker.replacement = None
+            self._terminate(worker)
+            self._workers.append(worker)
+            self.recycled += 1
+            logger.info("Worker %d replaced by worker %d", worker.process.pid, replacement.process.pid)
+
+        elif not replacement.process.is_alive() or now - replacement.started > self.ready_timeout:
+            logger.error("Replacement worker %d did not become ready", replacement.process.pid)
+            self._discard(replacement)
+            worker.replacement = None
+            worker.retry_after = now + self.RETRY_INTERVAL
+
+
+    def _check_stopping(self, worker, now):
+        """
+        Forget a stopped worker once it has exited, killing it after stop_timeout seconds.
+        """
+
+        if worker.process.is_alive() and now - worker.stopping > self.stop_timeout:
+            logger.warning("Killing worker %d which did not stop", worker.process.pid)
+            worker.process.kill()
+
+        if not worker.process.is_alive():
+            worker.process.join()
+            self._workers.remove(worker)
+
+
+    def _terminate(self, worker):
+        if worker.stopping is None:
+            worker.stopping = time.monotonic()
+
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+
+    def _discard(self, worker):
+        if worker is not None:
+            worker.process.kill()
+            worker.process.join()
+
+
+def bind_socket(host, port):
+    """
+    Bind a listening socket to be shared by the worker processes.
+    """
+
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve(app, sock, log_level):
+    """
+    Serve an ASGI application on a shared socket with uvicorn, in a worker process.
+    uvicorn stops accepting connections and finishes the requests in progress on SIGTERM.
+    """
+
+    import uvicorn
+
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve an ASGI application in worker processes which are recycled',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('app',
+      metavar = 'app',
+      type = str,
+      help = 'The application as module:attribute e.g. server:app'
+    )
+    parser.add_argument('-v',
+      action = 'store_true',
+      default = False,
+      help = 'Verbose mode'
+    )
+    parser.add_argument('--host',
+      metavar = 'host',
+      type = str,
+      default = '0.0.0.0',
+      help = 'Host address to listen on'
+    )
+    parser.add_argument('--port',
+      metavar = 'port',
+      type = int,
+      default = 8080,
+      help = 'Port to listen on'
+    )
+    parser.add_argument('--workers',
+      metavar = 'workers',
+      type = int,
+      default = 1,
+      help = 'Number of worker processes'
+    )
+    parser.add_argument('--recycle-documents',
+      metavar = 'recycle_documents',
+      type = int,
+      default = int(os.getenv("CITRON_RECYCLE_DOCUMENTS", "0")) or None,
+      help = 'Replace a worker after this number of documents (default: CITRON_RECYCLE_DOCUMENTS or never)'
+    )
+    parser.add_argument('--recycle-memory',
+      metavar = 'recycle_memory',
+      type = int,
+      default = int(os.getenv("CITRON_RECYCLE_MEMORY", "0")) or None,
+      help = 'Replace a worker above this resident memory in MB (default: CITRON_RECYCLE_MEMORY or never)'
+    )
+    args = parser.parse_args()
+
+    if args.v:
+        logger.setLevel(logging.DEBUG)
+
+    sock = bind_socket(args.host, args.port)
+    supervisor = Supervisor(
+        serve,
+        args=(args.app, sock, "debug" if args.v else "info"),
+        workers=args.workers,
+        max_documents=args.recycle_documents,
+        max_rss=args.recycle_memory * 1024 * 1024 if args.recycle_memory is not None else None
+    )
+    logger.info("Serving %s on %s:%d with %d workers", args.app, args.host, args.port, args.workers)
+    supervisor.run()
+
+
+if __name__ == '__main__':
+    # Run the module imported by the workers, rather than __main__, so that the
+    # workers and the application share its state (see set_ready).
+    from citron import supervisor
+    supervisor.main()
@@ -0,0 +1,652 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This module provides counters, gauges and histograms which can be exposed in
+the Prometheus text format, and the standard metrics of the Citron pipeline.
+"""
+
+import math
+import threading
+
+from . import lifecycle
+from .logger import logger
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+
+class Metric():
+    """
+    Base class for metrics. Values are held for each combination of label values.
+    """
+
+    TYPE = None
+
+
+    def __init__(self, name, description, labels=()):
+        """
+        Constructor.
+
+        Args:
+            name: The metric name (string).
+            description: The help text (string).
+            labels: A tuple of label names (strings).
+        """
+
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+
+    def _get_key(self, label_values):
+        """
+        Get the key for a dict of label values.
+        """
+
+        return tuple(str(label_values[label]) for label in self.labels)
+
+
+    def _format_labels(self, key, extra=None):
+        """
+        Format a key (and optional extra label) in the Prometheus text format.
+        """
+
+        pairs = list(zip(self.labels, key))
+
+        if extra is not None:
+            pairs.append(extra)
+
+        if len(pairs) == 0:
+            return ""
+
+        escaped = []
+
+        for label, value in pairs:
+            value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+            escaped.append('{0}="{1}"'.format(label, value))
+
+        return "{" + ",".join(escaped) + "}"
+
+
+    def render(self):
+        """
+        Get the metric in the Prometheus text format.
+
+        Returns:
+            A list of lines (strings).
+        """
+
+        lines = [
+            "# HELP {0} {1}".format(self.name, self.description),
+            "# TYPE {0} {1}".format(self.name, self.TYPE),
+        ]
+
+        with self._lock:
+            items = sorted(self._values.items())
+
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+
+        return lines
+
+
+    def _render_value(self, key, value):
+        return ["{0}{1} {2}".format(self.name, self._format_labels(key), format_value(value))]
+
+
+class Counter(Metric):
+    """
+    A value which only increases.
+    """
+
+    TYPE = "counter"
+
+
+    def inc(self, amount=1, **label_values):
+        """
+        Increase the counter.
+
+        Args:
+            amount: The amount (number) to add.
+            label_values: The value of each label.
+        """
+
+        key = self._get_key(label_values)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+    def set(self, value, **label_values):
+        """
+        Set the counter, for counts which are maintained elsewhere.
+
+        Args:
+            value: The value (number).
+            label_values: The value of each label.
+        """
+
+        key = self._get_key(label_values)
+
+        with self._lock:
+            self._values[key] = value
+
+
+    def get(self, **label_values):
+        return self._values.get(self._get_key(label_values), 0)
+
+
+class Gauge(Metric):
+    """
+    A value which may increase or decrease.
+    """
+
+    TYPE = "gauge"
+
+
+    def set(self, value, **label_values):
+        """
+        Set the gauge.
+
+        Args:
+            value: The value (number).
+            label_values: The value of each label.
+        """
+
+        key = self._get_key(label_values)
+
+        with self._lock:
+            self._values[key] = value
+
+
+    def inc(self, amount=1, **label_values):
+        """
+        Increase the gauge.
+
+        Args:
+            amount: The amount (number) to add.
+            label_values: The value of each label.
+        """
+
+        key = self._get_key(label_values)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+    def dec(self, amount=1, **label_values):
+        """
+        Decrease the gauge.
+
+        Args:
+            amount: The amount (number) to subtract.
+            label_values: The value of each label.
+        """
+
+        self.inc(-amount, **label_values)
+
+
+    def get(self, **label_values):
+        return self._values.get(self._get_key(label_values), 0)
+
+
+class Histogram(Metric):
+    """
+    A distribution of observed values counted in cumulative buckets.
+    """
+
+    TYPE = "histogram"
+
+
+    def __init__(self, name, description, buckets, labels=()):
+        """
+        Constructor.
+
+        Args:
+            name: The metric name (string).
+            description: The help text (string).
+            buckets: A sorted tuple of bucket upper bounds (numbers).
+            labels: A tuple of label names (strings).
+        """
+
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+
+    def observe(self, value, **label_values):
+        """
+        Record an observed value.
+
+        Args:
+            value: The value (number).
+            label_values: The value of each label.
+        """
+
+        key = self._get_key(label_values)
+
+        with self._lock:
+            entry = self._values.get(key)
+
+            if entry is None:
+                entry = {"counts": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+                self._values[key] = entry
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["counts"][i] += 1
+
+            entry["count"] += 1
+            entry["sum"] += value
+
+
+    def _render_value(self, key, entry):
+        lines = []
+
+        for bound, count in zip(self.buckets, entry["counts"]):
+            labels = self._format_labels(key, ("le", format_value(bound)))
+            lines.append("{0}_bucket{1} {2}".format(self.name, labels, count))
+
+        labels = self._format_labels(key, ("le", "+Inf"))
+        lines.append("{0}_bucket{1} {2}".format(self.name, labels, entry["count"]))
+        lines.append("{0}_sum{1} {2}".format(self.name, self._format_labels(key), format_value(entry["sum"])))
+        lines.append("{0}_count{1} {2}".format(self.name, self._format_labels(key), entry["count"]))
+        return lines
+
+
+class MetricsRegistry():
+    """
+    A collection of metrics which can be rendered together.
+    """
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+
+    def register(self, metric):
+        """
+        Add a metric.
+
+        Args:
+            metric: A citron.telemetry.Metric object.
+
+        Returns:
+            The metric.
+        """
+
+        with self._lock:
+            self._metrics.append(metric)
+
+        return metric
+
+
+    def add_collector(self, collector):
+        """
+        Add a function which is called before the metrics are rendered, to
+        update metrics from values maintained elsewhere.
+
+        Args:
+            collector: A function taking no arguments.
+        """
+
+        with self._lock:
+            self._collectors.append(collector)
+
+
+    def counter(self, name, description, labels=()):
+        return self.register(Counter(name, description, labels))
+
+
+    def gauge(self, name, description, labels=()):
+        return self.register(Gauge(name, description, labels))
+
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS, labels=()):
+        return self.register(Histogram(name, description, buckets, labels))
+
+
+    def render(self):
+        """
+        Get all the metrics in the Prometheus text format.
+
+        Returns:
+            A string.
+        """
+
+        lines = []
+
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        for collector in collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("Metrics collector failed")
+
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+
+class PipelineMetrics():
+    """
+    Class providing the metrics of the Citron pipeline, fed by the
+    instrumentation hook of a citron.citron.Citron object.
+    """
+
+    def __init__(self, registry):
+        """
+        Constructor.
+
+        Args:
+            registry: A citron.telemetry.MetricsRegistry object.
+        """
+
+        self.documents = registry.counter(
+            "citron_documents_total",
+            "Documents processed by the pipeline."
+        )
+        self.document_tokens = registry.histogram(
+            "citron_document_tokens",
+            "Length of each document in tokens.",
+            TOKEN_BUCKETS
+        )
+        self.document_seconds = registry.histogram(
+            "citron_document_seconds",
+            "Wall-clock time taken to process each document."
+        )
+        self.stage_seconds = registry.histogram(
+            "citron_stage_seconds",
+            "Wall-clock time taken by each stage of the pipeline.",
+            labels=("stage",)
+        )
+        self.stage_cpu_seconds = registry.counter(
+            "citron_stage_cpu_seconds_total",
+            "CPU time taken by each stage of the pipeline.",
+            labels=("stage",)
+        )
+        self.items = registry.counter(
+            "citron_items_total",
+            "Items found or processed by the pipeline e.g. cues, quotes, candidate pairs.",
+            labels=("item",)
+        )
+
+
+    def record(self, stats):
+        """
+        Record the stats of one document. Suitable for citron.citron.Citron.add_hook().
+
+        Args:
+            stats: A JSON serialisable object from citron.instrumentation.DocumentProfile.to_json().
+        """
+
+        self.documents.inc()
+        self.document_seconds.observe(stats["total"]["wall"])
+
+        for stage, timing in stats["stages"].items():
+            self.stage_seconds.observe(timing["wall"], stage=stage)
+            self.stage_cpu_seconds.inc(timing["cpu"], stage=stage)
+
+        for item, count in stats["counts"].items():
+            if item == "tokens":
+                self.document_tokens.observe(count)
+            else:
+                self.items.inc(count, item=item)
+
+
+class CacheMetrics():
+    """
+    Class providing the metrics of a citron.cache.ResultCache object.
+    """
+
+    def __init__(self, registry, cache):
+        """
+        Constructor.
+
+        Args:
+            registry: A citron.telemetry.MetricsRegistry object.
+            cache: A citron.cache.ResultCache object.
+        """
+
+        self.cache = cache
+        self.hits = registry.counter(
+            "citron_cache_hits_total",
+            "Results found in the cache.",
+            labels=("tier",)
+        )
+        self.misses = registry.counter(
+            "citron_cache_misses_total",
+            "Results not found in the cache."
+        )
+        self.entries = registry.gauge(
+            "citron_cache_entries",
+            "Results held in the in-memory cache."
+        )
+        self.bytes = registry.gauge(
+            "citron_cache_bytes",
+            "Size of the results held in the in-memory cache."
+        )
+        registry.add_collector(self.collect)
+
+
+    def collect(self):
+        """
+        Update the metrics from the cache's stats.
+        """
+
+        stats = self.cache.get_stats()
+        self.hits.set(stats["memory_hits"], tier="memory")
+        self.hits.set(stats["disk_hits"], tier="disk")
+        self.misses.set(stats["misses"])
+        self.entries.set(stats["entries"])
+        self.bytes.set(stats["bytes"])
+
+
+class NearDuplicateMetrics():
+    """
+    Class providing the metrics of named citron.similarity.NearDuplicateExtractor
+    objects, one for each model served.
+    """
+
+    def __init__(self, registry, extractors):
+        """
+        Constructor.
+
+        Args:
+            registry: A citron.telemetry.MetricsRegistry object.
+            extractors: A dict of citron.similarity.NearDuplicateExtractor objects,
+                keyed by the name (string) of their model.
+        """
+
+        self.extractors = extractors
+        self.documents = registry.counter(
+            "citron_near_duplicate_documents_total",
+            "Documents checked for a near-duplicate.",
+            labels=("model",)
+        )
+        self.near_duplicates = registry.counter(
+            "citron_near_duplicates_total",
+            "Documents which reused the results of a near-duplicate.",
+            labels=("model",)
+        )
+        self.paragraphs = registry.counter(
+            "citron_near_duplicate_paragraphs_total",
+            "Paragraphs of documents which reused the results of a near-duplicate.",
+            labels=("model", "reused")
+        )
+        self.indexed = registry.gauge(
+            "citron_near_duplicate_index_documents",
+            "Documents held in the near-duplicate index.",
+            labels=("model",)
+        )
+        registry.add_collector(self.collect)
+
+
+    def collect(self):
+        """
+        Update the metrics from the extractors' stats.
+        """
+
+        for model, extractor in self.extractors.items():
+            stats = extractor.get_stats()
+            self.documents.set(stats["documents"], model=model)
+            self.near_duplicates.set(stats["near_duplicates"], model=model)
+            self.paragraphs.set(stats["paragraphs_reused"], model=model, reused="true")
+            self.paragraphs.set(stats["paragraphs"] - stats["paragraphs_reused"], model=model, reused="false")
+            self.indexed.set(len(extractor.index), model=model)
+
+
+class SchedulerMetrics():
+    """
+    Class providing the metrics of a citron.scheduler.Scheduler object.
+    """
+
+    def __init__(self, registry, scheduler):
+        """
+        Constructor.
+
+        Args:
+            registry: A citron.telemetry.MetricsRegistry object.
+            scheduler: A citron.scheduler.Scheduler object.
+        """
+
+        self.scheduler = scheduler
+        self.tasks = registry.gauge(
+            "citron_scheduler_tasks",
+            "Extraction tasks queued or running in each lane.",
+            labels=("lane", "state")
+        )
+        registry.add_collector(self.collect)
+
+
+    def collect(self):
+        """
+        Update the metrics from the scheduler's stats.
+        """
+
+        for lane, counts in self.scheduler.get_stats().items():
+            for state, count in counts.items():
+                self.tasks.set(count, lane=lane, state=state)
+
+
+class ModelMetrics():
+    """
+    Class providing the metrics of named citron.lifecycle.ModelSlot objects, one
+    for each model served, and the process's resident memory.
+    """
+
+    def __init__(self, registry, slots):
+        """
+        Constructor.
+
+        Args:
+            registry: A citron.telemetry.MetricsRegistry object.
+            slots: A dict of citron.lifecycle.ModelSlot objects, keyed by the name
+                (string) of their model.
+        """
+
+        self.slots = slots
+        self.generation = registry.gauge(
+            "citron_model_generation",
+            "Generation of the current models, counting from 0 for the models loaded at startup.",
+            labels=("model",)
+        )
+        self.documents = registry.gauge(
+            "citron_model_documents",
+            "Documents processed by the current models.",
+            labels=("model",)
+        )
+        self.replacements = registry.counter(
+            "citron_model_replacements_total",
+            "Replacements of the models by newly loaded models.",
+            labels=("model",)
+        )
+        self.resident_bytes = registry.gauge(
+            "citron_process_resident_memory_bytes",
+            "Resident memory of the server process."
+        )
+        registry.add_collector(self.collect)
+
+
+    def collect(self):
+        """
+        Update the metrics from the slots' stats.
+        """
+
+        for model, slot in self.slots.items():
+            stats = slot.get_stats()
+            self.generation.set(stats["generation"], model=model)
+            self.documents.set(stats["documents"], model=model)
+            self.replacements.set(stats["replacements"], model=model)
+
+        self.resident_bytes.set(lifecycle.get_rss())
+
+
+class CaptureMetrics():
+    """
+    Class providing the metrics of a citron.capture.RequestCapture object.
+    """
+
+    def __init__(self, registry, capture):
+        """
+        Constructor.
+
+        Args:
+            registry: A citron.telemetry.MetricsRegistry object.
+            capture: A citron.capture.RequestCapture object.
+        """
+
+        self.capture = capture
+        self.documents = registry.counter(
+            "citron_capture_documents_total",
+            "Sampled documents written to the capture file, or dropped.",
+            labels=("state",)
+        )
+        registry.add_collector(self.collect)
+
+
+    def collect(self):
+        """
+        Update the metrics from the capture's stats.
+        """
+
+        for state, count in self.capture.get_stats().items():
+            self.documents.set(count, state=state)
+
+
+def format_value(value):
+    """
+    Format a number in the Prometheus text format.
+
+    Args:
+        value: A number.
+
+    Returns:
+        A string.
+    """
+
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+
+        if math.isnan(value):
+            return "NaN"
+
+        return repr(value)
+
+    return str(value)
@@ -7,41 +7,309 @@
 This module provides utility functions.
 """
 
+from contextlib import contextmanager
 import os
+import threading
+import time
 
+import pycrfsuite
 import spacy
 from spacy.tokens import Span
 
 from .logger import logger
 
-
-def get_parser(use_gpu = None, use_small = None):
-    """
-    Loads a spaCy pipeline and adds extension functions.
+try:
+    import threadpoolctl
+except ImportError:
+    threadpoolctl = None
+
+# Environment variables read by the BLAS and OpenMP libraries when they are loaded.
+THREAD_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+DEFAULT_PARSER_PROFILE = {
+    "model": "en_core_web_trf",
+    "use_gpu": None,
+    "threads": None,
+    "batch_size": None,
+    "exclude": [],
+}
+
+
+def get_parser(use_gpu = None, use_small = None, profile = None):
+    """
+    Loads a spaCy pipeline and adds extension functions. Citron's features read
+    the tags, lemmas, POS, dependencies and entities of every stage, so only
+    components which duplicate these (e.g. the senter of "en_core_web_sm", as
+    the parser sets the sentence boundaries) may be named in the exclude setting.
+    
+    Args:
+        use_gpu: True to use a GPU when one is available, or False or None to
+            use the CPU.
+        use_small: True to use "en_core_web_sm" rather than "en_core_web_trf".
+        profile: A dict which overrides settings in DEFAULT_PARSER_PROFILE, or None.
+            The settings are:
+                model: The name (string) of the spaCy model.
+                use_gpu: As above. Overridden by the use_gpu argument.
+                threads: The number of threads (int) used by torch, BLAS and OpenMP
+                    (see set_thread_budget), or None for the libraries' defaults.
+                batch_size: The number of documents (int) in each batch, or None.
+                exclude: A list of component names (strings) not to load.
 
     Returns:
         A spaCy Language object.
     """
-
-    model = "en_core_web_trf"
+    
+    settings = dict(DEFAULT_PARSER_PROFILE)
+    
+    if profile is not None:
+        settings.update(profile)
+    
     if use_small:
-        model = "en_core_web_sm"
-    if use_gpu:
-        logger.info("Requiring GPU")
-        spacy.require_gpu()
-
+        settings["model"] = "en_core_web_sm"
+    
+    if use_gpu is not None:
+        settings["use_gpu"] = use_gpu
+    
+    model = settings["model"]
+    
+    if not settings["use_gpu"]:
+        logger.info("Using CPU")
+    
+    elif spacy.prefer_gpu():
+        logger.info("Using GPU")
+    
+    else:
+        logger.warning("GPU requested but unavailable, using CPU")
+    
+    if settings["threads"] is not None:
+        set_thread_budget(settings["threads"])
+    
     logger.info("Loading spacy model: %s", model)
-    nlp = spacy.load(model)
+    nlp = spacy.load(model, exclude=settings["exclude"])
+    
+    if settings["batch_size"] is not None:
+        nlp.batch_size = settings["batch_size"]
+    
+    logger.info("Active spacy components: %s", ", ".join(nlp.pipe_names))
 
     to_json = lambda span: {"start": span.start, "end": span.end, "text": span.text}
 
-    Span.set_extension("to_json", method=to_json)
-    Span.set_extension("probability", default=None, force=True)
+    Span.set_extension("to_json", method=to_json, force=True)
     Span.set_extension("is_plural",   default=None, force=True)
     Span.set_extension("gender",      default=None, force=True)
     return nlp
 
 
+def set_thread_budget(threads):
+    """
+    Limit the threads used for the computation of each document by torch and by
+    the BLAS and OpenMP libraries, so that several workers on one machine do not
+    oversubscribe its CPUs. The BLAS and OpenMP limits require threadpoolctl,
+    which is installed with scikit-learn, and also apply to libraries loaded
+    later through the environment variables.
+
+    Args:
+        threads: The number of threads (int).
+    """
+
+    for name in THREAD_VARIABLES:
+        os.environ[name] = str(threads)
+
+    if threadpoolctl is not None:
+        threadpoolctl.threadpool_limits(threads)
+
+    try:
+        import torch
+
+    except ImportError:
+        logger.debug("Torch is not installed, ignoring thread count")
+
+    else:
+        torch.set_num_threads(threads)
+
+        try:
+            torch.set_num_interop_threads(threads)
+
+        except RuntimeError:
+            # Only possible before torch has run any parallel work.
+            logger.debug("Unable to set the torch inter-op threads after their first use")
+
+    logger.info("Thread settings: %s", get_thread_settings())
+
+
+@contextmanager
+def thread_environment(threads):
+    """
+    Set the BLAS and OpenMP environment variables within a context, e.g. while
+    starting worker processes which load the libraries.
+
+    Args:
+        threads: The number of threads (int), or None to leave the variables unchanged.
+    """
+
+    if threads is None:
+        yield
+        return
+
+    previous = {name: os.environ.get(name) for name in THREAD_VARIABLES}
+
+    for name in THREAD_VARIABLES:
+        os.environ[name] = str(threads)
+
+    try:
+        yield
+
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def get_thread_settings():
+    """
+    Get the effective numbers of threads of the libraries used by the current process.
+
+    Returns:
+        A JSON serialisable dict with the number of CPUs, the torch intra-op and
+        inter-op threads, if torch is installed, and the threads of each BLAS and
+        OpenMP library loaded, if threadpoolctl is installed.
+    """
+
+    settings = {"cpus": os.cpu_count()}
+
+    try:
+        import torch
+
+    except ImportError:
+        pass
+
+    else:
+        settings["torch"] = torch.get_num_threads()
+        settings["torch_interop"] = torch.get_num_interop_threads()
+
+    if threadpoolctl is not None:
+        for info in threadpoolctl.threadpool_info():
+            settings[info["internal_api"]] = info["num_threads"]
+
+    return settings
+
+
+class TaggerPool():
+    """
+    Class providing a CRFsuite tagger for each thread, as a pycrfsuite.Tagger
+    object cannot be used by several threads at once. Each thread's tagger is
+    opened when the thread first uses it.
+    """
+    
+    def __init__(self, filename):
+        """
+        Constructor. The model is opened once to check it can be loaded.
+        
+        Args:
+            filename: The path (string) to a CRFsuite model file.
+        """
+        
+        self.filename = filename
+        self._local = threading.local()
+        self.get_tagger()
+    
+    
+    def get_tagger(self):
+        """
+        Get the calling thread's tagger.
+        
+        Returns:
+            A pycrfsuite.Tagger object.
+        """
+        
+        tagger = getattr(self._local, "tagger", None)
+        
+        if tagger is None:
+            tagger = pycrfsuite.Tagger()
+            tagger.open(self.filename)
+            self._local.tagger = tagger
+        
+        return tagger
+    
+    
+    def tag(self, features):
+        """
+        Predict the labels of a sequence using the calling thread's tagger.
+        
+        Args:
+            features: A list containing the features of each item in the sequence.
+        
+        Returns:
+            A list of labels (strings).
+        """
+        
+        return self.get_tagger().tag(features)
+
+
+def parse_with_timings(nlp, text):
+    """
+    Parse a text, timing each component of the spaCy pipeline.
+    
+    Args:
+        nlp: A spaCy Language object.
+        text: The text (string).
+    
+    Returns:
+        A tuple containing:
+            doc: A spaCy Doc object.
+            timings: A dict mapping each component name (and "tokenizer") to
+                the wall-clock time taken in seconds (float).
+    """
+    
+    timings = {}
+    start = time.perf_counter()
+    doc = nlp.make_doc(text)
+    timings["tokenizer"] = time.perf_counter() - start
+    
+    for name, component in nlp.pipeline:
+        start = time.perf_counter()
+        doc = component(doc)
+        timings[name] = time.perf_counter() - start
+    
+    return doc, timings
+
+
+def log_component_timings(nlp, texts):
+    """
+    Parse a list of texts and log the total time taken by each component of
+    the spaCy pipeline.
+    
+    Args:
+        nlp: A spaCy Language object.
+        texts: A list of texts (strings).
+    
+    Returns:
+        A dict mapping each component name to the total time in seconds (float).
+    """
+    
+    totals = {}
+    
+    for text in texts:
+        timings = parse_with_timings(nlp, text)[1]
+        
+        for name, duration in timings.items():
+            totals[name] = totals.get(name, 0.0) + duration
+    
+    for name, duration in totals.items():
+        logger.info("Component %s: %.3fs", name, duration)
+    
+    return totals
+
+
 def get_files(path):
     """
     Get a list of JSON file paths using a recursive search of the supplied path.    
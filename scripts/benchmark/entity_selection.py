@@ -0,0 +1,155 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This application measures the time taken to select the named entities of a
+document (see citron.citron.select_entities) for documents with increasing
+numbers of entity mentions, compared with the original scan of the names seen
+so far, and checks that both select the same entities.
+"""
+
+import argparse
+import logging
+import random
+import string
+import time
+
+from citron.citron import DESIRED_LABELS, select_entities
+from citron.logger import logger
+
+LABELS = sorted(DESIRED_LABELS) + ["DATE", "CARDINAL"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the time taken to select the named entities of a document',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('-v',
+      action = 'store_true',
+      default = False,
+      help = 'Verbose mode'
+    )
+    parser.add_argument('--mentions',
+      metavar = 'mentions',
+      type = str,
+      default = '60,300,900,3000',
+      help = 'Comma separated numbers of entity mentions per document'
+    )
+    parser.add_argument('--repeats',
+      metavar = 'repeats',
+      type = int,
+      default = 20,
+      help = 'Number of times each document is processed'
+    )
+    parser.add_argument('--seed',
+      metavar = 'seed',
+      type = int,
+      default = 1,
+      help = 'Seed of the random generator'
+    )
+    args = parser.parse_args()
+
+    if args.v:
+        logger.setLevel(logging.DEBUG)
+
+    generator = random.Random(args.seed)
+    print("{0:>9} {1:>9} {2:>13} {3:>13} {4:>9}".format("Mentions", "Selected", "Baseline ms", "Current ms", "Speedup"))
+
+    for mentions in [int(number) for number in args.mentions.split(",") if number.strip() != ""]:
+        entities = get_entities(generator, mentions)
+        expected = select_entities_by_scan(entities)
+
+        if select_entities(entities) != expected:
+            logger.error("The selected entities differ for %d mentions", mentions)
+            return
+
+        baseline = get_time(select_entities_by_scan, entities, args.repeats)
+        current = get_time(select_entities, entities, args.repeats)
+        print("{0:>9} {1:>9} {2:>13.3f} {3:>13.3f} {4:>8.1f}x".format(
+            mentions, len(expected), baseline * 1000, current * 1000, baseline / current
+        ))
+
+
+def get_entities(generator, mentions):
+    """
+    Get the entity mentions of a synthetic document. About a third of the names
+    are new, and the rest repeat earlier names or their last word, as the later
+    mentions of a speaker do.
+
+    Returns:
+        A list of (label, text, start) tuples.
+    """
+
+    names = []
+    entities = []
+
+    for i in range(mentions):
+        choice = generator.random()
+
+        if len(names) == 0 or choice < 0.35:
+            words = [get_word(generator) for _ in range(generator.randint(1, 4))]
+            name = " ".join(words)
+            names.append(name)
+        elif choice < 0.7:
+            name = generator.choice(names).split(" ")[-1]
+        else:
+            name = generator.choice(names)
+
+        entities.append((generator.choice(LABELS), name, i * 10))
+
+    return entities
+
+
+def get_word(generator):
+    return generator.choice(string.ascii_uppercase) + "".join(
+        generator.choice(string.ascii_lowercase) for _ in range(generator.randint(2, 9))
+    )
+
+
+def select_entities_by_scan(entities):
+    """
+    Select the entities as Citron originally did, by scanning the names seen so far.
+    """
+
+    seen = {}
+    results = []
+
+    for label, entityName, start in entities:
+        if label in DESIRED_LABELS and entityName not in seen:
+            should_add = True
+            for text in seen.keys():
+                # If this is a substring, skip it
+                if entityName in text:
+                    should_add = False
+                    break
+            seen[entityName] = True
+
+            if should_add:
+                results.append({"Label": label, "Text": entityName, "Start": start})
+
+    return results
+
+
+def get_time(function, entities, repeats):
+    """
+    Get the best time in seconds (float) taken by a function over the repeats.
+    """
+
+    best = None
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(entities)
+        seconds = time.perf_counter() - start
+
+        if best is None or seconds < best:
+            best = seconds
+
+    return best
+
+
+if __name__ == '__main__':
+    main()
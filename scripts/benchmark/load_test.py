@@ -0,0 +1,639 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This application drives a running Citron server with documents from a corpus
+and reports the latency, throughput and error rate of its /quotes endpoint,
+with the per-stage metrics scraped from the server, optionally saving the
+results as JSON for comparison across commits.
+
+Requests are either sent by a fixed number of clients, each sending its next
+request when the previous one completes, or arrive at a fixed average rate. In
+the latter case latency is measured from each request's scheduled arrival, so
+that time spent waiting for a free client is included.
+"""
+
+import argparse
+from datetime import datetime, timezone
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.parse
+
+from citron.logger import logger
+
+SHORT = "short"
+LONG = "long"
+METRIC_PATTERN = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+LABEL_PATTERN = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load test a Citron server',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('-v',
+      action = 'store_true',
+      default = False,
+      help = 'Verbose mode'
+    )
+    parser.add_argument('--url',
+      metavar = 'url',
+      type = str,
+      default = 'http://localhost:8080',
+      help = 'URL of the Citron server'
+    )
+    parser.add_argument('--input-path',
+      metavar = 'input_path',
+      type = str,
+      required = True,
+      help = 'Path to a corpus of JSON files with a "text" key, or text files with one document per line'
+    )
+    parser.add_argument('--concurrency',
+      metavar = 'concurrency',
+      type = int,
+      default = 4,
+      help = 'Number of concurrent clients'
+    )
+    parser.add_argument('--rate',
+      metavar = 'rate',
+      type = float,
+      help = 'Average number of requests per second, arriving at random (default: each client sends its next request when the previous one completes)'
+    )
+    parser.add_argument('--requests',
+      metavar = 'requests',
+      type = int,
+      default = 1000,
+      help = 'Number of requests to send'
+    )
+    parser.add_argument('--duration',
+      metavar = 'duration',
+      type = float,
+      help = 'Number of seconds to send requests for, instead of a number of requests'
+    )
+    parser.add_argument('--warmup',
+      metavar = 'warmup',
+      type = int,
+      default = 10,
+      help = 'Number of requests sent before measuring'
+    )
+    parser.add_argument('--short-chars',
+      metavar = 'short_chars',
+      type = int,
+      default = 2000,
+      help = 'Maximum characters of a short document'
+    )
+    parser.add_argument('--long-fraction',
+      metavar = 'long_fraction',
+      type = float,
+      help = 'Fraction of requests with a long document (default: as in the corpus)'
+    )
+    parser.add_argument('--stages',
+      metavar = 'stages',
+      type = str,
+      help = 'Comma separated stages to request (default: all stages)'
+    )
+    parser.add_argument('--deadline',
+      metavar = 'deadline',
+      type = float,
+      help = 'Deadline in seconds of each request (default: no deadline)'
+    )
+    parser.add_argument('--model',
+      metavar = 'model',
+      type = str,
+      help = 'Name of the model to request (default: the default model)'
+    )
+    parser.add_argument('--priority',
+      metavar = 'priority',
+      type = str,
+      help = 'Priority of the requests: high, normal or low (default: normal)'
+    )
+    parser.add_argument('--timeout',
+      metavar = 'timeout',
+      type = float,
+      default = 120,
+      help = 'Seconds to wait for each response'
+    )
+    parser.add_argument('--seed',
+      metavar = 'seed',
+      type = int,
+      default = 1,
+      help = 'Seed for the choice of documents and arrival times'
+    )
+    parser.add_argument('--label',
+      metavar = 'label',
+      type = str,
+      help = 'Label recorded with the results, e.g. the change being measured'
+    )
+    parser.add_argument('--output-file',
+      metavar = 'output_file',
+      type = str,
+      help = 'Path to a JSON file for the results (default: not saved)'
+    )
+    args = parser.parse_args()
+
+    if args.v:
+        logger.setLevel(logging.DEBUG)
+
+    texts = load_corpus(args.input_path)
+
+    if len(texts) == 0:
+        logger.error("No documents found in: %s", args.input_path)
+        return
+
+    client = Client(args.url, args.stages, args.deadline, args.model, args.priority, args.timeout)
+    documents = DocumentSampler(texts, args.short_chars, args.long_fraction, args.seed)
+    logger.info("Loaded %d short and %d long documents", len(documents.texts[SHORT]), len(documents.texts[LONG]))
+
+    for _ in range(args.warmup):
+        client.send(documents.choose()[1])
+
+    before = client.get_metrics()
+
+    if args.rate is None:
+        results, seconds = run_closed(client, documents, args.concurrency, args.requests, args.duration)
+    else:
+        results, seconds = run_open(client, documents, args.concurrency, args.rate, args.requests, args.duration, args.seed)
+
+    after = client.get_metrics()
+
+    report = {
+        "label": args.label,
+        "commit": get_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "settings": vars(args),
+        "results": summarise(results, seconds),
+        "server": get_server_stats(before, after),
+    }
+
+    print_report(report)
+
+    if args.output_file is not None:
+        with open(args.output_file, "w", encoding="utf-8") as outfile:
+            json.dump(report, outfile, indent=2)
+
+        logger.info("Saved the results to: %s", args.output_file)
+
+
+def load_corpus(path):
+    """
+    Load documents from JSON files with a "text" key, or text files containing one
+    document per line, found by a recursive search of a path.
+    """
+
+    filenames = []
+
+    if os.path.isdir(path):
+        for root, _, names in os.walk(path):
+            filenames.extend(os.path.join(root, name) for name in names)
+    else:
+        filenames.append(path)
+
+    texts = []
+
+    for filename in sorted(filenames):
+        if filename.endswith(".json"):
+            with open(filename, encoding="utf-8") as infile:
+                data = json.load(infile)
+
+            if isinstance(data, dict) and isinstance(data.get("text"), str) and data["text"].strip() != "":
+                texts.append(data["text"])
+
+        elif filename.endswith(".txt"):
+            with open(filename, encoding="utf-8") as infile:
+                texts.extend(line.strip() for line in infile if line.strip() != "")
+
+    return texts
+
+
+def get_commit():
+    """
+    Get the git commit of this copy of Citron, or None if it is not known.
+    """
+
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        return output.stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class DocumentSampler():
+    """
+    Class which chooses documents at random, with a given fraction of long documents.
+    """
+
+    def __init__(self, texts, short_chars, long_fraction=None, seed=1):
+        self.texts = {SHORT: [], LONG: []}
+
+        for text in texts:
+            self.texts[SHORT if len(text) <= short_chars else LONG].append(text)
+
+        self.all_texts = texts
+        self.short_chars = short_chars
+        self.long_fraction = long_fraction
+        self.generator = random.Random(seed)
+        self._lock = threading.Lock()
+
+
+    def choose(self):
+        """
+        Returns:
+            A (length, text) tuple, where the length is SHORT or LONG.
+        """
+
+        with self._lock:
+            if self.long_fraction is None or len(self.texts[SHORT]) == 0 or len(self.texts[LONG]) == 0:
+                text = self.generator.choice(self.all_texts)
+                return (SHORT if len(text) <= self.short_chars else LONG), text
+
+            length = LONG if self.generator.random() < self.long_fraction else SHORT
+            return length, self.generator.choice(self.texts[length])
+
+
+class Client():
+    """
+    Class which sends requests to a Citron server, with one connection per thread.
+    """
+
+    def __init__(self, url, stages=None, deadline=None, model=None, priority=None, timeout=120):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.secure = parsed.scheme == "https"
+        self.path = parsed.path.rstrip("/")
+        self.stages = stages
+        self.deadline = deadline
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json"}
+
+        if model is not None:
+            self.headers["X-Citron-Model"] = model
+
+        if priority is not None:
+            self.headers["X-Citron-Priority"] = priority
+
+        self._local = threading.local()
+
+
+    def send(self, text):
+        """
+        Send a document to the /quotes endpoint.
+
+        Returns:
+            A (status, partial) tuple, where the status is the HTTP status (int), or
+            None if no response was received, and partial is True if optional stages
+            were skipped.
+        """
+
+        document = {"text": text}
+
+        if self.stages is not None:
+            document["stages"] = self.stages
+
+        if self.deadline is not None:
+            document["deadline"] = self.deadline
+
+        status, body = self.post(document)
+        return status, status == 200 and b'"partial":true' in body.replace(b" ", b"")
+
+
+    def post(self, document, headers=None):
+        """
+        Send a document to the /quotes endpoint.
+
+        Args:
+            document: A dict with a "text" key and optional "stages", "deadline" and
+                "model" keys.
+            headers: A dict of headers which override the client's headers, or None.
+
+        Returns:
+            A (status, body) tuple, where the status is the HTTP status (int), or None
+            if no response was received, and the body is bytes.
+        """
+
+        try:
+            return self._request("POST", "/quotes", json.dumps(document).encode("utf-8"), dict(self.headers, **(headers or {})))
+
+        except (OSError, http.client.HTTPException) as err:
+            logger.debug("Request failed: %s", err)
+            self._local.connection = None
+            return None, b""
+
+
+    def get_metrics(self):
+        """
+        Get the server's metrics.
+
+        Returns:
+            A dict of values (floats) keyed by (name, labels) tuples, where the labels
+            are a sorted tuple of (name, value) tuples, or None if the metrics are not
+            available.
+        """
+
+        try:
+            status, body = self._request("GET", "/metrics")
+
+        except (OSError, http.client.HTTPException) as err:
+            logger.warning("Unable to get the server metrics: %s", err)
+            self._local.connection = None
+            return None
+
+        if status != 200:
+            logger.warning("Unable to get the server metrics: HTTP %d", status)
+            return None
+
+        return parse_metrics(body.decode("utf-8"))
+
+
+    def _request(self, method, path, body=None, headers=None):
+        connection = getattr(self._local, "connection", None)
+
+        if connection is not None:
+            try:
+                return self._send(connection, method, path, body, headers)
+
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed the idle connection, so retry on a new one.
+                connection.close()
+
+        connection_class = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+        connection = connection_class(self.host, self.port, timeout=self.timeout)
+        self._local.connection = connection
+        return self._send(connection, method, path, body, headers)
+
+
+    def _send(self, connection, method, path, body, headers):
+        connection.request(method, self.path + path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+
+
+def run_closed(client, documents, concurrency, requests, duration=None):
+    """
+    Send requests from a number of clients, each sending its next request when the
+    previous one completes.
+
+    Returns:
+        A list of (length, status, partial, latency) tuples and the elapsed seconds.
+    """
+
+    results = []
+    lock = threading.Lock()
+    counter = iter(range(requests)) if duration is None else None
+    start = time.perf_counter()
+
+    def run():
+        while True:
+            if counter is None:
+                if time.perf_counter() - start >= duration:
+                    return
+
+            else:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+
+            length, text = documents.choose()
+            sent = time.perf_counter()
+            status, partial = client.send(text)
+
+            with lock:
+                results.append((length, status, partial, time.perf_counter() - sent))
+
+    run_threads(run, concurrency)
+    return results, time.perf_counter() - start
+
+
+def run_open(client, documents, concurrency, rate, requests, duration=None, seed=1):
+    """
+    Send requests arriving at random with an average rate, using a number of clients.
+    Requests which arrive while every client is busy wait for a free client.
+
+    Returns:
+        A list of (length, status, partial, latency) tuples and the elapsed seconds.
+    """
+
+    results = []
+    lock = threading.Lock()
+    arrivals = queue.Queue()
+    generator = random.Random(seed)
+    start = time.perf_counter()
+
+    def run():
+        while True:
+            arrival = arrivals.get()
+
+            if arrival is None:
+                return
+
+            length, text = documents.choose()
+            status, partial = client.send(text)
+
+            with lock:
+                results.append((length, status, partial, time.perf_counter() - arrival))
+
+    threads = start_threads(run, concurrency)
+    scheduled = start
+    sent = 0
+
+    while (duration is None and sent < requests) or (duration is not None and scheduled - start < duration):
+        scheduled += generator.expovariate(rate)
+        delay = scheduled - time.perf_counter()
+
+        if delay > 0:
+            time.sleep(delay)
+
+        arrivals.put(scheduled)
+        sent += 1
+
+    for _ in threads:
+        arrivals.put(None)
+
+    for thread in threads:
+        thread.join()
+
+    return results, time.perf_counter() - start
+
+
+def start_threads(function, count):
+    threads = [threading.Thread(target=function, daemon=True) for _ in range(count)]
+
+    for thread in threads:
+        thread.start()
+
+    return threads
+
+
+def run_threads(function, count):
+    for thread in start_threads(function, count):
+        thread.join()
+
+
+def get_percentile(values, percentile):
+    """
+    Get a percentile of sorted values, interpolating between the closest ranks.
+    """
+
+    if len(values) == 0:
+        return None
+
+    rank = (len(values) - 1) * percentile / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def get_latency_stats(latencies):
+    latencies = sorted(latencies)
+
+    return {
+        "requests": len(latencies),
+        "mean": sum(latencies) / len(latencies) if len(latencies) > 0 else None,
+        "p50": get_percentile(latencies, 50),
+        "p95": get_percentile(latencies, 95),
+        "p99": get_percentile(latencies, 99),
+        "max": latencies[-1] if len(latencies) > 0 else None,
+    }
+
+
+def summarise(results, seconds):
+    """
+    Summarise the results of the requests. Latencies are those of successful requests.
+    """
+
+    errors = {}
+
+    for _, status, _, _ in results:
+        if status != 200:
+            key = "no response" if status is None else str(status)
+            errors[key] = errors.get(key, 0) + 1
+
+    succeeded = [result for result in results if result[1] == 200]
+
+    return {
+        "requests": len(results),
+        "seconds": seconds,
+        "throughput": len(succeeded) / seconds if seconds > 0 else 0.0,
+        "errors": sum(errors.values()),
+        "error_rate": sum(errors.values()) / len(results) if len(results) > 0 else 0.0,
+        "errors_by_status": errors,
+        "partial": sum(1 for result in succeeded if result[2]),
+        "latency": get_latency_stats([result[3] for result in succeeded]),
+        "latency_by_length": {
+            length: get_latency_stats([result[3] for result in succeeded if result[0] == length])
+            for length in (SHORT, LONG)
+        },
+    }
+
+
+def parse_metrics(text):
+    """
+    Parse metrics in the Prometheus text format.
+    """
+
+    metrics = {}
+
+    for line in text.splitlines():
+        match = METRIC_PATTERN.match(line.strip())
+
+        if match is None or line.startswith("#"):
+            continue
+
+        name, labels, value = match.groups()
+        labels = tuple(sorted(LABEL_PATTERN.findall(labels or "")))
+
+        try:
+            metrics[(name, labels)] = float(value)
+        except ValueError:
+            continue
+
+    return metrics
+
+
+def get_server_stats(before, after):
+    """
+    Get the documents processed by the server and the time taken by each stage
+    between two scrapes of its metrics.
+    """
+
+    if before is None or after is None:
+        return None
+
+    def delta(name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        return after.get(key, 0.0) - before.get(key, 0.0)
+
+    documents = delta("citron_document_seconds_count")
+    stages = {}
+
+    for name, labels in after:
+        if name == "citron_stage_seconds_count":
+            stage = dict(labels)["stage"]
+            count = delta("citron_stage_seconds_count", stage=stage)
+
+            if count > 0:
+                stages[stage] = {
+                    "documents": count,
+                    "mean_seconds": delta("citron_stage_seconds_sum", stage=stage) / count,
+                    "cpu_seconds_per_document": delta("citron_stage_cpu_seconds_total", stage=stage) / count,
+                }
+
+    return {
+        "documents": documents,
+        "mean_document_seconds": delta("citron_document_seconds_sum") / documents if documents > 0 else None,
+        "partial_results": delta("citron_partial_results_total"),
+        "cache_misses": delta("citron_cache_misses_total"),
+        "cache_hits": delta("citron_cache_hits_total", tier="memory") + delta("citron_cache_hits_total", tier="disk"),
+        "stages": stages,
+    }
+
+
+def print_report(report):
+    results = report["results"]
+    print("Requests:   {0} in {1:.1f} seconds".format(results["requests"], results["seconds"]))
+    print("Throughput: {0:.2f} requests per second".format(results["throughput"]))
+    print("Errors:     {0} ({1:.2%}) {2}".format(results["errors"], results["error_rate"], results["errors_by_status"] or ""))
+    print("Partial:    {0}".format(results["partial"]))
+    print()
+    print("{0:<10} {1:>9} {2:>9} {3:>9} {4:>9} {5:>9}".format("Latency", "Requests", "p50", "p95", "p99", "Max"))
+
+    rows = [("all", results["latency"])] + list(results["latency_by_length"].items())
+
+    for name, stats in rows:
+        if stats["requests"] > 0:
+            print("{0:<10} {1:>9} {2:>9.3f} {3:>9.3f} {4:>9.3f} {5:>9.3f}".format(
+                name, stats["requests"], stats["p50"], stats["p95"], stats["p99"], stats["max"]
+            ))
+
+    server = report["server"]
+
+    if server is not None and len(server["stages"]) > 0:
+        print()
+        print("{0:<14} {1:>9} {2:>12} {3:>12}".format("Stage", "Documents", "Mean (s)", "CPU (s)"))
+
+        for stage, stats in sorted(server["stages"].items()):
+            print("{0:<14} {1:>9.0f} {2:>12.4f} {3:>12.4f}".format(
+                stage, stats["documents"], stats["mean_seconds"], stats["cpu_seconds_per_document"]
+            ))
+
+
+if __name__ == '__main__':
+    main()
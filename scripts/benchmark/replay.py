@@ -0,0 +1,270 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This application replays the documents captured by a Citron server (see the
+CITRON_CAPTURE_PATH environment variable) through a Citron server or an
+in-process Citron object, at the original rate, an accelerated rate or as fast
+as possible. It reports the latency of each document and can save the quotes
+found, so that the latency and output before and after a change can be compared.
+"""
+
+import argparse
+import json
+import logging
+import queue
+import time
+
+from citron import profiles
+from citron.capture import read_captures
+from citron.deadline import Deadline
+from citron.logger import logger
+
+from load_test import SHORT, LONG, Client, get_latency_stats, print_report, start_threads, summarise
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay captured documents through Citron',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('-v',
+      action = 'store_true',
+      default = False,
+      help = 'Verbose mode'
+    )
+    parser.add_argument('--capture-path',
+      metavar = 'capture_path',
+      type = str,
+      required = True,
+      help = 'Path to the capture file. Rotated files are read first'
+    )
+    parser.add_argument('--url',
+      metavar = 'url',
+      type = str,
+      help = 'URL of a Citron server (default: replay in-process)'
+    )
+    parser.add_argument('--profile',
+      metavar = 'profile',
+      choices = sorted(profiles.PROFILES),
+      default = profiles.DEFAULT_PROFILE,
+      help = 'Profile to load when replaying in-process'
+    )
+    parser.add_argument('--model-path',
+      metavar = 'model_path',
+      type = str,
+      help = "Path to the Citron model directory when replaying in-process (default: the profile's model)"
+    )
+    parser.add_argument('--speed',
+      metavar = 'speed',
+      type = float,
+      default = 1.0,
+      help = 'Replay speed relative to the original arrivals e.g. 2 for twice as fast, or 0 for as fast as possible'
+    )
+    parser.add_argument('--concurrency',
+      metavar = 'concurrency',
+      type = int,
+      default = 4,
+      help = 'Number of documents processed concurrently'
+    )
+    parser.add_argument('--limit',
+      metavar = 'limit',
+      type = int,
+      help = 'Maximum number of documents to replay (default: all)'
+    )
+    parser.add_argument('--short-chars',
+      metavar = 'short_chars',
+      type = int,
+      default = 2000,
+      help = 'Maximum characters of a short document, for reporting'
+    )
+    parser.add_argument('--output-file',
+      metavar = 'output_file',
+      type = str,
+      help = 'Path to an NDJSON file for the latency and quotes of each document (default: not saved)'
+    )
+    parser.add_argument('--compare-file',
+      metavar = 'compare_file',
+      type = str,
+      help = 'Path to the output file of a previous replay to compare with (default: no comparison)'
+    )
+    args = parser.parse_args()
+
+    if args.v:
+        logger.setLevel(logging.DEBUG)
+
+    records = []
+
+    for record in read_captures(args.capture_path):
+        if args.limit is not None and len(records) >= args.limit:
+            break
+
+        records.append(record)
+
+    if len(records) == 0:
+        logger.error("No captured documents found in: %s", args.capture_path)
+        return
+
+    logger.info("Replaying %d documents", len(records))
+
+    if args.url is not None:
+        process = get_http_processor(Client(args.url))
+    else:
+        process = get_citron_processor(profiles.load_citron(args.profile, args.model_path))
+
+    outputs, seconds = replay(records, process, args.speed, args.concurrency)
+
+    results = [
+        (SHORT if len(records[output["index"]]["text"]) <= args.short_chars else LONG, output["status"], output["partial"], output["latency"])
+        for output in outputs
+    ]
+    print_report({"results": summarise(results, seconds), "server": None})
+
+    if args.compare_file is not None:
+        print()
+        compare(outputs, load_outputs(args.compare_file))
+
+    if args.output_file is not None:
+        with open(args.output_file, "w", encoding="utf-8") as outfile:
+            for output in outputs:
+                outfile.write(json.dumps(output, ensure_ascii=False) + "\n")
+
+        logger.info("Saved the outputs to: %s", args.output_file)
+
+
+def get_http_processor(client):
+    """
+    Get a function which processes a captured document with a Citron server.
+    """
+
+    def process(record):
+        document = {key: record[key] for key in ("text", "stages", "deadline", "model") if record.get(key) is not None}
+        headers = {"X-Citron-Priority": record["priority"]} if record.get("priority") is not None else None
+        status, body = client.post(document, headers)
+
+        if status != 200:
+            return status, None
+
+        return status, json.loads(body)
+
+    return process
+
+
+def get_citron_processor(citron):
+    """
+    Get a function which processes a captured document with a Citron object. The
+    captured model name is ignored.
+    """
+
+    def process(record):
+        deadline = Deadline(float(record["deadline"])) if record.get("deadline") is not None else None
+
+        try:
+            return 200, citron.extract(record["text"], stages=record.get("stages"), deadline=deadline)
+
+        except ValueError as err:
+            logger.debug("Unable to process a document: %s", err)
+            return 400, None
+
+    return process
+
+
+def replay(records, process, speed, concurrency):
+    """
+    Process the records at their original arrival times divided by the speed, or
+    as fast as possible if the speed is 0. Latency is measured from the scheduled
+    arrival, so that time spent waiting for a free worker is included.
+
+    Returns:
+        A list of dicts with "index", "status", "partial", "latency" and "quotes"
+        keys, in the order of the records, and the elapsed seconds.
+    """
+
+    outputs = [None] * len(records)
+    arrivals = queue.Queue()
+    start = time.perf_counter()
+
+    def run():
+        while True:
+            item = arrivals.get()
+
+            if item is None:
+                return
+
+            index, scheduled = item
+            status, results = process(records[index])
+            latency = time.perf_counter() - (scheduled if scheduled is not None else start)
+
+            outputs[index] = {
+                "index": index,
+                "status": status,
+                "partial": results is not None and results.get("partial", False),
+                "latency": latency,
+                "quotes": results.get("quotes") if results is not None else None,
+            }
+
+    threads = start_threads(run, concurrency)
+    first = records[0]["time"]
+
+    for index, record in enumerate(records):
+        scheduled = None
+
+        if speed > 0:
+            scheduled = start + (record["time"] - first) / speed
+            delay = scheduled - time.perf_counter()
+
+            if delay > 0:
+                time.sleep(delay)
+
+        arrivals.put((index, scheduled))
+
+    for _ in threads:
+        arrivals.put(None)
+
+    for thread in threads:
+        thread.join()
+
+    return outputs, time.perf_counter() - start
+
+
+def load_outputs(path):
+    with open(path, encoding="utf-8") as infile:
+        return {output["index"]: output for output in map(json.loads, infile) if output is not None}
+
+
+def compare(outputs, previous):
+    """
+    Print the latency of the documents processed successfully in both replays, and
+    the number whose quotes differ.
+    """
+
+    pairs = [
+        (output, previous[output["index"]])
+        for output in outputs
+        if output["index"] in previous and output["status"] == 200 and previous[output["index"]]["status"] == 200
+    ]
+
+    if len(pairs) == 0:
+        print("No documents to compare")
+        return
+
+    print("{0:<10} {1:>9} {2:>9} {3:>9} {4:>9}".format("Latency", "Mean", "p50", "p95", "p99"))
+
+    for name, stats in (
+        ("previous", get_latency_stats([old["latency"] for _, old in pairs])),
+        ("current", get_latency_stats([new["latency"] for new, _ in pairs])),
+    ):
+        print("{0:<10} {1:>9.3f} {2:>9.3f} {3:>9.3f} {4:>9.3f}".format(name, stats["mean"], stats["p50"], stats["p95"], stats["p99"]))
+
+    differing = [new["index"] for new, old in pairs if new["quotes"] != old["quotes"]]
+    print()
+    print("Documents compared: {0}, with different quotes: {1}".format(len(pairs), len(differing)))
+
+    if len(differing) > 0:
+        logger.info("Documents with different quotes: %s", ", ".join(str(index) for index in differing[:20]))
+
+
+if __name__ == '__main__':
+    main()
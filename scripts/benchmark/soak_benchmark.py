@@ -0,0 +1,219 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This application runs a long stream of documents through Citron in a worker
+process and reports the resident memory of the worker and the size of its spaCy
+StringStore as it goes, with and without the recycling of the worker process
+(see citron.supervisor).
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import signal
+import string
+import time
+
+from citron import profiles
+from citron import supervisor
+from citron.logger import logger
+
+# Seconds between checks of the worker process.
+POLL_INTERVAL = 0.5
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Soak test Citron and report its memory use',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('-v',
+      action = 'store_true',
+      default = False,
+      help = 'Verbose mode'
+    )
+    parser.add_argument('--input-path',
+      metavar = 'input_path',
+      type = str,
+      required = True,
+      help = 'Path to a text file, or directory of text files, containing one document per line'
+    )
+    parser.add_argument('--profile',
+      metavar = 'profile',
+      choices = sorted(profiles.PROFILES),
+      default = profiles.DEFAULT_PROFILE,
+      help = 'Profile to load'
+    )
+    parser.add_argument('--model-path',
+      metavar = 'model_path',
+      type = str,
+      help = "Path to the Citron model directory (default: the profile's model)"
+    )
+    parser.add_argument('--documents',
+      metavar = 'documents',
+      type = int,
+      default = 10000,
+      help = 'Number of documents to process, cycling through the input'
+    )
+    parser.add_argument('--novel-words',
+      metavar = 'novel_words',
+      type = int,
+      default = 5,
+      help = 'Number of randomly generated words added to each document, simulating new names'
+    )
+    parser.add_argument('--report-interval',
+      metavar = 'report_interval',
+      type = int,
+      default = 500,
+      help = 'Number of documents between reports'
+    )
+    parser.add_argument('--recycle-documents',
+      metavar = 'recycle_documents',
+      type = int,
+      help = 'Replace the worker process after this number of documents (default: never)'
+    )
+    parser.add_argument('--recycle-memory',
+      metavar = 'recycle_memory',
+      type = int,
+      help = 'Replace the worker process when its resident memory exceeds this number of MB (default: never)'
+    )
+    args = parser.parse_args()
+
+    if args.v:
+        logger.setLevel(logging.DEBUG)
+
+    texts = load_texts(args.input_path)
+
+    if len(texts) == 0:
+        logger.error("No documents found in: %s", args.input_path)
+        return
+
+    # The documents are shared by the worker and its replacement.
+    context = multiprocessing.get_context("spawn")
+    documents = context.Queue(maxsize=10)
+    reports = context.Queue()
+    pool = supervisor.Supervisor(
+        run_worker,
+        args=(args.profile, args.model_path, texts[:2], documents, reports),
+        max_documents=args.recycle_documents,
+        max_rss=args.recycle_memory * 1024 * 1024 if args.recycle_memory is not None else None,
+        poll_interval=POLL_INTERVAL
+    )
+    pool.start()
+
+    generator = random.Random(1)
+    start = time.perf_counter()
+    sent = 0
+    done = 0
+    strings = 0
+    checked = 0
+    print("{0:>10} {1:>10} {2:>12} {3:>14} {4:>9}".format("Documents", "Seconds", "RSS (MB)", "StringStore", "Recycled"))
+
+    try:
+        while done < args.documents:
+            if time.perf_counter() - checked > POLL_INTERVAL:
+                pool.check()
+                checked = time.perf_counter()
+
+            if sent < args.documents:
+                text = texts[sent % len(texts)]
+
+                if args.novel_words > 0:
+                    text += " " + " ".join(get_novel_word(generator) for _ in range(args.novel_words)) + "."
+
+                try:
+                    documents.put(text, timeout=POLL_INTERVAL)
+                    sent += 1
+                except queue.Full:
+                    pass
+
+            try:
+                while True:
+                    strings = reports.get(timeout=0 if sent < args.documents else POLL_INTERVAL)
+                    done += 1
+
+                    if done % args.report_interval == 0 or done == args.documents:
+                        print("{0:>10} {1:>10.1f} {2:>12.1f} {3:>14} {4:>9}".format(
+                            done,
+                            time.perf_counter() - start,
+                            get_worker_rss(pool) / (1024 * 1024),
+                            strings,
+                            pool.recycled
+                        ))
+            except queue.Empty:
+                pass
+
+    finally:
+        pool.stop()
+
+
+def run_worker(profile, model_path, warmup_texts, documents, reports):
+    """
+    Load Citron in a worker process, then extract the quotes from documents until
+    asked to stop, reporting the size of the StringStore after each document.
+    """
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    citron = profiles.load_citron(profile, model_path)
+
+    for text in warmup_texts:
+        citron.extract(text)
+
+    supervisor.set_ready()
+
+    while len(stopping) == 0:
+        try:
+            text = documents.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            continue
+
+        citron.extract(text)
+        supervisor.count_document()
+        reports.put(len(citron.nlp.vocab.strings))
+
+
+def get_worker_rss(pool):
+    """
+    Get the resident memory in bytes of the worker processes, excluding those stopping.
+    """
+
+    return sum(worker["rss"] or 0 for worker in pool.get_stats()["workers"] if not worker["stopping"])
+
+
+def load_texts(path):
+    """
+    Load documents from a text file, or the text files in a directory, containing one document per line.
+    """
+
+    if os.path.isdir(path):
+        filenames = [os.path.join(path, entry) for entry in sorted(os.listdir(path)) if entry.endswith(".txt")]
+    else:
+        filenames = [path]
+
+    texts = []
+
+    for filename in filenames:
+        with open(filename, encoding="utf-8") as infile:
+            texts.extend(line.strip() for line in infile if line.strip() != "")
+
+    return texts
+
+
+def get_novel_word(generator):
+    """
+    Get a random capitalised word, which is unlikely to be in the vocabulary.
+    """
+
+    length = generator.randint(4, 10)
+    return generator.choice(string.ascii_uppercase) + "".join(generator.choice(string.ascii_lowercase) for _ in range(length))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This application measures the throughput of Citron on one machine with several
+worker processes, each with a thread budget for torch, BLAS and OpenMP, for
+each combination of a list of worker counts and a list of thread budgets, so
+that the combination which does not oversubscribe the CPUs can be chosen.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+import multiprocessing
+import time
+
+from citron import profiles
+from citron import utils
+from citron.logger import logger
+
+from load_test import get_commit, get_latency_stats
+from soak_benchmark import load_texts
+
+# The Citron object of a worker process, loaded by load_worker().
+_worker_citron = None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the throughput of Citron for combinations of workers and threads',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('-v',
+      action = 'store_true',
+      default = False,
+      help = 'Verbose mode'
+    )
+    parser.add_argument('--input-path',
+      metavar = 'input_path',
+      type = str,
+      required = True,
+      help = 'Path to a text file, or directory of text files, containing one document per line'
+    )
+    parser.add_argument('--profile',
+      metavar = 'profile',
+      choices = sorted(profiles.PROFILES),
+      default = profiles.DEFAULT_PROFILE,
+      help = 'Profile to load'
+    )
+    parser.add_argument('--model-path',
+      metavar = 'model_path',
+      type = str,
+      help = "Path to the Citron model directory (default: the profile's model)"
+    )
+    parser.add_argument('--workers',
+      metavar = 'workers',
+      type = str,
+      default = '1,2,4',
+      help = 'Comma separated numbers of worker processes'
+    )
+    parser.add_argument('--threads',
+      metavar = 'threads',
+      type = str,
+      default = '1,2,4',
+      help = 'Comma separated thread budgets of each worker'
+    )
+    parser.add_argument('--documents',
+      metavar = 'documents',
+      type = int,
+      default = 200,
+      help = 'Number of documents processed for each combination, cycling through the input'
+    )
+    parser.add_argument('--output-file',
+      metavar = 'output_file',
+      type = str,
+      help = 'Path to a JSON file for the results (default: not saved)'
+    )
+    args = parser.parse_args()
+
+    if args.v:
+        logger.setLevel(logging.DEBUG)
+
+    texts = load_texts(args.input_path)
+
+    if len(texts) == 0:
+        logger.error("No documents found in: %s", args.input_path)
+        return
+
+    texts = [texts[i % len(texts)] for i in range(args.documents)]
+    results = []
+    print("{0:>8} {1:>8} {2:>12} {3:>12} {4:>9} {5:>9}   {6}".format(
+        "Workers", "Threads", "Docs/second", "Chars/second", "p50", "p95", "Effective threads"
+    ))
+
+    for workers in get_numbers(args.workers):
+        for threads in get_numbers(args.threads):
+            result = run(texts, args.profile, args.model_path, workers, threads)
+            results.append(result)
+            print("{0:>8} {1:>8} {2:>12.2f} {3:>12.0f} {4:>9.3f} {5:>9.3f}   {6}".format(
+                workers,
+                threads,
+                result["documents_per_second"],
+                result["characters_per_second"],
+                result["latency"]["p50"],
+                result["latency"]["p95"],
+                result["thread_settings"]
+            ))
+
+    if args.output_file is not None:
+        with open(args.output_file, "w", encoding="utf-8") as outfile:
+            json.dump({"commit": get_commit(), "settings": vars(args), "results": results}, outfile, indent=2)
+
+        logger.info("Saved the results to: %s", args.output_file)
+
+
+def get_numbers(value):
+    return [int(number) for number in value.split(",") if number.strip() != ""]
+
+
+def load_worker(profile, model_path, threads, warmup_texts):
+    """
+    Load the models in a worker process with a thread budget.
+    """
+
+    global _worker_citron
+    _worker_citron = profiles.load_citron(profile, model_path, {"threads": threads})
+
+    for text in warmup_texts:
+        _worker_citron.extract(text)
+
+
+def get_worker_settings():
+    return utils.get_thread_settings()
+
+
+def extract(text):
+    """
+    Extract the quotes from a text in a worker process.
+
+    Returns:
+        The number of seconds (float) taken.
+    """
+
+    start = time.perf_counter()
+    _worker_citron.extract(text)
+    return time.perf_counter() - start
+
+
+def run(texts, profile, model_path, workers, threads):
+    """
+    Process the texts with a number of worker processes, each with a thread budget.
+    """
+
+    logger.info("Starting %d workers with %d threads each", workers, threads)
+
+    with utils.thread_environment(threads):
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=load_worker,
+            initargs=(profile, model_path, threads, texts[:2])
+        )
+
+        # Wait for every worker to load its models before measuring.
+        settings = [future.result() for future in [executor.submit(get_worker_settings) for _ in range(workers)]]
+
+    try:
+        start = time.perf_counter()
+        latencies = list(executor.map(extract, texts))
+        seconds = time.perf_counter() - start
+
+    finally:
+        executor.shutdown()
+
+    return {
+        "workers": workers,
+        "threads": threads,
+        "seconds": seconds,
+        "documents_per_second": len(texts) / seconds,
+        "characters_per_second": sum(len(text) for text in texts) / seconds,
+        "latency": get_latency_stats(latencies),
+        "thread_settings": settings[0],
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -11,9 +11,21 @@ import argparse
 import logging
 
 from citron.citron import Citron
+from citron import profiles
 from citron import utils
 from citron.logger import logger
 
+METRIC_NAMES = [
+    ("cue_exact", "Cue Span exact F1"),
+    ("cue_overlap", "Cue Span overlap F1"),
+    ("source_exact", "Source Spans exact F1"),
+    ("source_overlap", "Source Spans overlap F1"),
+    ("content_exact", "Content Spans exact F1"),
+    ("content_overlap", "Content Spans overlap F1"),
+    ("quote_exact", "All Quote Spans exact F1"),
+    ("quote_overlap", "All Quote Spans overlap F1"),
+]
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -28,8 +40,7 @@ def main():
     parser.add_argument('--model-path', 
       metavar = 'model_path',
       type = str,
-      required=True,
-      help = 'Path to the Citron model directory'
+      help = 'Path to the Citron model directory (default: the model of each profile)'
     )
     parser.add_argument("--test-path",
       metavar = "test_path",
@@ -37,15 +48,72 @@ def main():
       required=True,
       help = "Path to file or directory containing Citron annotation format test data (default: no testing)"
     )
+    parser.add_argument("--profiles",
+      metavar = "profiles",
+      nargs = "+",
+      choices = sorted(profiles.PROFILES),
+      help = "Profiles to compare side by side (default: evaluate the model path with the default parser)"
+    )
     args = parser.parse_args()
     
     if args.v:
         logger.setLevel(logging.DEBUG)
 
-    logger.info("Evaluating Citron using: %s", args.test_path)    
-    nlp = utils.get_parser()
-    citron = Citron(args.model_path, nlp)    
-    citron.evaluate(args.test_path)
+    logger.info("Evaluating Citron using: %s", args.test_path)
+    
+    if not args.profiles:
+        if args.model_path is None:
+            logger.error("Must specify model_path and/or profiles")
+            return
+        
+        nlp = utils.get_parser()
+        citron = Citron(args.model_path, nlp)    
+        citron.evaluate(args.test_path)
+        return
+    
+    if args.model_path is not None and len(args.profiles) > 1:
+        logger.error("A model_path can only be used with a single profile")
+        return
+    
+    results = {}
+    
+    for name in args.profiles:
+        citron = profiles.load_citron(name, args.model_path)
+        results[name] = citron.evaluate(args.test_path, verbose=False)
+    
+    print_comparison(results)
+
+
+def print_comparison(results):
+    """
+    Print the scores and throughput of each profile side by side.
+    
+    Args:
+        results: A dict mapping each profile name to the results of citron.metrics.evaluate.
+    """
+    
+    names = list(results)
+    print("{0:28}".format("Profile") + "".join("{0:>12}".format(name) for name in names))
+    
+    for key, label in METRIC_NAMES:
+        row = "{0:28}".format(label)
+        
+        for name in names:
+            row += "{0:>12.4f}".format(results[name][key][2])
+        
+        print(row)
+    
+    row = "{0:28}".format("Documents/sec")
+    
+    for name in names:
+        result = results[name]
+        
+        if result["seconds"] > 0:
+            row += "{0:>12.2f}".format(result["documents"] / result["seconds"])
+        else:
+            row += "{0:>12}".format("-")
+    
+    print(row)
 
 
 if __name__ == '__main__':
@@ -12,6 +12,7 @@ import logging
 
 from citron.coreference import CoreferenceResolver
 from citron import utils
+from citron import profiles
 from citron import gender
 from citron.logger import logger
 
@@ -42,17 +43,24 @@ def main():
       required=True, 
       help = "Path to the Citron model directory"
     )
+    parser.add_argument("--profile",
+      metavar = "profile",
+      type = str,
+      choices = sorted(profiles.PROFILES),
+      default = profiles.DEFAULT_PROFILE,
+      help = "Profile whose spaCy model is used to parse the data"
+    )
     args = parser.parse_args()
     
     if args.v:
         logger.setLevel(logging.DEBUG)
     
-    nlp = utils.get_parser()
+    nlp = utils.get_parser(profile = profiles.get_profile(args.profile)["parser"])
 
     gender_resolver = gender.ForenameGenderClassifier()
     
     if args.train_path:
-        CoreferenceResolver.build_model(nlp, args.train_path, args.model_path)
+        CoreferenceResolver.build_model(nlp, gender_resolver, args.train_path, args.model_path)
     
     if args.test_path:
         coreference_resolver = CoreferenceResolver(args.model_path)
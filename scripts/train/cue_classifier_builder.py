@@ -14,6 +14,7 @@ import os
 from citron.cue import CueClassifier
 from citron.logger import logger
 from citron import utils
+from citron import profiles
 
 
 def main():
@@ -47,12 +48,19 @@ def main():
       type = str,
       help = 'Path to Verbnet directory (required if training)'
     )
+    parser.add_argument("--profile",
+      metavar = "profile",
+      type = str,
+      choices = sorted(profiles.PROFILES),
+      default = profiles.DEFAULT_PROFILE,
+      help = "Profile whose spaCy model is used to parse the data"
+    )
     args = parser.parse_args()
     
     if args.v:
         logger.setLevel(logging.DEBUG)
     
-    nlp = utils.get_parser()
+    nlp = utils.get_parser(profile = profiles.get_profile(args.profile)["parser"])
     
     if args.train_path:        
         CueClassifier.build_model(
@@ -0,0 +1,122 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+This application builds a complete set of Citron models for each profile,
+parsing the training data with the profile's spaCy model. Existing model
+directories are not overwritten unless requested.
+"""
+
+import argparse
+import logging
+import os
+
+from citron.cue import CueClassifier
+from citron.content import ContentClassifier
+from citron.content import ContentResolver
+from citron.source import SourceClassifier
+from citron.source import SourceResolver
+from citron.coreference import CoreferenceResolver
+from citron.logger import logger
+from citron import gender
+from citron import profiles
+from citron import utils
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the Citron models of one or more profiles",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("-v",
+      action = "store_true",
+      default = False,
+      help = "Verbose mode"
+    )
+    parser.add_argument("--train-path",
+      metavar = "train_path",
+      type = str,
+      required=True,
+      help = "Path to file or directory containing Citron format training data"
+    )
+    parser.add_argument("--coreference-train-path",
+      metavar = "coreference_train_path",
+      type = str,
+      help = "Optional: Path to Citron format training data with coreference groups (default: train_path)"
+    )
+    parser.add_argument('--verbnet-path',
+      metavar = 'verbnet_path',
+      type = str,
+      required=True,
+      help = 'Path to Verbnet directory'
+    )
+    parser.add_argument("--profiles",
+      metavar = "profiles",
+      nargs = "+",
+      choices = sorted(profiles.PROFILES),
+      required=True,
+      help = "Profiles to build"
+    )
+    parser.add_argument("--output-path",
+      metavar = "output_path",
+      type = str,
+      help = "Optional: Directory in which a model directory is created for each profile (default: the profiles' model directories)"
+    )
+    parser.add_argument("--overwrite",
+      action = "store_true",
+      default = False,
+      help = "Replace the models in existing model directories"
+    )
+    args = parser.parse_args()
+
+    if args.v:
+        logger.setLevel(logging.DEBUG)
+
+    model_paths = {name: get_model_path(name, args.output_path) for name in args.profiles}
+
+    for name, model_path in model_paths.items():
+        if os.path.exists(model_path) and not args.overwrite:
+            logger.error("Model directory already exists: %s. Use --overwrite to replace its models", model_path)
+            return
+
+    coreference_train_path = args.coreference_train_path or args.train_path
+    gender_resolver = gender.ForenameGenderClassifier()
+
+    for name, model_path in model_paths.items():
+        profile = profiles.get_profile(name)
+        logger.info("Building profile %s: %s", name, model_path)
+
+        nlp = utils.get_parser(profile = profile["parser"])
+        CueClassifier.build_model(nlp, args.train_path, model_path, args.verbnet_path)
+        ContentClassifier.build_model(nlp, args.train_path, model_path)
+        ContentResolver.build_model(nlp, args.train_path, model_path)
+        SourceClassifier.build_model(nlp, args.train_path, model_path)
+        SourceResolver.build_model(nlp, args.train_path, model_path)
+        CoreferenceResolver.build_model(nlp, gender_resolver, coreference_train_path, model_path)
+
+
+def get_model_path(name, output_path):
+    """
+    Get the directory in which to build the models of a profile.
+
+    Args:
+        name: The name (string) of the profile.
+        output_path: The path (string) to a directory for the model directories,
+            or None to use the profile's model directory.
+
+    Returns:
+        A string.
+    """
+
+    model_path = profiles.get_profile(name)["model_path"]
+
+    if output_path is None:
+        return model_path
+
+    return os.path.join(output_path, os.path.basename(model_path))
+
+
+if __name__ == "__main__":
+    main()
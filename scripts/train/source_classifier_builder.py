@@ -13,6 +13,7 @@ import logging
 from citron.source import SourceClassifier
 from citron.logger import logger
 from citron import utils
+from citron import profiles
 
 
 def main():
@@ -41,12 +42,19 @@ def main():
       required=True, 
       help = "Path to the Citron model directory"
     )
+    parser.add_argument("--profile",
+      metavar = "profile",
+      type = str,
+      choices = sorted(profiles.PROFILES),
+      default = profiles.DEFAULT_PROFILE,
+      help = "Profile whose spaCy model is used to parse the data"
+    )
     args = parser.parse_args()
     
     if args.v:
         logger.setLevel(logging.DEBUG)
     
-    nlp = utils.get_parser()
+    nlp = utils.get_parser(profile = profiles.get_profile(args.profile)["parser"])
     
     if args.train_path:
         SourceClassifier.build_model(nlp, args.train_path, args.model_path)
@@ -3,40 +3,882 @@
 #
 # License: Apache-2.0
 
+import asyncio
+from contextlib import asynccontextmanager
+import functools
+import gzip
+import hmac
+import json
 import logging
 import os
+import signal
+import time
+import urllib.parse
+from typing import Optional
 
-from citron.utils import get_parser
-from citron.citron import Citron
+from citron.utils import get_parser, get_thread_settings
+from citron.citron import Citron, get_stages
+from citron.chunking import DocumentTooLongError, check_length
+from citron.jobs import JobQueue, JobQueueFullError
+from citron.streaming import StreamSession
+from citron.parallel import ParallelExtractor
+from citron.cache import ResultCache
+from citron.similarity import MinHashIndex, NearDuplicateExtractor
+from citron.scheduler import Scheduler, get_priority, HIGH, NORMAL, LOW
+from citron.deadline import Deadline
+from citron.lifecycle import ModelSlot
+from citron import supervisor
+from citron.capture import RequestCapture
+from citron.registry import SpeakerRegistry
+from citron.profiles import get_profile, DEFAULT_PROFILE
+from citron import telemetry
 from citron.logger import logger
 
-from typing_extensions import Annotated
-from fastapi import FastAPI, Form, Response, status
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.routing import Match
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 if os.getenv("DEBUG") is not None:
     logger.setLevel(logging.DEBUG)
 
-nlp = get_parser(use_gpu = True, use_small = False)
-citron = Citron("./models/en_2021-11-15", nlp=nlp)
+JSON_MEDIA_TYPE = "application/json; charset=utf-8"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
 
-app = FastAPI()
-@app.post("/quotes")
-async def entities(text: Annotated[str, Form()], response: Response):
-    # raw_data = await request.body()
-    # data = raw_data.decode('utf-8')
-    # string_entities = extract_entities(data)
-    # return Response(content=string_entities, media_type="application/json")
-    if text is None or text.strip() == "":
-        response.status_code = status.HTTP_400_BAD_REQUEST
-        response.headers["Content-Type"] = "application/json"
-        return {"error": "A text parameter must be provided."}
-    
-    try:
-        results = citron.extract(text)
+def dumps(obj):
+    """
+    Serialise an object as JSON bytes, using orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def loads(data):
+    """
+    Parse JSON bytes, using orjson when it is installed.
+
+    Raises:
+        ValueError: If the data is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def get_env_flag(name):
+    """
+    Get a boolean flag from an environment variable, or None when unset or "auto".
+    """
+    value = os.getenv(name)
+    if value is None or value.lower() == "auto":
+        return None
+    return value.lower() in ("1", "true", "yes")
+
+def get_env_int(name):
+    """
+    Get an integer from an environment variable, or None when unset.
+    """
+    value = os.getenv(name)
+    if value is None:
+        return None
+    return int(value)
+
+# Extraction runs on worker threads so the event loop can serve /metrics while busy.
+# The Citron object is shared by the threads. Short documents have their own lane
+# of threads so that they are not queued behind long documents.
+EXTRACTION_THREADS = get_env_int("CITRON_EXTRACTION_THREADS") or 1
+LONG_THREADS = get_env_int("CITRON_LONG_THREADS") or 1
+SHORT_CHARS = get_env_int("CITRON_SHORT_CHARS") or Scheduler.DEFAULT_SHORT_COST
+# The threads used by torch, BLAS and OpenMP for each document. By default the CPUs
+# are shared by the extraction threads, which may process documents at the same time.
+THREADS = get_env_int("CITRON_THREADS") or max(1, (os.cpu_count() or 1) // (EXTRACTION_THREADS + LONG_THREADS))
+PRIORITY_HEADER = "X-Citron-Priority"
+MODEL_HEADER = "X-Citron-Model"
+# Seconds between checks for a disconnected client, and the status logged for such requests.
+DISCONNECT_POLL_INTERVAL = 0.25
+CLIENT_CLOSED_REQUEST = 499
+scheduler = Scheduler(short_workers=EXTRACTION_THREADS, long_workers=LONG_THREADS, short_cost=SHORT_CHARS)
+
+metrics_registry = telemetry.MetricsRegistry()
+pipeline_metrics = telemetry.PipelineMetrics(metrics_registry)
+request_count = metrics_registry.counter("citron_http_requests_total", "HTTP requests.", ("path", "status"))
+error_count = metrics_registry.counter("citron_http_errors_total", "HTTP requests which failed with a server error.", ("path",))
+request_seconds = metrics_registry.histogram("citron_http_request_seconds", "HTTP request latency.", labels=("path",))
+queue_depth = metrics_registry.gauge("citron_queue_depth", "Documents waiting for or undergoing extraction.")
+stream_sessions = metrics_registry.gauge("citron_stream_sessions", "Open streaming sessions.")
+disconnect_count = metrics_registry.counter("citron_http_disconnects_total", "HTTP requests abandoned by the client during extraction.")
+partial_count = metrics_registry.counter("citron_partial_results_total", "Documents whose optional stages were skipped to meet a deadline.")
+thread_count = metrics_registry.gauge("citron_threads", "Effective threads of the libraries used by each document.", ("process", "library"))
+model_seconds = metrics_registry.histogram("citron_model_extraction_seconds", "Extraction latency of each model.", labels=("model",))
+telemetry.SchedulerMetrics(metrics_registry, scheduler)
+
+MAX_CHARS = get_env_int("CITRON_MAX_CHARS")
+MAX_TOKENS = get_env_int("CITRON_MAX_TOKENS")
+CHUNK_LONG_DOCUMENTS = os.getenv("CITRON_LONG_DOCUMENTS", "reject").lower() == "chunk"
+CHUNK_CHARS = get_env_int("CITRON_CHUNK_CHARS") or MAX_CHARS or 10000
+CHUNK_OVERLAP = get_env_int("CITRON_CHUNK_OVERLAP") or 500
+
+STREAM_CONTEXT_CHARS = get_env_int("CITRON_STREAM_CONTEXT") or StreamSession.DEFAULT_CONTEXT_CHARS
+
+JOB_WORKERS = get_env_int("CITRON_JOB_WORKERS") or 1
+JOB_RETENTION = get_env_int("CITRON_JOB_RETENTION") or 3600
+JOB_MAX_PENDING = get_env_int("CITRON_JOB_MAX_PENDING") or 100
+JOB_MAX_WAIT = get_env_int("CITRON_JOB_MAX_WAIT") or 30
+
+PARALLEL_PROCESSES = get_env_int("CITRON_PARALLEL_PROCESSES")
+PARALLEL_THREADS = get_env_int("CITRON_PARALLEL_THREADS") or 1
+
+CACHE_SIZE = get_env_int("CITRON_CACHE_SIZE")
+CACHE_PATH = os.getenv("CITRON_CACHE_PATH")
+
+NEAR_DUPLICATE_THRESHOLD = os.getenv("CITRON_DEDUP_THRESHOLD")
+NEAR_DUPLICATE_DOCUMENTS = get_env_int("CITRON_DEDUP_DOCUMENTS") or 1000
+
+RECYCLE_DOCUMENTS = get_env_int("CITRON_RECYCLE_DOCUMENTS")
+RECYCLE_MEMORY = get_env_int("CITRON_RECYCLE_MEMORY")
+
+# The model loaded from CITRON_MODEL_PATH. Other models can be served side by side,
+# e.g. for A/B evaluation, and are selected per request by name.
+DEFAULT_MODEL = "default"
+ADMIN_TOKEN = os.getenv("CITRON_ADMIN_TOKEN")
+
+CAPTURE_PATH = os.getenv("CITRON_CAPTURE_PATH")
+CAPTURE_RATE = float(os.getenv("CITRON_CAPTURE_RATE", "1.0"))
+CAPTURE_MAX_MB = get_env_int("CITRON_CAPTURE_MAX_MB") or 100
+
+# Set by the lifespan hook once the models are loaded and warmed up. The models
+# are a dict of citron.lifecycle.ModelSlot objects keyed by the name of the model.
+models = None
+registry = None
+cache = None
+near_duplicate_extractors = {}
+capture = None
+startup_error = None
+
+WARMUP_TEXTS = [
+    '"We expect the new figures to be published next week," said Jane Smith, a spokeswoman for the department.',
+    'The minister said that the government would not change its policy. He added: "This is the right decision."',
+]
+
+def load_warmup_texts(path):
+    """
+    Load warm-up documents from a text file containing one document per line.
+    """
+    with open(path, encoding="utf-8") as infile:
+        return [line.strip() for line in infile if line.strip() != ""]
+
+class Models():
+    """
+    The models loaded together: a Citron object and the worker processes for long documents, if any.
+    """
+    def __init__(self, citron, model_path, parallel_extractor=None):
+        self.citron = citron
+        self.model_path = model_path
+        self.parallel_extractor = parallel_extractor
+
+    def close(self):
+        if self.parallel_extractor is not None:
+            self.parallel_extractor.shutdown()
+
+def get_model_paths():
+    """
+    Get the Citron model directory of each model to be served, keyed by the name of the model.
+    The default model is set by CITRON_MODEL_PATH and the others by CITRON_MODEL_VARIANTS,
+    a comma separated list of name=path pairs.
+
+    Raises:
+        ValueError: If CITRON_MODEL_VARIANTS is invalid.
+    """
+    profile = get_profile(os.getenv("CITRON_PROFILE", DEFAULT_PROFILE))
+    paths = {DEFAULT_MODEL: os.getenv("CITRON_MODEL_PATH", profile["model_path"])}
+    for entry in os.getenv("CITRON_MODEL_VARIANTS", "").split(","):
+        if entry.strip() == "":
+            continue
+        name, _, path = (value.strip() for value in entry.partition("="))
+        if name == "" or path == "":
+            raise ValueError("Invalid model variant: {0}. Variants must be name=path pairs.".format(entry))
+        paths[name] = path
+    return paths
+
+def record_thread_settings(process, settings):
+    """
+    Report the effective thread settings of the server or its worker processes in the metrics.
+    """
+    for library, threads in settings.items():
+        if library != "cpus":
+            thread_count.set(threads, process=process, library=library)
+
+def load_models(model_path):
+    """
+    Load the spaCy model and a Citron model and run the warm-up documents through them.
+    """
+    profile_name = os.getenv("CITRON_PROFILE", DEFAULT_PROFILE)
+    profile = get_profile(profile_name)
+    parser_profile = dict(profile["parser"])
+    parser_profile.update({
+        # A GPU is used when available unless CITRON_USE_GPU is false.
+        "use_gpu": get_env_flag("CITRON_USE_GPU") is not False,
+        "threads": THREADS,
+        "batch_size": get_env_int("CITRON_BATCH_SIZE"),
+    })
+    if os.getenv("CITRON_SPACY_MODEL") is not None:
+        parser_profile["model"] = os.getenv("CITRON_SPACY_MODEL")
+
+    nlp = get_parser(profile = parser_profile)
+    loaded = Citron(model_path, nlp=nlp, registry=registry)
+
+    record_thread_settings("server", get_thread_settings())
+
+    parallel_extractor = None
+    if CHUNK_LONG_DOCUMENTS and PARALLEL_PROCESSES is not None:
+        parallel_extractor = ParallelExtractor(
+            profile_name, model_path, dict(parser_profile, threads=PARALLEL_THREADS), PARALLEL_PROCESSES, CHUNK_CHARS, CHUNK_OVERLAP
+        )
+        record_thread_settings("worker", parallel_extractor.thread_settings)
+
+    warmup_texts = WARMUP_TEXTS
+    if os.getenv("CITRON_WARMUP_FILE") is not None:
+        warmup_texts = load_warmup_texts(os.getenv("CITRON_WARMUP_FILE"))
+
+    start = time.perf_counter()
+    for text in warmup_texts:
+        loaded.extract(text, include_stats=True)
+    logger.info("Warmed up with %d documents in %.2f seconds", len(warmup_texts), time.perf_counter() - start)
+
+    # Added after warm-up so that the warm-up documents are neither counted nor cached.
+    loaded.add_hook(pipeline_metrics.record)
+    loaded.cache = cache
+    return Models(loaded, model_path, parallel_extractor)
+
+def load_citron():
+    """
+    Load the state shared by successive models, then each model. Unless the server
+    runs in worker processes recycled by citron.supervisor, the models are replaced
+    by newly loaded models after the configured number of documents.
+    """
+    global registry, cache
+    model_paths = get_model_paths()
+    if os.getenv("CITRON_SPEAKER_REGISTRY") is not None:
+        registry = SpeakerRegistry(os.getenv("CITRON_SPEAKER_REGISTRY"))
+
+    if CACHE_SIZE is not None or CACHE_PATH is not None:
+        cache = ResultCache(
+            max_entries=CACHE_SIZE or ResultCache.DEFAULT_MAX_ENTRIES,
+            max_bytes=get_env_int("CITRON_CACHE_MAX_BYTES"),
+            ttl=get_env_int("CITRON_CACHE_TTL"),
+            path=CACHE_PATH
+        )
+        telemetry.CacheMetrics(metrics_registry, cache)
+
+    # A supervised worker process is replaced as a whole, which also returns its memory.
+    max_documents = None if supervisor.is_worker() else RECYCLE_DOCUMENTS
+    if RECYCLE_MEMORY is not None and not supervisor.is_worker():
+        logger.warning("CITRON_RECYCLE_MEMORY is ignored unless the server is run by citron.supervisor")
+
+    slots = {}
+    for name, model_path in model_paths.items():
+        logger.info("Loading model %s from %s", name, model_path)
+        slots[name] = ModelSlot(functools.partial(load_models, model_path), max_documents=max_documents)
+    telemetry.ModelMetrics(metrics_registry, slots)
+
+    if NEAR_DUPLICATE_THRESHOLD is not None:
+        for name in slots:
+            near_duplicate_extractors[name] = NearDuplicateExtractor(
+                MinHashIndex(max_documents=NEAR_DUPLICATE_DOCUMENTS), float(NEAR_DUPLICATE_THRESHOLD)
+            )
+        telemetry.NearDuplicateMetrics(metrics_registry, near_duplicate_extractors)
+    return slots
+
+def reload_models(name=None, model_path=None):
+    """
+    Load a model in the background and swap it in once warmed up. Documents in progress
+    finish with the models they started with.
+
+    Args:
+        name: The name of the model to reload, or None to reload every model from its
+            current directory.
+        model_path: A new Citron model directory for the named model, or None to reload
+            the model's current directory.
+
+    Returns:
+        A list of concurrent.futures.Future objects, one for each model reloaded.
+    """
+    if name is None:
+        return [slot.replace() for slot in models.values()]
+    load = None if model_path is None else functools.partial(load_models, model_path)
+    return [models[name].replace(load)]
+
+def reload_on_signal():
+    """
+    Reload every model from its current directory, e.g. after a symbolic link to the
+    directory has been changed.
+    """
+    if models is None:
+        logger.warning("Ignoring reload signal as Citron is not ready")
+        return
+    logger.info("Reloading the models on signal")
+    reload_models()
+
+class ClientDisconnectedError(Exception):
+    """
+    Raised when the client disconnects before its extraction has finished.
+    """
+
+async def run_extraction(function, *args, cost=0, priority=NORMAL, request=None, deadline=None):
+    """
+    Run an extraction function on the scheduler's workers, tracking the queue depth.
+    The cost is the number of characters to be processed. When a request is supplied,
+    the extraction is removed from the queue, or its deadline cancelled, if the client
+    disconnects.
+
+    Raises:
+        ClientDisconnectedError: If the client disconnects.
+    """
+    queue_depth.inc()
+    try:
+        future = asyncio.wrap_future(scheduler.submit(function, *args, cost=cost, priority=priority))
+        if request is None:
+            return await future
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return future.result()
+            if await request.is_disconnected():
+                future.cancel()
+                if deadline is not None:
+                    deadline.cancel()
+                disconnect_count.inc()
+                raise ClientDisconnectedError()
+    finally:
+        queue_depth.dec()
+
+async def start_citron():
+    """
+    Load the models on an extraction worker so that the health endpoints can answer meanwhile.
+    """
+    global models, startup_error
+    try:
+        models = await asyncio.wrap_future(scheduler.submit(load_citron, priority=HIGH))
+        logger.info("Citron is ready")
+        supervisor.set_ready()
+    except Exception as err:
+        logger.exception("Unable to load Citron")
+        startup_error = str(err)
+
+def start_capture():
+    """
+    Start capturing a sample of the documents, if enabled, for replay (see scripts/benchmark).
+    """
+    global capture
+    if CAPTURE_PATH is not None:
+        capture = RequestCapture(CAPTURE_PATH, sample_rate=CAPTURE_RATE, max_bytes=CAPTURE_MAX_MB * 1024 * 1024)
+        telemetry.CaptureMetrics(metrics_registry, capture)
+        logger.info("Capturing %.1f%% of requests to %s", CAPTURE_RATE * 100, CAPTURE_PATH)
+
+@asynccontextmanager
+async def lifespan(app):
+    start_capture()
+    startup = asyncio.create_task(start_citron())
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_on_signal)
+    except (AttributeError, NotImplementedError):
+        logger.debug("Reloading on SIGHUP is not supported on this platform")
+    yield
+    startup.cancel()
+    job_queue.shutdown()
+    if models is not None:
+        for slot in models.values():
+            slot.close()
+    if registry is not None:
+        registry.save()
+    if capture is not None:
+        capture.close()
+    scheduler.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=get_env_int("CITRON_GZIP_MINIMUM_SIZE") or 1000)
+
+def get_route_path(request):
+    """
+    Get the path template of the route matching a request e.g. "/jobs/{job_id}", so that
+    the metrics have a bounded set of labels.
+    """
+    for route in app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "other"
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    path = get_route_path(request)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        error_count.inc(path=path)
+        request_count.inc(path=path, status=500)
+        raise
+    request_seconds.observe(time.perf_counter() - start, path=path)
+    request_count.inc(path=path, status=response.status_code)
+    if response.status_code >= 500:
+        error_count.inc(path=path)
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=metrics_registry.render(), media_type=telemetry.CONTENT_TYPE)
+
+@app.get("/healthz")
+async def healthz(response: Response):
+    if startup_error is not None:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "failed", "error": startup_error}
+    return {"status": "ok", "ready": models is not None}
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    if models is None:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "failed" if startup_error is not None else "starting"}
+    return {"status": "ready"}
+
+def error_response(status_code, message):
+    return Response(content=dumps({"error": message}), status_code=status_code, media_type=JSON_MEDIA_TYPE)
+
+def check_admin(request):
+    """
+    Check the bearer token of a request to an admin endpoint.
+
+    Returns:
+        An error response, or None if the request is authorised.
+    """
+    if ADMIN_TOKEN is None:
+        return error_response(status.HTTP_403_FORBIDDEN, "The admin endpoints are disabled.")
+    token = request.headers.get("authorization", "").partition("Bearer ")[2]
+    if not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        return error_response(status.HTTP_401_UNAUTHORIZED, "Invalid admin token.")
+    return None
+
+def get_models_json():
+    return {
+        name: dict(slot.get_stats(), model_path=slot.current.model_path)
+        for name, slot in models.items()
+    }
+
+@app.get("/admin/models")
+async def list_models(request: Request):
+    error = check_admin(request)
+    if error is not None:
+        return error
+    if models is None:
+        return error_response(status.HTTP_503_SERVICE_UNAVAILABLE, "Citron is not ready.")
+    return Response(content=dumps(get_models_json()), media_type=JSON_MEDIA_TYPE)
+
+@app.post("/admin/reload")
+async def reload(request: Request):
+    """
+    Reload a model, optionally from a new directory, and respond once it has been swapped
+    in. The body is an optional JSON object with "model" and "model_path" keys. Without
+    a model, every model is reloaded from its current directory.
+    """
+    error = check_admin(request)
+    if error is not None:
+        return error
+    if models is None:
+        return error_response(status.HTTP_503_SERVICE_UNAVAILABLE, "Citron is not ready.")
+
+    try:
+        body = await read_body(request)
+        params = loads(body) if body.strip() != b"" else {}
+        if not isinstance(params, dict):
+            raise ValueError("The body must be a JSON object.")
+        name = params.get("model")
+        model_path = params.get("model_path")
+        if name is not None:
+            get_model_name(name)
+        elif model_path is not None:
+            raise ValueError("A model must be provided with a model_path.")
+        if model_path is not None and not os.path.isdir(model_path):
+            raise ValueError("Not a model directory: {0}".format(model_path))
     except ValueError as err:
-        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-        response.headers["Content-Type"] = "application/json"
-        return { "error": err.message }
-    
-    response.headers["Content-Type"] = "application/json; charset=utf-8"
+        return error_response(status.HTTP_400_BAD_REQUEST, str(err))
+
+    if model_path is not None and models[name].get_stats()["replacing"]:
+        return error_response(status.HTTP_409_CONFLICT, "The model is already being reloaded.")
+
+    try:
+        await asyncio.gather(*(asyncio.wrap_future(future) for future in reload_models(name, model_path)))
+    except Exception as err:
+        # The previous models continue to serve.
+        return error_response(status.HTTP_500_INTERNAL_SERVER_ERROR, "Unable to load the model: {0}".format(err))
+
+    return Response(content=dumps(get_models_json()), media_type=JSON_MEDIA_TYPE)
+
+async def read_body(request):
+    """
+    Read the request body, decompressing it if it is gzip encoded.
+    """
+    body = await request.body()
+    encoding = request.headers.get("content-encoding", "identity").lower()
+    if encoding == "gzip":
+        try:
+            return gzip.decompress(body)
+        except (OSError, EOFError) as err:
+            raise ValueError("Invalid gzip body: {0}".format(err))
+    if encoding != "identity":
+        raise ValueError("Unsupported content encoding: {0}".format(encoding))
+    return body
+
+async def read_documents(request):
+    """
+    Read the documents of a /quotes request. JSON bodies contain one document, NDJSON bodies
+    contain one document per line, and form bodies contain a text and optional stages parameter.
+
+    Returns:
+        A list of dicts with "text", "stages", "deadline" and "model" keys, and a flag
+        indicating whether the request was NDJSON.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        return [{name: form.get(name) for name in ("text", "stages", "deadline", "model")}], False
+
+    body = await read_body(request)
+
+    if content_type in NDJSON_MEDIA_TYPES:
+        documents = [loads(line) for line in body.splitlines() if line.strip() != b""]
+        return documents, True
+
+    if content_type == "application/json":
+        return [loads(body)], False
+
+    # Parsed directly as this is cheaper than the framework's form handling.
+    params = urllib.parse.parse_qs(body.decode("utf-8"))
+    return [{name: params.get(name, [None])[0] for name in ("text", "stages", "deadline", "model")}], False
+
+def get_deadline(value):
+    """
+    Get a deadline from a number of seconds, which starts now, or None for no time limit.
+
+    Raises:
+        ValueError: If the value is not a positive number.
+    """
+    if value is None:
+        return Deadline()
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        seconds = 0
+    if not seconds > 0:
+        raise ValueError("The deadline must be a positive number of seconds.")
+    return Deadline(seconds)
+
+def get_model_name(name):
+    """
+    Get the name of the model to use, which is the default model when the name is None.
+
+    Raises:
+        ValueError: If the model is not served.
+    """
+    if name is None:
+        return DEFAULT_MODEL
+    if name not in models:
+        raise ValueError("Unknown model: {0}. Valid models are: {1}".format(name, ", ".join(models)))
+    return name
+
+def get_document_args(document, model=None):
+    """
+    Get the text, stages, previous revision, deadline and model of a document of a
+    /quotes request. The previous revision is a (previous_text, previous_results) tuple,
+    or None. The document's model overrides the model supplied e.g. by a header.
+
+    Raises:
+        ValueError: If the document is invalid.
+    """
+    if not isinstance(document, dict):
+        raise ValueError("Each document must be a JSON object.")
+    text = document.get("text")
+    if not isinstance(text, str) or text.strip() == "":
+        raise ValueError("A text parameter must be provided.")
+    previous = None
+    if document.get("previous_text") is not None:
+        if not isinstance(document["previous_text"], str) or not isinstance(document.get("previous_results"), dict):
+            raise ValueError("A previous_text must be provided with previous_results.")
+        previous = (document["previous_text"], document["previous_results"])
+    return (
+        text,
+        get_stages(document.get("stages")),
+        previous,
+        get_deadline(document.get("deadline")),
+        get_model_name(document.get("model") or model)
+    )
+
+def extract_text(text, stages, previous=None, deadline=None, model=DEFAULT_MODEL):
+    """
+    Extract the quotes from a text, splitting it into chunks when it exceeds the length
+    limits and chunking is enabled, or reusing the results of a previous revision or
+    of a recent near-duplicate. Only documents processed in full degrade to meet their
+    deadline; the others check only whether it has been cancelled.
+
+    Raises:
+        DocumentTooLongError: If the text exceeds the length limits and chunking is disabled.
+        ExtractionCancelledError: If the deadline is cancelled.
+    """
+    if deadline is None:
+        deadline = Deadline()
+    deadline.check()
+    start = time.perf_counter()
+    with models[model].use() as loaded:
+        results = extract_with_models(loaded, text, stages, previous, deadline, near_duplicate_extractors.get(model))
+    model_seconds.observe(time.perf_counter() - start, model=model)
     return results
+
+def extract_with_models(loaded, text, stages, previous, deadline, near_duplicate_extractor=None):
+    """
+    Extract the quotes from a text with a set of loaded models (see extract_text).
+    """
+    citron = loaded.citron
+    try:
+        check_length(citron.nlp, text, MAX_CHARS, MAX_TOKENS)
+    except DocumentTooLongError:
+        if not CHUNK_LONG_DOCUMENTS:
+            raise
+        if loaded.parallel_extractor is not None:
+            return loaded.parallel_extractor.extract(text, stages=stages)
+        return citron.extract_chunked(text, CHUNK_CHARS, CHUNK_OVERLAP, stages=stages)
+    if previous is not None:
+        try:
+            results = citron.extract_revision(text, previous[0], previous[1], stages=stages, deadline=deadline)
+        except (KeyError, TypeError, IndexError):
+            raise ValueError("The previous_results are not valid Citron results.")
+    elif near_duplicate_extractor is not None:
+        results = near_duplicate_extractor.extract(citron, text, stages=stages, deadline=deadline)
+    else:
+        results = citron.extract(text, stages=stages, deadline=deadline)
+    if deadline.is_partial():
+        partial_count.inc()
+    return results
+
+def extract_documents(documents, cancellation=None, model=None):
+    """
+    Extract the quotes from each document of an NDJSON request, reporting errors per line.
+    Each document may have its own deadline and model. The request stops before the next
+    document once the cancellation deadline is cancelled.
+    """
+    lines = []
+    for document in documents:
+        if cancellation is not None:
+            cancellation.check()
+        try:
+            lines.append(dumps(extract_text(*get_document_args(document, model))))
+        except ValueError as err:
+            lines.append(dumps({"error": str(err)}))
+    return b"\n".join(lines) + b"\n"
+
+def get_cost(documents):
+    """
+    Estimate the cost of extracting the quotes from documents, as their number of characters.
+    """
+    cost = 0
+    for document in documents:
+        if isinstance(document, dict) and isinstance(document.get("text"), str):
+            cost += len(document["text"])
+    return cost
+
+@app.post("/quotes")
+async def quotes(request: Request):
+    if models is None:
+        return error_response(status.HTTP_503_SERVICE_UNAVAILABLE, "Citron is not ready.")
+
+    try:
+        priority = get_priority(request.headers.get(PRIORITY_HEADER))
+        model = get_model_name(request.headers.get(MODEL_HEADER))
+        documents, is_ndjson = await read_documents(request)
+    except ValueError as err:
+        return error_response(status.HTTP_400_BAD_REQUEST, str(err))
+
+    if capture is not None:
+        capture.capture(documents, endpoint="/quotes", priority=request.headers.get(PRIORITY_HEADER), model=model)
+
+    if is_ndjson:
+        cancellation = Deadline()
+        try:
+            content = await run_extraction(
+                extract_documents, documents, cancellation, model,
+                cost=get_cost(documents), priority=priority, request=request, deadline=cancellation
+            )
+        except ClientDisconnectedError:
+            return Response(status_code=CLIENT_CLOSED_REQUEST)
+        return Response(content=content, media_type=NDJSON_MEDIA_TYPE)
+
+    try:
+        text, stages, previous, deadline, model = get_document_args(documents[0], model)
+    except ValueError as err:
+        return error_response(status.HTTP_400_BAD_REQUEST, str(err))
+
+    if not CHUNK_LONG_DOCUMENTS:
+        # Checked here so that long documents are rejected without waiting in the queue.
+        try:
+            check_length(models[model].current.citron.nlp, text, MAX_CHARS)
+        except DocumentTooLongError as err:
+            return error_response(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, str(err))
+
+    try:
+        results = await run_extraction(
+            extract_text, text, stages, previous, deadline, model,
+            cost=len(text), priority=priority, request=request, deadline=deadline
+        )
+    except ClientDisconnectedError:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except DocumentTooLongError as err:
+        return error_response(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, str(err))
+    except ValueError as err:
+        # Raised for previous_results which are not valid Citron results.
+        return error_response(status.HTTP_400_BAD_REQUEST, str(err))
+
+    # Serialised directly, bypassing the framework's validation and encoding.
+    return Response(content=dumps(results), headers={MODEL_HEADER: model}, media_type=JSON_MEDIA_TYPE)
+
+def process_job_document(document):
+    """
+    Process a document of a job. Each document is passed to the scheduler separately
+    with a low priority, so interactive requests wait for at most one job document.
+    """
+    args = get_document_args(document)
+    queue_depth.inc()
+    try:
+        return scheduler.submit(extract_text, *args, cost=len(args[0]), priority=LOW).result()
+    finally:
+        queue_depth.dec()
+
+job_queue = JobQueue(process_job_document, workers=JOB_WORKERS, retention=JOB_RETENTION, max_pending=JOB_MAX_PENDING)
+
+@app.post("/jobs")
+async def submit_job(request: Request):
+    if models is None:
+        return error_response(status.HTTP_503_SERVICE_UNAVAILABLE, "Citron is not ready.")
+
+    try:
+        model = get_model_name(request.headers.get(MODEL_HEADER))
+        documents = (await read_documents(request))[0]
+    except ValueError as err:
+        return error_response(status.HTTP_400_BAD_REQUEST, str(err))
+
+    if len(documents) == 0:
+        return error_response(status.HTTP_400_BAD_REQUEST, "At least one document must be provided.")
+
+    # The header's model applies to the documents which do not name one.
+    for document in documents:
+        if isinstance(document, dict) and document.get("model") is None:
+            document["model"] = model
+
+    if capture is not None:
+        capture.capture(documents, endpoint="/jobs")
+
+    try:
+        job = job_queue.submit(documents)
+    except JobQueueFullError as err:
+        return error_response(status.HTTP_429_TOO_MANY_REQUESTS, str(err))
+
+    return Response(
+        content=dumps(job.to_json()),
+        status_code=status.HTTP_202_ACCEPTED,
+        headers={"Location": "/jobs/" + job.id},
+        media_type=JSON_MEDIA_TYPE
+    )
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    job = job_queue.get(job_id)
+    if job is None:
+        return error_response(status.HTTP_404_NOT_FOUND, "Unknown job: {0}".format(job_id))
+
+    # Long-poll: wait for the job to finish, up to the maximum wait.
+    wait = min(max(wait, 0), JOB_MAX_WAIT)
+    if wait > 0 and not job.is_finished():
+        await wait_for_job(job, wait)
+
+    return Response(content=dumps(job.to_json()), media_type=JSON_MEDIA_TYPE)
+
+async def wait_for_job(job, timeout):
+    """
+    Wait for a job to finish without holding a thread: the job worker signals the
+    event loop when the job finishes.
+    """
+    loop = asyncio.get_running_loop()
+    finished = loop.create_future()
+
+    def set_finished():
+        if not finished.done():
+            finished.set_result(None)
+
+    def on_finished(job):
+        loop.call_soon_threadsafe(set_finished)
+
+    job.add_done_callback(on_finished)
+    try:
+        await asyncio.wait({finished}, timeout=timeout)
+    finally:
+        job.remove_done_callback(on_finished)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return error_response(status.HTTP_404_NOT_FOUND, "Unknown job: {0}".format(job_id))
+    return Response(content=dumps(job.to_json(include_results=False)), media_type=JSON_MEDIA_TYPE)
+
+@app.websocket("/stream")
+async def stream(websocket: WebSocket, stages: Optional[str] = None, model: Optional[str] = None):
+    """
+    Extract quotes from a stream of appended text. Each message is a JSON object with a
+    "text" key containing the appended text, and each reply contains the new quotes.
+    The model parameter selects the model by name.
+    """
+    await websocket.accept()
+
+    if models is None:
+        await websocket.send_bytes(dumps({"error": "Citron is not ready."}))
+        await websocket.close(code=1013)
+        return
+
+    try:
+        stages = get_stages(stages) - {"entities"}
+        model = get_model_name(model)
+    except ValueError as err:
+        await websocket.send_bytes(dumps({"error": str(err)}))
+        await websocket.close(code=1008)
+        return
+
+    session = StreamSession(None, context_chars=STREAM_CONTEXT_CHARS, stages=stages)
+    stream_sessions.inc()
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                text = loads(message).get("text")
+                if not isinstance(text, str):
+                    raise ValueError("A text parameter must be provided.")
+            except (ValueError, AttributeError) as err:
+                await websocket.send_bytes(dumps({"error": str(err)}))
+                continue
+
+            # The models are held for each message rather than the whole session, so
+            # that replaced models are released while the session stays open.
+            with models[model].use() as loaded:
+                session.citron = loaded.citron
+                try:
+                    results = await run_extraction(session.append, text, cost=len(text))
+                finally:
+                    session.citron = None
+            await websocket.send_bytes(dumps(results))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        stream_sessions.dec()
@@ -0,0 +1,150 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+Tests of the expiry, size limits and on-disk tier of citron.cache.ResultCache.
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from citron.cache import ResultCache, get_key
+
+RESULTS = {"quotes": [{"cue": {"start": 5, "end": 6, "text": "said"}}], "source": {"model:": "2021-11-15"}}
+
+
+class GetKeyTest(unittest.TestCase):
+
+    def test_key_depends_on_the_text_model_and_options(self):
+        key = get_key("text", "2021-11-15", {"stages": ["cues"]})
+
+        self.assertEqual(key, get_key("text", "2021-11-15", {"stages": ["cues"]}))
+        self.assertNotEqual(key, get_key("text.", "2021-11-15", {"stages": ["cues"]}))
+        self.assertNotEqual(key, get_key("text", "2022-03-01", {"stages": ["cues"]}))
+        self.assertNotEqual(key, get_key("text", "2021-11-15", {"stages": ["contents"]}))
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def test_result_is_a_copy(self):
+        cache = ResultCache()
+        cache.put("a", RESULTS)
+
+        result = cache.get("a")
+        result["quotes"].clear()
+
+        self.assertEqual(cache.get("a"), RESULTS)
+
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ResultCache(max_entries=2)
+        cache.put("a", RESULTS)
+        cache.put("b", RESULTS)
+        cache.get("a")
+        cache.put("c", RESULTS)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), RESULTS)
+        self.assertEqual(cache.get("c"), RESULTS)
+
+
+    def test_entries_are_limited_by_size(self):
+        cache = ResultCache(max_bytes=250)
+
+        for key in ("a", "b", "c"):
+            cache.put(key, RESULTS)
+
+        stats = cache.get_stats()
+
+        self.assertLessEqual(stats["bytes"], 250)
+        self.assertLess(stats["entries"], 3)
+        self.assertEqual(cache.get("c"), RESULTS)
+
+
+    def test_entry_larger_than_the_limit_is_kept_alone(self):
+        cache = ResultCache(max_bytes=10)
+        cache.put("a", RESULTS)
+        cache.put("b", RESULTS)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), RESULTS)
+        self.assertEqual(cache.get_stats()["entries"], 1)
+
+
+    def test_expired_entry_is_missing(self):
+        cache = ResultCache(ttl=60)
+        cache.put("a", RESULTS)
+
+        self.assertEqual(cache.get("a"), RESULTS)
+
+        with mock.patch("citron.cache.time.time", return_value=time.time() + 61):
+            self.assertIsNone(cache.get("a"))
+
+        self.assertEqual(cache.get_stats()["entries"], 0)
+
+
+    def test_stats_count_hits_and_misses(self):
+        cache = ResultCache()
+        cache.put("a", RESULTS)
+        cache.get("a")
+        cache.get("b")
+
+        stats = cache.get_stats()
+
+        self.assertEqual(stats["memory_hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+
+class DiskTierTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "results.db")
+
+
+    def test_result_is_shared_through_the_disk(self):
+        ResultCache(path=self.path).put("a", RESULTS)
+        cache = ResultCache(path=self.path)
+
+        self.assertEqual(cache.get("a"), RESULTS)
+        self.assertEqual(cache.get("a"), RESULTS)
+        self.assertEqual(cache.get_stats()["disk_hits"], 1)
+        self.assertEqual(cache.get_stats()["memory_hits"], 1)
+
+
+    def test_expired_result_on_disk_is_missing(self):
+        ResultCache(path=self.path).put("a", RESULTS)
+        cache = ResultCache(ttl=60, path=self.path)
+
+        with mock.patch("citron.cache.time.time", return_value=time.time() + 61):
+            self.assertIsNone(cache.get("a"))
+
+
+    def test_oldest_results_on_disk_are_pruned(self):
+        cache = ResultCache(max_entries=1, path=self.path, max_disk_entries=2)
+        cache.PRUNE_INTERVAL = 1
+
+        for key in ("a", "b", "c"):
+            cache.put(key, RESULTS)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), RESULTS)
+
+
+    def test_clear_removes_both_tiers(self):
+        cache = ResultCache(path=self.path)
+        cache.put("a", RESULTS)
+        cache.clear()
+
+        self.assertIsNone(cache.get("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
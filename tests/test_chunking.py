@@ -0,0 +1,134 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+Tests of the splitting of long documents into chunks and the merging of the
+quotes found in overlapping chunks.
+"""
+
+import unittest
+
+import spacy
+
+from citron.chunking import ChunkAligner, get_boundaries, get_chunks, merge_quotes
+
+PARAGRAPHS = [
+    "The club confirmed the deal on Monday.",
+    "\"We are delighted,\" said the chairman.",
+    "The player will join next season.",
+    "\"It is a great move,\" he said.",
+    "Fans welcomed the news.",
+]
+
+
+def get_quote(start, end, text="said"):
+    span = {"start": start, "end": end, "text": text}
+    return {"cue": span, "sources": [span], "coreferences": [], "contents": [span]}
+
+
+class GetChunksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.text = "\n\n".join(PARAGRAPHS)
+
+
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(get_chunks(self.text, len(self.text)), [(0, len(self.text))])
+
+
+    def test_chunks_are_whole_paragraphs(self):
+        chunks = get_chunks(self.text, 80)
+
+        self.assertGreater(len(chunks), 1)
+
+        for start, end in chunks:
+            self.assertLessEqual(end - start, 80)
+            self.assertIn(self.text[start : end].split("\n\n")[0], PARAGRAPHS)
+            self.assertIn(self.text[start : end].split("\n\n")[-1], PARAGRAPHS)
+
+
+    def test_chunks_overlap(self):
+        chunks = get_chunks(self.text, 80, overlap_chars=40)
+
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertLess(chunk[0], previous[1])
+            self.assertGreater(chunk[1], previous[1])
+
+
+    def test_long_paragraph_is_split_at_a_sentence(self):
+        text = "The first sentence is here. The second sentence follows it."
+
+        chunks = get_chunks(text, 40)
+
+        self.assertEqual(text[chunks[0][0] : chunks[0][1]], "The first sentence is here.")
+        self.assertEqual(text[chunks[1][0] : chunks[1][1]], "The second sentence follows it.")
+
+
+class GetBoundariesTest(unittest.TestCase):
+
+    def test_boundaries_of_disjoint_chunks_are_unchanged(self):
+        chunks = [(0, 10), (12, 20)]
+
+        self.assertEqual(get_boundaries(chunks), chunks)
+
+
+    def test_overlap_is_divided_at_its_midpoint(self):
+        self.assertEqual(get_boundaries([(0, 60), (40, 100), (80, 140)]), [(0, 50), (50, 90), (90, 140)])
+
+
+    def test_boundaries_cover_the_chunks(self):
+        text = "\n\n".join(PARAGRAPHS)
+        chunks = get_chunks(text, 80, overlap_chars=40)
+
+        boundaries = get_boundaries(chunks)
+
+        self.assertEqual(boundaries[0][0], chunks[0][0])
+        self.assertEqual(boundaries[-1][1], chunks[-1][1])
+
+        for previous, boundary in zip(boundaries, boundaries[1:]):
+            self.assertEqual(previous[1], boundary[0])
+
+
+class MergeQuotesTest(unittest.TestCase):
+
+    def test_owned_duplicate_is_kept(self):
+        owned = get_quote(10, 11, "owned")
+        other = get_quote(10, 11, "other")
+
+        self.assertEqual(merge_quotes([(other, False), (owned, True)]), [owned])
+
+
+    def test_overlapping_cues_are_duplicates(self):
+        owned = get_quote(10, 12)
+        other = get_quote(11, 13)
+
+        self.assertEqual(merge_quotes([(owned, True), (other, False)]), [owned])
+
+
+    def test_unowned_quote_is_kept_when_not_a_duplicate(self):
+        first = get_quote(20, 21)
+        second = get_quote(5, 6)
+
+        self.assertEqual(merge_quotes([(first, True), (second, False)]), [second, first])
+
+
+class ChunkAlignerTest(unittest.TestCase):
+
+    def test_span_is_remapped_to_the_complete_text(self):
+        nlp = spacy.blank("en")
+        text = "\n\n".join(PARAGRAPHS)
+        offset = text.index(PARAGRAPHS[1])
+        chunk_doc = nlp(text[offset:])
+        aligner = ChunkAligner(nlp.make_doc(text))
+
+        cue = [token.text for token in chunk_doc].index("said")
+
+        span = aligner.remap_span({"start": cue, "end": cue + 1, "text": "said"}, chunk_doc, offset)
+
+        self.assertEqual(aligner.doc[span["start"] : span["end"]].text, "said")
+
+
+if __name__ == "__main__":
+    unittest.main()
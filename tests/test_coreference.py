@@ -0,0 +1,152 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+Tests of the lazily built CoreferenceTable and of the sources which are
+resolved, on a fixed document which needs no models.
+"""
+
+import unittest
+from unittest import mock
+
+import spacy
+from spacy.tokens import Doc, Span
+
+from citron.coreference import CoreferenceResolver, CoreferenceTable, needs_coreference
+from citron.data import Quote
+from citron.registry import SpeakerRegistry
+
+WORDS = [
+    "BBC", "News", "reported", "the", "deal", ".",
+    "John", "Smith", "arrived", ".",
+    "A", "BBC", "spokesman", "said", "it", "was", "done", ".",
+    "John", "Smith", "said", "it", "was", "good", ".",
+    "Mr", "Smith", "said", "it", "was", "late", ".",
+    "Smith", "said", "it", "was", "over", ".",
+]
+POS = [
+    "PROPN", "PROPN", "VERB", "DET", "NOUN", "PUNCT",
+    "PROPN", "PROPN", "VERB", "PUNCT",
+    "DET", "PROPN", "NOUN", "VERB", "PRON", "AUX", "ADJ", "PUNCT",
+    "PROPN", "PROPN", "VERB", "PRON", "AUX", "ADJ", "PUNCT",
+    "PROPN", "PROPN", "VERB", "PRON", "AUX", "ADJ", "PUNCT",
+    "PROPN", "VERB", "PRON", "AUX", "ADJ", "PUNCT",
+]
+ENTS = [
+    "B-ORG", "I-ORG", "O", "O", "O", "O",
+    "B-PERSON", "I-PERSON", "O", "O",
+    "O", "B-ORG", "O", "O", "O", "O", "O", "O",
+    "B-PERSON", "I-PERSON", "O", "O", "O", "O", "O",
+    "O", "B-PERSON", "O", "O", "O", "O", "O",
+    "B-PERSON", "O", "O", "O", "O", "O",
+]
+SENTENCE_STARTS = [0, 6, 10, 18, 25, 32]
+
+# The (cue, source, content) token ranges of each quote.
+QUOTES = [
+    ((13, 14), (10, 13), (14, 17)),
+    ((20, 21), (18, 20), (21, 24)),
+    ((27, 28), (25, 27), (28, 31)),
+    ((33, 34), (32, 33), (34, 37)),
+]
+
+
+def get_doc():
+    Span.set_extension("to_json", method=lambda span: {"start": span.start, "end": span.end, "text": span.text}, force=True)
+    Span.set_extension("is_plural", default=None, force=True)
+    Span.set_extension("gender", default=None, force=True)
+
+    return Doc(
+        spacy.blank("en").vocab,
+        words=WORDS,
+        pos=POS,
+        ents=ENTS,
+        sent_starts=[i in SENTENCE_STARTS for i in range(len(WORDS))]
+    )
+
+
+def get_quotes(doc):
+    return [
+        Quote(doc[cue[0] : cue[1]], [doc[source[0] : source[1]]], [doc[content[0] : content[1]]])
+        for cue, source, content in QUOTES
+    ]
+
+
+class CoreferenceTableTest(unittest.TestCase):
+
+    def setUp(self):
+        # Pronouns are not sources in the document, so the model is not needed.
+        self.resolver = CoreferenceResolver.__new__(CoreferenceResolver)
+        self.gender_resolver = mock.Mock()
+        self.gender_resolver.get_forename_gender.return_value = "male"
+
+
+    def test_full_person_names_do_not_need_coreference(self):
+        doc = get_doc()
+
+        self.assertFalse(needs_coreference(doc[6 : 8]))
+        self.assertFalse(needs_coreference(doc[18 : 20]))
+        self.assertTrue(needs_coreference(doc[10 : 13]))
+        self.assertTrue(needs_coreference(doc[25 : 27]))
+        self.assertTrue(needs_coreference(doc[32 : 33]))
+        # Part of a longer entity.
+        self.assertTrue(needs_coreference(doc[0 : 1]))
+
+
+    def test_lazy_table_matches_eager_table(self):
+        lazy_doc = get_doc()
+        lazy_quotes = get_quotes(lazy_doc)
+        sources = [quote.sources[0] for quote in lazy_quotes]
+        contents = [quote.contents[0] for quote in lazy_quotes]
+        self.resolver.resolve_document(lazy_doc, self.gender_resolver, lazy_quotes, sources, contents, None)
+
+        # Build the whole table first and resolve every source, as before the
+        # table was built lazily.
+        eager_doc = get_doc()
+        eager_quotes = get_quotes(eager_doc)
+        sources = [quote.sources[0] for quote in eager_quotes]
+        contents = [quote.contents[0] for quote in eager_quotes]
+        table = CoreferenceTable(eager_doc, self.gender_resolver, eager_quotes)
+        table.coreference_map
+        table.mentions
+
+        for quote in eager_quotes:
+            quote.coreferences = []
+
+            for source in quote.sources:
+                coreference = self.resolver._resolve_coreference_chain(
+                    eager_doc, self.gender_resolver, table, quote, source, sources, contents
+                )
+
+                if coreference is not None and coreference.text != source.text:
+                    quote.coreferences.append(coreference)
+
+        self.assertEqual([quote.to_json() for quote in lazy_quotes], [quote.to_json() for quote in eager_quotes])
+        # The description is linked to the earlier organisation name.
+        self.assertEqual(lazy_quotes[0].to_json()["sources"][0]["text"], "BBC News")
+        self.assertEqual(lazy_quotes[2].to_json()["sources"][0]["text"], "John Smith")
+
+
+    def get_person_genders(self, registry):
+        doc = get_doc()
+        table = CoreferenceTable(doc, self.gender_resolver, get_quotes(doc), registry=registry)
+        table.mentions
+        return [name._.gender for name in table.names if name.text == "John Smith"]
+
+
+    def test_registry_gives_only_unknown_genders(self):
+        registry = SpeakerRegistry()
+        registry.add("John Smith", gender="female")
+
+        # The forename gives the gender within the document.
+        self.assertEqual(self.get_person_genders(registry), ["male", "male"])
+
+        self.gender_resolver.get_forename_gender.return_value = "unknown"
+
+        self.assertEqual(self.get_person_genders(registry), ["female", "female"])
+
+
+if __name__ == "__main__":
+    unittest.main()
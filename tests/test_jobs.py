@@ -0,0 +1,118 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+Tests of the cancellation, retention and completion callbacks of the job queue.
+"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from citron import jobs
+from citron.jobs import JobQueue, JobQueueFullError
+
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.queue = JobQueue(self.process, workers=1, retention=60, max_pending=2)
+        self.addCleanup(self.queue.shutdown)
+        self.addCleanup(self.release.set)
+
+
+    def process(self, document):
+        self.started.set()
+        self.release.wait(5)
+        return {"text": document}
+
+
+    def test_job_is_completed(self):
+        self.release.set()
+        job = self.queue.submit(["a", "b"])
+
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, jobs.COMPLETED)
+        self.assertEqual(job.to_json()["results"], [{"text": "a"}, {"text": "b"}])
+
+
+    def test_queued_job_is_cancelled_immediately(self):
+        running = self.queue.submit(["a"])
+        self.started.wait(5)
+        queued = self.queue.submit(["b"])
+
+        self.queue.cancel(queued.id)
+
+        self.assertEqual(queued.status, jobs.CANCELLED)
+        self.assertEqual(self.queue.get_pending(), 1)
+        self.assertEqual(running.status, jobs.RUNNING)
+
+
+    def test_running_job_is_cancelled_after_its_document(self):
+        job = self.queue.submit(["a", "b", "c"])
+        self.started.wait(5)
+
+        self.queue.cancel(job.id)
+        self.release.set()
+
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, jobs.CANCELLED)
+        self.assertEqual(job.results, [{"text": "a"}])
+
+
+    def test_pending_jobs_are_limited(self):
+        self.queue.submit(["a"])
+        self.queue.submit(["b"])
+
+        with self.assertRaises(JobQueueFullError):
+            self.queue.submit(["c"])
+
+
+    def test_finished_jobs_expire(self):
+        self.release.set()
+        job = self.queue.submit(["a"])
+        job.wait(5)
+
+        self.assertIs(self.queue.get(job.id), job)
+
+        with mock.patch("citron.jobs.time.time", return_value=time.time() + 61):
+            self.assertIsNone(self.queue.get(job.id))
+
+
+    def test_callback_is_called_once_finished(self):
+        finished = []
+        job = self.queue.submit(["a"])
+        job.add_done_callback(finished.append)
+
+        self.assertEqual(finished, [])
+
+        self.release.set()
+        job.wait(5)
+
+        self.assertEqual(finished, [job])
+
+        # Called immediately once the job has finished.
+        job.add_done_callback(finished.append)
+
+        self.assertEqual(finished, [job, job])
+
+
+    def test_removed_callback_is_not_called(self):
+        finished = []
+        job = self.queue.submit(["a"])
+        job.add_done_callback(finished.append)
+        job.remove_done_callback(finished.append)
+
+        self.release.set()
+        job.wait(5)
+
+        self.assertEqual(finished, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+Tests of the eviction, persistence and lookups of the speaker registry.
+"""
+
+import os
+import tempfile
+import unittest
+
+from citron.registry import SpeakerRegistry
+
+
+class SpeakerRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "speakers.json")
+
+
+    def test_least_recently_used_entry_is_evicted(self):
+        registry = SpeakerRegistry(max_entries=2)
+        registry.add("John Smith")
+        registry.add("Jane Doe")
+        registry.get("John Smith")
+        registry.add("Joe Bloggs")
+
+        self.assertEqual(len(registry), 2)
+        self.assertIn("John Smith", registry)
+        self.assertNotIn("Jane Doe", registry)
+
+
+    def test_registry_is_saved_and_loaded(self):
+        registry = SpeakerRegistry(self.path, save_interval=None)
+        registry.add("Mr. Smith's", full_name="John Smith", gender="male", entity_type="PERSON")
+        registry.save()
+
+        loaded = SpeakerRegistry(self.path)
+
+        self.assertEqual(loaded.get_full_name("Mr Smith"), "John Smith")
+        self.assertEqual(loaded.get_gender("mr smith"), "male")
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ["speakers.json"])
+
+
+    def test_registry_is_saved_after_the_interval(self):
+        registry = SpeakerRegistry(self.path, save_interval=2)
+        registry.add("John Smith")
+
+        self.assertFalse(os.path.exists(self.path))
+
+        registry.add("Jane Doe")
+
+        self.assertEqual(len(SpeakerRegistry(self.path)), 2)
+
+
+    def test_load_is_bounded(self):
+        registry = SpeakerRegistry(self.path, save_interval=None)
+        for name in ("John Smith", "Jane Doe", "Joe Bloggs"):
+            registry.add(name)
+        registry.save()
+
+        self.assertEqual(len(SpeakerRegistry(self.path, max_entries=2)), 2)
+
+
+    def test_gender_of_full_name_is_counted_once(self):
+        registry = SpeakerRegistry()
+        registry.add("John Smith", gender="male")
+        registry.add("Smith", full_name="John Smith")
+
+        self.assertEqual(registry.get_gender("Smith"), "male")
+        self.assertEqual((registry.hits, registry.misses), (1, 0))
+
+        self.assertIsNone(registry.get_gender("Jones"))
+        self.assertEqual((registry.hits, registry.misses), (1, 1))
+
+
+    def test_shared_surname_is_ambiguous(self):
+        registry = SpeakerRegistry()
+        registry.add("Smith", full_name="John Smith", gender="male")
+        registry.add("Smith", full_name="Jane Smith", gender="female")
+
+        self.assertIsNone(registry.get_full_name("Smith"))
+        self.assertIsNone(registry.get_gender("Smith"))
+
+
+if __name__ == "__main__":
+    unittest.main()
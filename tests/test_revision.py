@@ -0,0 +1,205 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+Tests of the checks made by Citron.extract_revision before the results of a
+previous revision are reused, and that the results of a revision match those
+of processing it in full.
+"""
+
+import re
+import unittest
+from unittest import mock
+
+import spacy
+from spacy.tokens import Span
+
+from citron.citron import Citron, STAGES, get_stages
+from citron.coreference import needs_coreference
+from citron.data import Quote
+
+SOURCE = {"application": "citron-extractor", "model:": "2021-11-15"}
+TEXT = "\"We are delighted,\" said John Smith.\n\nThe club confirmed the deal."
+PREVIOUS_TEXT = "\"We are delighted,\" said John Smith.\n\nThe club denied the deal."
+
+
+class RevisionReused(Exception):
+    """
+    Raised in place of comparing the revisions, when the previous results are accepted.
+    """
+
+
+class ExtractRevisionTest(unittest.TestCase):
+
+    def setUp(self):
+        # The models are not needed to check the previous results.
+        self.citron = Citron.__new__(Citron)
+        self.citron.source = SOURCE
+        self.citron.nlp = None
+        self.full_results = {"quotes": [], "source": SOURCE}
+        self.citron.extract = mock.Mock(return_value=self.full_results)
+
+        patcher = mock.patch("citron.citron.revision.Revision", side_effect=RevisionReused)
+        self.revision = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch("citron.citron.revision.PreviousRevision")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+    def test_complete_results_are_reused(self):
+        previous_results = {"quotes": [], "source": SOURCE, "entities": []}
+
+        with self.assertRaises(RevisionReused):
+            self.citron.extract_revision(TEXT, PREVIOUS_TEXT, previous_results)
+
+        self.citron.extract.assert_not_called()
+
+
+    def test_partial_results_are_not_reused(self):
+        previous_results = {
+            "quotes": [],
+            "source": SOURCE,
+            "partial": True,
+            "skipped_stages": ["coreference"],
+            "entities": [],
+        }
+
+        results = self.citron.extract_revision(TEXT, PREVIOUS_TEXT, previous_results)
+
+        self.assertIs(results, self.full_results)
+        self.citron.extract.assert_called_once_with(TEXT, stages=get_stages(), include_stats=False, deadline=None)
+        self.revision.assert_not_called()
+
+
+    def test_results_of_fewer_stages_are_not_reused(self):
+        previous_results = {
+            "quotes": [],
+            "source": SOURCE,
+            "stages": ["contents", "cues", "entities", "sources"],
+            "entities": [],
+        }
+
+        results = self.citron.extract_revision(TEXT, PREVIOUS_TEXT, previous_results)
+
+        self.assertIs(results, self.full_results)
+        self.citron.extract.assert_called_once_with(TEXT, stages=frozenset(STAGES), include_stats=False, deadline=None)
+        self.revision.assert_not_called()
+
+
+    def test_results_of_the_same_stages_are_reused(self):
+        stages = ["contents", "cues"]
+        previous_results = {"quotes": [], "source": SOURCE, "stages": stages}
+
+        with self.assertRaises(RevisionReused):
+            self.citron.extract_revision(TEXT, PREVIOUS_TEXT, previous_results, stages=stages)
+
+        self.citron.extract.assert_not_called()
+
+
+QUOTE_PATTERN = re.compile(r'"([^"]+)," (said) ([A-Z][\w ]*)\.')
+FILLER = "The weather was {0} all week."
+WEATHER = ["wet", "dry", "cold", "warm", "grey", "fine", "mild"]
+
+
+def get_quotes(doc, stages=None, profile=None, deadline=None):
+    """
+    Find the quotes of the form: "Content," said Source. A source which needs
+    coreference is resolved to the nearest preceding name with the same surname.
+    """
+
+    quotes = []
+
+    for match in QUOTE_PATTERN.finditer(doc.text):
+        content, cue, source = (doc.char_span(*match.span(group)) for group in (1, 2, 3))
+        coreferences = []
+
+        if needs_coreference(source):
+            names = [ee for ee in doc.ents if ee.end <= source.start and len(ee) > 1 and ee[-1].text == source[-1].text]
+
+            if len(names) > 0:
+                coreferences.append(names[-1])
+
+        quotes.append(Quote(cue, [source], [content], coreferences))
+
+    return quotes
+
+
+def get_text(*paragraphs):
+    """
+    Get a document of seven paragraphs, with filler replaced by the given paragraphs.
+    """
+
+    return "\n".join(paragraphs[i] if i < len(paragraphs) and paragraphs[i] is not None else FILLER.format(WEATHER[i])
+                     for i in range(len(WEATHER)))
+
+
+class RevisionMatchesFullExtractionTest(unittest.TestCase):
+
+    def setUp(self):
+        Span.set_extension("to_json", method=lambda span: {"start": span.start, "end": span.end, "text": span.text}, force=True)
+        nlp = spacy.blank("en")
+        ruler = nlp.add_pipe("entity_ruler")
+        ruler.add_patterns([
+            {"label": "PERSON", "pattern": "John Smith"},
+            {"label": "PERSON", "pattern": "Jane Smith"},
+            {"label": "PERSON", "pattern": "Smith"},
+            {"label": "ORG", "pattern": "BBC News"},
+            {"label": "ORG", "pattern": "BBC"},
+        ])
+        self.citron = Citron.__new__(Citron)
+        self.citron.source = SOURCE
+        self.citron.nlp = nlp
+        self.citron.cache = None
+        self.citron.hooks = []
+        self.citron.get_quotes = get_quotes
+
+
+    def assert_revision_matches(self, previous_text, text):
+        previous_results = self.citron.extract(previous_text)
+        counts = {}
+
+        results = self.citron.extract_revision(text, previous_text, previous_results, counts=counts)
+
+        self.assertEqual(results, self.citron.extract(text))
+        return counts
+
+
+    def test_unchanged_quotes_are_reused(self):
+        previous_text = get_text("John Smith arrived.", None, '"It is good," said John Smith.')
+        text = get_text("John Smith arrived.", None, '"It is good," said John Smith.', None, None, "It rained.")
+
+        counts = self.assert_revision_matches(previous_text, text)
+
+        self.assertLess(counts["paragraphs_reprocessed"], counts["paragraphs"])
+
+
+    def test_distant_antecedent_is_resolved(self):
+        previous_text = get_text("John Smith arrived.", None, None, None, '"It is good," said Smith.')
+        text = get_text("John Smith arrived.", None, None, None, '"It is great," said Smith.')
+
+        self.assert_revision_matches(previous_text, text)
+
+
+    def test_closer_antecedent_is_resolved(self):
+        previous_text = get_text("John Smith arrived.", None, None, None, None, '"It is good," said Smith.')
+        text = get_text("John Smith arrived.", None, "Jane Smith left.", None, None, '"It is good," said Smith.')
+
+        results = self.citron.extract_revision(text, previous_text, self.citron.extract(previous_text))
+
+        self.assertEqual(results, self.citron.extract(text))
+        self.assertEqual(results["quotes"][0]["sources"][0]["text"], "Jane Smith")
+
+
+    def test_omitted_entities_are_restored(self):
+        previous_text = get_text("BBC News reported the deal.", None, None, None, "The BBC said nothing.")
+        text = get_text("A paper reported the deal.", None, None, None, "The BBC said nothing.")
+
+        self.assert_revision_matches(previous_text, text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+Tests of the lanes and priorities of citron.scheduler.Scheduler.
+"""
+
+import threading
+import unittest
+
+from citron.scheduler import HIGH, LOW, NORMAL, Scheduler, get_priority
+
+
+class GetPriorityTest(unittest.TestCase):
+
+    def test_names_are_recognised(self):
+        self.assertEqual(get_priority(" High "), HIGH)
+        self.assertEqual(get_priority("low"), LOW)
+        self.assertEqual(get_priority(None, default=LOW), LOW)
+
+
+    def test_unknown_name_is_rejected(self):
+        with self.assertRaises(ValueError):
+            get_priority("urgent")
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.order = []
+
+
+    def get_scheduler(self, short_workers, long_workers):
+        scheduler = Scheduler(short_workers=short_workers, long_workers=long_workers, short_cost=100)
+        self.addCleanup(scheduler.shutdown)
+        return scheduler
+
+
+    def block(self, scheduler, cost):
+        """
+        Occupy a worker until the release event is set.
+        """
+
+        started = threading.Event()
+
+        def wait():
+            started.set()
+            self.release.wait(5)
+
+        future = scheduler.submit(wait, cost=cost)
+        started.wait(5)
+        return future
+
+
+    def test_tasks_are_run_by_priority_then_arrival(self):
+        scheduler = self.get_scheduler(1, 0)
+        self.block(scheduler, 0)
+        futures = [
+            scheduler.submit(self.order.append, name, priority=priority)
+            for name, priority in (("low", LOW), ("normal 1", NORMAL), ("high", HIGH), ("normal 2", NORMAL))
+        ]
+
+        self.release.set()
+
+        for future in futures:
+            future.result(5)
+
+        self.assertEqual(self.order, ["high", "normal 1", "normal 2", "low"])
+
+
+    def test_long_worker_runs_short_tasks(self):
+        scheduler = self.get_scheduler(0, 1)
+
+        self.assertEqual(scheduler.submit(len, "short", cost=5).result(5), 5)
+
+
+    def test_short_worker_does_not_run_long_tasks(self):
+        scheduler = self.get_scheduler(1, 0)
+
+        future = scheduler.submit(len, "long", cost=1000)
+
+        self.assertEqual(scheduler.submit(len, "short", cost=5).result(5), 5)
+        self.assertFalse(future.done())
+        self.assertEqual(scheduler.get_stats()["long"]["queued"], 1)
+
+
+    def test_long_worker_prefers_long_tasks(self):
+        scheduler = self.get_scheduler(0, 1)
+        self.block(scheduler, 1000)
+        short = scheduler.submit(self.order.append, "short", cost=5, priority=HIGH)
+        long = scheduler.submit(self.order.append, "long", cost=1000, priority=LOW)
+
+        self.release.set()
+        short.result(5)
+        long.result(5)
+
+        self.assertEqual(self.order, ["long", "short"])
+
+
+    def test_exception_is_set_on_the_future(self):
+        scheduler = self.get_scheduler(1, 1)
+
+        with self.assertRaises(ZeroDivisionError):
+            scheduler.submit(lambda: 1 / 0).result(5)
+
+
+    def test_queued_tasks_are_cancelled_on_shutdown(self):
+        scheduler = self.get_scheduler(1, 0)
+        self.block(scheduler, 0)
+        future = scheduler.submit(len, "queued")
+
+        scheduler.shutdown()
+
+        self.assertTrue(future.cancelled())
+
+        with self.assertRaises(RuntimeError):
+            scheduler.submit(len, "late")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+# Copyright 2021 BBC
+# Authors: Chris Newell <chris.newell@bbc.co.uk>
+#
+# License: Apache-2.0
+
+"""
+Tests of the MinHash index of citron.similarity and of the reuse of the results
+of near-duplicates.
+"""
+
+import random
+import unittest
+from unittest import mock
+
+import spacy
+
+from citron.similarity import MinHashIndex, NearDuplicateExtractor, get_shingles, sample_shingles
+
+SOURCE = {"application": "citron-extractor", "model:": "2021-11-15"}
+
+
+def get_text(generator, words):
+    return " ".join("word{0}".format(generator.randint(0, 100000)) for _ in range(words))
+
+
+class SampleShinglesTest(unittest.TestCase):
+
+    def test_few_shingles_are_not_sampled(self):
+        shingles = set(range(100))
+
+        self.assertIs(sample_shingles(shingles, 100), shingles)
+
+
+    def test_sample_is_bounded(self):
+        generator = random.Random(1)
+        shingles = {generator.getrandbits(32) for _ in range(10000)}
+
+        sample = sample_shingles(shingles, 1000)
+
+        self.assertLessEqual(len(sample), 1500)
+        self.assertTrue(set(sample) <= shingles)
+
+
+    def test_shared_shingles_are_sampled_consistently(self):
+        generator = random.Random(1)
+        shared = {generator.getrandbits(32) for _ in range(9000)}
+        first = shared | {generator.getrandbits(32) for _ in range(1000)}
+        second = shared | {generator.getrandbits(32) for _ in range(1000)}
+
+        first_sample = set(sample_shingles(first, 1000))
+        second_sample = set(sample_shingles(second, 1000))
+
+        self.assertEqual(first_sample & shared, second_sample & shared)
+
+
+class MinHashIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        generator = random.Random(1)
+        self.text = get_text(generator, 400)
+        # About a tenth of the words changed.
+        words = self.text.split(" ")
+        for i in range(0, len(words), 40):
+            words[i] = "changed{0}".format(i)
+        self.near_duplicate = " ".join(words)
+        self.unrelated = get_text(generator, 400)
+        self.index = MinHashIndex(max_documents=2)
+
+
+    def test_identical_text_is_found(self):
+        signature = self.index.get_signature(self.text)
+        self.index.add("a", signature, "a")
+
+        self.assertEqual(self.index.query(signature, 0.8), ("a", 1.0))
+
+
+    def test_near_duplicate_is_found(self):
+        self.index.add("a", self.index.get_signature(self.text), "a")
+        self.index.add("b", self.index.get_signature(self.unrelated), "b")
+
+        value, similarity = self.index.query(self.index.get_signature(self.near_duplicate), 0.5)
+
+        self.assertEqual(value, "a")
+        self.assertLess(similarity, 1.0)
+
+
+    def test_documents_without_a_shared_band_are_not_candidates(self):
+        self.index.add("b", self.index.get_signature(self.unrelated), "b")
+
+        self.assertIsNone(self.index.query(self.index.get_signature(self.text), 0.0))
+
+
+    def test_predicate_excludes_documents(self):
+        signature = self.index.get_signature(self.text)
+        self.index.add("a", signature, "a")
+
+        self.assertIsNone(self.index.query(signature, 0.8, lambda value: value != "a"))
+
+
+    def test_oldest_document_is_evicted(self):
+        signature = self.index.get_signature(self.text)
+        self.index.add("a", signature, "a")
+        self.index.add("b", self.index.get_signature(self.unrelated), "b")
+        self.index.add("c", self.index.get_signature(self.near_duplicate), "c")
+
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.query(signature, 0.5)[0], "c")
+        self.assertFalse(any("a" in keys for keys in self.index._buckets.values()))
+
+
+    def test_short_text_has_one_shingle(self):
+        self.assertEqual(len(get_shingles("Too short", 5)), 1)
+
+
+class NearDuplicateExtractorTest(unittest.TestCase):
+
+    def setUp(self):
+        generator = random.Random(1)
+        self.text = get_text(generator, 200) + "\n\n" + get_text(generator, 200)
+        self.revised = self.text + " extra"
+        self.citron = mock.Mock()
+        self.citron.source = SOURCE
+        self.citron.nlp = spacy.blank("en")
+        self.citron.get_cached_results.return_value = None
+        self.citron.extract.side_effect = lambda text, **kwargs: {"quotes": [], "source": SOURCE}
+
+        def extract_revision(text, previous, previous_results, counts=None, **kwargs):
+            counts.update({"paragraphs": 2, "paragraphs_reprocessed": 1})
+            return {"quotes": [], "source": SOURCE}
+
+        self.citron.extract_revision.side_effect = extract_revision
+        self.extractor = NearDuplicateExtractor(MinHashIndex(), threshold=0.5)
+
+
+    def test_near_duplicate_results_are_reused(self):
+        self.extractor.extract(self.citron, self.text)
+        self.extractor.extract(self.citron, self.revised)
+
+        self.citron.extract.assert_called_once()
+        self.citron.extract_revision.assert_called_once()
+        self.assertEqual(self.extractor.get_stats()["near_duplicates"], 1)
+        self.assertEqual(self.extractor.get_stats()["paragraph_reuse_rate"], 0.5)
+
+
+    def test_results_of_another_model_are_not_reused(self):
+        self.extractor.extract(self.citron, self.text)
+        self.citron.source = {"application": "citron-extractor", "model:": "2022-03-01"}
+        self.extractor.extract(self.citron, self.revised)
+
+        self.assertEqual(self.citron.extract.call_count, 2)
+        self.citron.extract_revision.assert_not_called()
+
+
+    def test_deadline_is_passed_on(self):
+        deadline = mock.Mock()
+        deadline.remaining.return_value = None
+        self.extractor.extract(self.citron, self.text)
+        self.extractor.extract(self.citron, self.revised, deadline=deadline)
+
+        self.assertIs(self.citron.extract_revision.call_args.kwargs["deadline"], deadline)
+
+
+if __name__ == "__main__":
+    unittest.main()